@@ -2,34 +2,28 @@
 import math
 import os
 import re
-from mock_data import get_customer_by_phone, create_new_customer, extract_salary_from_slip, INTEREST_RATE
-
-# ----------------------- CONSTANTS -----------------------
-# Use centralized interest rate from mock_data
-ANNUAL_INTEREST_RATE = INTEREST_RATE  # 12% p.a. (standardized)
+import itertools
+from bisect import bisect_right
+from mock_data import get_customer_by_phone, create_new_customer, extract_salary_from_slip
+from credit_bureau import credit_bureau
+from document_registry import document_registry
+from rule_engine import underwriting_rules
+from static_content import static_content
+from telemetry import get_logger
 
+log = get_logger("agents")
 
 # ----------------------- HELPERS -----------------------
 
 def check_salary_slip_exists(phone: str) -> bool:
-    """Check if salary slip PDF exists."""
-    if not phone:
-        return False
-    path = f"uploads/{phone}_salary_slip.pdf"
-    abs_path = os.path.abspath(path)
-    exists = os.path.exists(abs_path)
-    print(f"[DEBUG] check_salary_slip_exists: looking for {abs_path} -> {exists}")
-    return exists
+    """Check if a salary slip was uploaded (document registry lookup, no disk access)."""
+    return document_registry.has_slip(phone)
 
 
 
 def fetch_general_offers():
-    return [
-        "🌟 **Diwali Bonanza:** Zero Processing Fee on personal loans.",
-        "📉 **Auto-Pay Special:** 0.5% interest rate discount with Auto-Debit.",
-        "⚡ **Express Loan:** Instant approval — disbursal in 10 minutes.",
-        "💳 **Festive Offer:** Get additional ₹50,000 credit limit on timely repayment."
-    ]
+    # "offers" in static_content.json (hot reloaded); shared list, do not mutate
+    return static_content.data("offers")
 
 
 def calculate_emi(principal, rate_annual, tenure_months):
@@ -75,7 +69,7 @@ def verification_agent(phone):
             "city": user["city"],
             "address": user.get("address", "Address not on file"),
             "limit": user["pre_approved_limit"],
-            "credit_score": user["credit_score"]
+            "credit_score": credit_bureau.score(phone, user["credit_score"])
         }
     return {"status": "FAILED"}
 
@@ -94,11 +88,90 @@ def register_agent(phone, name, city, address=None):
     }
 
 
+# ----------------------- PRICING -----------------------
+# Risk-based rate = base interest_rate + credit-score band + amount band +
+# tenure band spreads ("pricing" in underwriting_rules.json). PricingGrid
+# precomputes every combination into one flat table; a quote is two array
+# lookups (score, tenure), one bisect (amount) and one index. The rule engine
+# builds a new grid whenever it loads the file; underwriting (rate_for), the
+# offer table, the loan cards and the sanction letter all quote from it.
+
+SCORE_MAX = 900            # scores above this share the top band's index
+QUOTE_MAX_TENURE = 120     # tenures above this share the last band's index
+_GRID_GENERATION = itertools.count(1)
+
+
+def _clean_rate(rate):
+    rate = round(rate, 2)
+    return int(rate) if rate == int(rate) else rate   # 12, not 12.0, on cards and letters
+
+
+class PricingGrid:
+    def __init__(self, spec, base_rate, generation=None):
+        self.spec = spec = spec or {}
+        bands = []
+        for dim in ("credit_score", "amount", "tenure"):
+            band = spec.get(dim) or {"from": [0], "spread": [0]}
+            edges, spread = list(band["from"]), list(band["spread"])
+            if not edges or len(edges) != len(spread) or edges != sorted(set(edges)):
+                raise ValueError(f"pricing.{dim}: 'from' must be increasing, one 'spread' per band")
+            bands.append((edges, spread))
+        (score_edges, score_spread), (amount_edges, amount_spread), (tenure_edges, tenure_spread) = bands
+        if amount_edges[0] != 0:
+            raise ValueError("pricing.amount: the first band must start at 0")
+        if amount_spread != sorted(amount_spread):
+            # underwriting's fallback offer is always smaller, so it can never price higher
+            raise ValueError("pricing.amount: spreads must not fall as the amount grows")
+
+        self.generation = generation or next(_GRID_GENERATION)   # offer records remember the grid they were priced on
+        self.base_rate = base_rate
+        self.rates = [_clean_rate(base_rate + s + a + t)
+                      for s in score_spread for a in amount_spread for t in tenure_spread]
+        self.size = len(self.rates)
+        # strides folded into the band indexes: one add per dimension, no multiply
+        amount_stride = len(tenure_edges)
+        score_stride = len(amount_edges) * amount_stride
+        score_index = [max(bisect_right(score_edges, v) - 1, 0) * score_stride for v in range(SCORE_MAX + 1)]
+        tenure_index = [max(bisect_right(tenure_edges, v) - 1, 0) for v in range(QUOTE_MAX_TENURE + 1)]
+
+        def rate(credit_score, amount, tenure, rates=self.rates, score_index=score_index,
+                 tenure_index=tenure_index, amount_edges=tuple(amount_edges), amount_stride=amount_stride):
+            """Annual rate (% p.a.) for this score, amount and tenure (months)."""
+            return rates[score_index[credit_score if credit_score < SCORE_MAX else SCORE_MAX]
+                         + (bisect_right(amount_edges, amount) - 1) * amount_stride
+                         + tenure_index[tenure if tenure < QUOTE_MAX_TENURE else QUOTE_MAX_TENURE]]
+
+        self.rate = rate
+
+    def __reduce__(self):
+        # rate() is a closure: ship the inputs (offer_table's rebuild pool rebuilds the grid per chunk)
+        return PricingGrid, (self.spec, self.base_rate, self.generation)
+
+
+def _build_pricing(spec):
+    grid = PricingGrid(spec.get("pricing"), spec["params"]["interest_rate"])
+    log.info("pricing.built", cells=grid.size, generation=grid.generation, version=spec.get("version"))
+    return grid
+
+
+underwriting_rules.set_pricing(_build_pricing)
+
+
+def pricing_grid():
+    """The grid for the rule file in force."""
+    return underwriting_rules.current_pricing()
+
+
+def quote_rate(credit_score, amount, tenure_months):
+    """Risk-based annual rate for a loan of amount over tenure_months."""
+    return underwriting_rules.current_pricing().rate(credit_score, amount, tenure_months)
+
+
 # ----------------------- UNDERWRITING -----------------------
 
 def underwriting_agent(phone, loan_amount,monthly_salary, tenure_months=12):
     """
-    Enhanced Underwriting Rules:
+    Underwriting rules (as shipped in underwriting_rules.json):
     ✔ If credit_score < 700 → HARD_REJECT
     ✔ If amount <= limit → APPROVE instantly
     ✔ If limit < amount <= 2*limit → NEED SALARY SLIP
@@ -112,74 +185,11 @@ def underwriting_agent(phone, loan_amount,monthly_salary, tenure_months=12):
     if not user:
         return {"status": "ERROR", "reason": "Customer not found"}
 
-    limit = user["pre_approved_limit"]
-    score = user["credit_score"]
-
-    # 1. Score based rejection
-    if score < 700:
-        return {
-            "status": "HARD_REJECT", 
-            "reason": f"Low credit score ({score}). We need a minimum score of 700 for loan approval."
-        }
-
-    # 2. Above double the limit → soft reject
-    if loan_amount > 2 * limit:
-        return {
-            "status": "SOFT_REJECT",
-            "fallback_offer": limit,
-            "reason": "Requested amount exceeds 2x your eligibility limit",
-            "persuasion": f"I understand you need ₹{loan_amount}, but based on your profile, I can offer you ₹{limit} instantly. This can still help with your immediate needs, and we can increase your limit after 6 months of good repayment!"
-        }
-
-    # 3. Instant approval path (within pre-approved limit)
-    if loan_amount <= limit:
-        emi = calculate_emi(loan_amount, ANNUAL_INTEREST_RATE, tenure_months)
-        return {
-            "status": "APPROVED",
-            "new_emi": emi,
-            "interest_rate": ANNUAL_INTEREST_RATE,
-            "details": "Approved within pre-approved limit"
-        }
-
-    # 4. Over limit but within 2x → need salary slip
-    if monthly_salary == None:
-        return {
-            "status": "NEEDS_DOCS", 
-            "reason": "Upload salary slip for income verification",
-            "message": "Since you're requesting above your instant limit, I'll need to verify your income. Please upload your latest salary slip."
-        }
-
-    # 5. Salary slip uploaded → Apply EMI ≤ 50% of salary rule
-    emi = calculate_emi(loan_amount, ANNUAL_INTEREST_RATE, tenure_months)
-    max_allowed_emi = monthly_salary * 0.5  # 50% of salary rule
-    
-    if emi <= max_allowed_emi:
-        # EMI is within 50% of salary → APPROVE
-        return {
-            "status": "APPROVED",
-            "new_emi": emi,
-            "interest_rate": ANNUAL_INTEREST_RATE,
-            "salary_verified": monthly_salary,
-            "details": f"Approved after income verification. Your salary of ₹{monthly_salary} supports this EMI."
-        }
-    else:
-        # EMI exceeds 50% of salary → Calculate max affordable amount
-        # Reverse calculate: What amount gives EMI = 50% of salary?
-        max_emi = max_allowed_emi
-        r = ANNUAL_INTEREST_RATE / 1200
-        if r > 0:
-            max_affordable_amount = int(max_emi * ((1 + r) ** tenure_months - 1) / (r * (1 + r) ** tenure_months))
-        else:
-            max_affordable_amount = int(max_emi * tenure_months)
-        
-        # Ensure we don't offer more than 2x limit
-        max_affordable_amount = min(max_affordable_amount, 2 * limit)
-        
-        return {
-            "status": "SOFT_REJECT",
-            "fallback_offer": max_affordable_amount,
-            "reason": f"EMI (₹{emi}) exceeds 50% of your verified salary (₹{monthly_salary})",
-            "salary_verified": monthly_salary,
-            "max_emi_allowed": max_allowed_emi,
-            "persuasion": f"Based on your salary of ₹{monthly_salary}, I can approve up to ₹{max_affordable_amount} to keep your EMI manageable at ₹{calculate_emi(max_affordable_amount, ANNUAL_INTEREST_RATE, tenure_months)}. This ensures comfortable repayment!"
-        }
+    # Thresholds, messages and pricing live in underwriting_rules.json (rule_engine.py)
+    return underwriting_rules.evaluate({
+        "credit_score": credit_bureau.score(phone, user["credit_score"]),   # cached since verification
+        "limit": user["pre_approved_limit"],
+        "amount": loan_amount,
+        "salary": monthly_salary,
+        "tenure": tenure_months,
+    })
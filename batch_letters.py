@@ -0,0 +1,230 @@
+# batch_letters.py
+# Bulk sanction-letter rendering for campaign approvals.
+#
+#   python batch_letters.py approvals.csv --workers 8
+#   python batch_letters.py approvals.jsonl --version 2025q3 --out-dir static_pdfs/campaign
+#   python batch_letters.py --demo 20000 --workers 8          # synthetic approvals from customers.json
+#   python batch_letters.py --demo 2000 --mode full           # compare against per-letter layout
+#
+# Each approval needs name, phone, amount and tenure (months), and either the
+# approved "rate" or the customer's "credit_score", which is priced through the
+# same risk-based grid as the chat (agents.quote_rate); a row with neither is
+# rejected into the manifest. emi is calculated at that rate when missing, and
+# an optional "version" column overrides the batch version for that row. Letters are written as
+# <out-dir>/<phone>_sanction_<version>.pdf, so a re-issue never overwrites the
+# letter a customer already has, and a manifest (one JSON line per letter)
+# is written next to them.
+#
+# Every worker process loads the logo and lays out the letter once
+# (pdf_generator.SanctionLetterTemplate); per letter only the name, phone,
+# amounts and dates are written into a copy of that template.
+import argparse
+import csv
+import itertools
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+
+from bench_utils import percentile
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# ----------------------------------------------------------
+# Reading approvals
+# ----------------------------------------------------------
+def read_approvals(path):
+    """Yield approval dicts from a .csv (header row) or .jsonl file."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def demo_approvals(n, customers_path=os.path.join(REPO_DIR, "customers.json")):
+    """n synthetic approvals cycling through customers.json (unique phones)."""
+    with open(customers_path, encoding="utf-8") as f:
+        customers = json.load(f)
+    for i, c in zip(range(n), itertools.cycle(customers)):
+        yield {
+            "name": c["name"],
+            "phone": f"6{i:09d}",
+            "amount": min(c.get("pre_approved_limit", 200000), 100000 + (i % 40) * 10000),
+            "tenure": (12, 24, 36, 48, 60)[i % 5],
+            "credit_score": c["credit_score"],
+        }
+
+
+def _normalize(approval, version):
+    from agents import calculate_emi, quote_rate
+
+    amount = int(float(approval["amount"]))
+    tenure = int(approval.get("tenure") or 12)
+    rate, score = approval.get("rate"), approval.get("credit_score")
+    if rate not in (None, ""):
+        rate = float(rate)
+    elif score not in (None, ""):
+        rate = quote_rate(int(float(score)), amount, tenure)
+    else:
+        raise ValueError("approval needs a rate or a credit_score")
+    rate = int(rate) if rate == int(rate) else rate
+    emi = approval.get("emi")
+    emi = float(emi) if emi not in (None, "") else calculate_emi(amount, rate, tenure)
+    return {
+        "name": approval["name"],
+        "phone": str(approval["phone"]),
+        "amount": amount,
+        "emi": emi,
+        "tenure": tenure,
+        "rate": rate,
+        "version": str(approval.get("version") or version),
+    }
+
+
+def _chunks(items, size):
+    it = iter(items)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# ----------------------------------------------------------
+# Worker
+# ----------------------------------------------------------
+_TEMPLATE = None
+_LOGO = None
+_MODE = None
+
+
+def _init_worker(mode):
+    global _TEMPLATE, _LOGO, _MODE
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    from pdf_generator import LOGO_PATH, SanctionLetterTemplate, load_logo
+
+    _MODE = mode
+    _LOGO = load_logo(os.path.join(REPO_DIR, LOGO_PATH))
+    if mode == "template":
+        _TEMPLATE = SanctionLetterTemplate(logo=_LOGO)
+
+
+def render_chunk(chunk, out_dir, now):
+    """Render a list of approvals; returns one result dict per approval (errors included, never raised)."""
+    from pdf_generator import create_sanction_letter
+
+    results = []
+    for approval in chunk:
+        t0 = time.perf_counter()
+        result = {"phone": approval.get("phone"), "file": None, "error": None}
+        try:
+            a = _normalize(approval, now.strftime("%Y%m%d%H%M%S"))
+            path = os.path.join(out_dir, f"{a['phone']}_sanction_{a['version']}.pdf")
+            args = (a["name"], a["phone"], a["amount"], a["emi"], a["tenure"])
+            if _MODE == "template":
+                _TEMPLATE.render(path, *args, now=now, rate=a["rate"])
+            else:
+                create_sanction_letter(*args, logo=_LOGO, filename=path, now=now, rate=a["rate"])
+            result["file"] = path
+        except Exception as e:
+            result["error"] = repr(e)
+        result["render_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+        results.append(result)
+    return results
+
+
+# ----------------------------------------------------------
+# Batch
+# ----------------------------------------------------------
+def render_batch(approvals, out_dir="static_pdfs", version=None, workers=os.cpu_count() or 1,
+                 chunk_size=50, mode="template"):
+    """
+    Render an iterable of approvals across `workers` processes (0 = in-process).
+    Yields per-letter result dicts as chunks finish; at most 2*workers chunks
+    are in flight, so the iterable is never materialized.
+    """
+    out_dir = os.path.abspath(out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    now = datetime.now()
+    if version:
+        # the batch version becomes the default filename suffix for every row
+        approvals = ({**a, "version": a.get("version") or version} for a in approvals)
+    chunks = _chunks(approvals, chunk_size)
+
+    if workers <= 0:
+        _init_worker(mode)
+        for chunk in chunks:
+            yield from render_chunk(chunk, out_dir, now)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(mode,)) as pool:
+        pending = set()
+        for chunk in chunks:
+            pending.add(pool.submit(render_chunk, chunk, out_dir, now))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for f in done:
+                    yield from f.result()
+        for f in pending:
+            yield from f.result()
+
+
+def summarize(results, wall):
+    ok = [r for r in results if not r["error"]]
+    ms = [r["render_ms"] for r in ok]
+    return {
+        "letters": len(ok),
+        "errors": len(results) - len(ok),
+        "wall_s": round(wall, 2),
+        "letters_per_s": round(len(ok) / wall, 1) if wall else 0.0,
+        "render_p50_ms": round(percentile(ms, 50), 2),
+        "render_p95_ms": round(percentile(ms, 95), 2),
+        "render_mean_ms": round(statistics.mean(ms), 2) if ms else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render sanction letters in bulk")
+    parser.add_argument("input", nargs="?", help="approvals .csv or .jsonl (name, phone, amount, tenure[, emi, version])")
+    parser.add_argument("--demo", type=int, help="render N synthetic approvals instead of reading a file")
+    parser.add_argument("--out-dir", default="static_pdfs")
+    parser.add_argument("--version", help="filename version suffix (default: batch timestamp)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes (0 = in-process)")
+    parser.add_argument("--chunk-size", type=int, default=50, help="letters per worker task")
+    parser.add_argument("--mode", choices=["template", "full"], default="template",
+                        help="template: prebuilt layout per worker; full: lay out every letter")
+    parser.add_argument("--manifest", help="manifest path (default: <out-dir>/manifest_<version>.jsonl)")
+    args = parser.parse_args()
+
+    if bool(args.input) == bool(args.demo):
+        parser.error("give either an approvals file or --demo N")
+    approvals = demo_approvals(args.demo) if args.demo else read_approvals(args.input)
+    version = args.version or datetime.now().strftime("%Y%m%d%H%M%S")
+    manifest = args.manifest or os.path.join(args.out_dir, f"manifest_{version}.jsonl")
+    os.makedirs(os.path.dirname(os.path.abspath(manifest)), exist_ok=True)
+
+    results = []
+    t0 = time.perf_counter()
+    with open(manifest, "w", encoding="utf-8") as f:
+        for r in render_batch(approvals, args.out_dir, version, args.workers, args.chunk_size, args.mode):
+            results.append(r)
+            f.write(json.dumps(r) + "\n")
+    wall = time.perf_counter() - t0
+
+    s = summarize(results, wall)
+    print(f"rendered {s['letters']} letters ({s['errors']} errors) in {s['wall_s']}s "
+          f"-> {s['letters_per_s']} letters/s [{args.mode}, {args.workers} workers]")
+    print(f"per letter: p50 {s['render_p50_ms']}ms p95 {s['render_p95_ms']}ms mean {s['render_mean_ms']}ms")
+    print(f"manifest -> {manifest}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# bench_async.py
+# Sync vs async graph execution with a stub LLM, N concurrent sessions, one process.
+#
+#   python bench_async.py --sessions 1000 --latency 0.5
+#
+# sync  : GraphExecutor.invoke on a thread pool (how a def-endpoint runs under FastAPI)
+# async : GraphExecutor.ainvoke on the event loop (async_app_graph)
+#
+# Runs in a throwaway working directory (bench_utils.prepare_workdir), so letters
+# and other files the turns write never land in the repo. The llm resource limit
+# (LLM_CONCURRENCY) is raised to --llm-concurrency, by default one slot per
+# session, so the comparison measures threads vs. the event loop rather than
+# slot queueing; calls shed for lack of a slot are reported next to the
+# throughput either way. Turns go straight to GraphExecutor, not through the
+# turn scheduler, so nothing here is ever answered with a 429.
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from bench_utils import REPO_DIR, percentile, prepare_workdir
+
+# small talk (LLM) -> verify known customer -> amount + purpose
+JOURNEY = [
+    "tell me a bit about your bank please",
+    "9999999991",
+    "2 lakh for wedding",
+]
+
+
+def _shed_calls():
+    """LLM calls refused without reaching the model: no slot in time, or the breaker open."""
+    from llm_gateway import GATEWAYS
+    return sum(gw.counts["shed"] + gw.counts["short_circuited"] for gw in GATEWAYS.values())
+
+
+async def _run_session(idx, mode, pool, latencies, executor):
+    loop = asyncio.get_running_loop()
+    session_id = f"bench-{mode}-{idx}"
+    history = []
+    for text in JOURNEY:
+        payload = {"input": text, "chat_history": list(history), "session_id": session_id, "tenure": 12}
+        t0 = time.perf_counter()
+        if mode == "async":
+            out = await executor.ainvoke(payload)
+        else:
+            out = await loop.run_in_executor(pool, executor.invoke, payload)
+        latencies.append(time.perf_counter() - t0)
+        history += [HumanMessage(content=text), AIMessage(content=out["output"])]
+
+
+async def run(mode, sessions, threads):
+    import master_agent   # after main() has set the working directory and LLM_CONCURRENCY
+
+    latencies = []
+    pool = ThreadPoolExecutor(max_workers=threads) if mode == "sync" else None
+    shed_before = _shed_calls()
+    t0 = time.perf_counter()
+    executor = master_agent.agent_executor
+    await asyncio.gather(*(_run_session(i, mode, pool, latencies, executor) for i in range(sessions)))
+    wall = time.perf_counter() - t0
+    if pool:
+        pool.shutdown()
+    master_agent.SESSION_STORE.clear()
+    return {
+        "mode": mode,
+        "turns": len(latencies),
+        "wall_s": round(wall, 2),
+        "turns_per_s": round(len(latencies) / wall, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 1),
+        "llm_shed": _shed_calls() - shed_before,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync vs async graph execution benchmark (stub LLM)")
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.5, help="stub LLM latency (s)")
+    parser.add_argument("--threads", type=int, default=40, help="sync mode pool size (FastAPI default: 40)")
+    parser.add_argument("--mode", choices=["sync", "async", "both"], default="both")
+    parser.add_argument("--llm-concurrency", type=int, default=0,
+                        help="llm resource slots (0 = one per session; LLM_CONCURRENCY default: 16)")
+    args = parser.parse_args()
+
+    # read when scheduler is imported (by master_agent, below)
+    os.environ["LLM_CONCURRENCY"] = str(args.llm_concurrency or args.sessions)
+    os.environ.setdefault("GOOGLE_API_KEY", "stub")
+    workdir = prepare_workdir("loanbot-bench-")
+    sys.path.insert(0, REPO_DIR)
+    os.chdir(workdir)
+    try:
+        from stub_llm import install_stub_llm
+        install_stub_llm(latency=args.latency)
+        modes = ["sync", "async"] if args.mode == "both" else [args.mode]
+
+        print(f"{args.sessions} sessions x {len(JOURNEY)} turns, stub LLM latency {args.latency}s, "
+              f"{os.environ['LLM_CONCURRENCY']} llm slots")
+        for mode in modes:
+            res = asyncio.run(run(mode, args.sessions, args.threads))
+            print(
+                f"{res['mode']:>5}: {res['turns']} turns in {res['wall_s']}s "
+                f"({res['turns_per_s']} turns/s) | p50 {res['p50_ms']}ms "
+                f"p95 {res['p95_ms']}ms p99 {res['p99_ms']}ms | llm calls shed {res['llm_shed']}"
+            )
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+# bench_utils.py
+# Helpers shared by the offline tools (load_test.py, replay_chats.py,
+# bench_async.py, bench_workers.py, batch_letters.py and the bench commands of
+# credit_bureau.py, ocr_engine.py and payslip_prompt.py).
+#
+# prepare_workdir() makes the throwaway working directory the in-process tools
+# run in: a copy of the seed files and assets/, so chat_history.db / uploads /
+# static_pdfs in the repo are never touched.
+import os
+import shutil
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SEED_FILES = ["customers.json", "intent_model.json", "static_content.json"]
+SEED_DIRS = ["assets"]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of values (0.0 when empty)."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))] if values else 0.0
+
+
+def prepare_workdir(prefix, extra_dirs=()):
+    """Temp directory seeded with SEED_FILES, SEED_DIRS and extra_dirs from the repo."""
+    workdir = tempfile.mkdtemp(prefix=prefix)
+    for name in SEED_FILES:
+        src = os.path.join(REPO_DIR, name)
+        if os.path.exists(src):
+            shutil.copy(src, workdir)
+    for name in SEED_DIRS + list(extra_dirs):
+        src = os.path.join(REPO_DIR, name)
+        if os.path.isdir(src):
+            shutil.copytree(src, os.path.join(workdir, name))
+    return workdir
@@ -0,0 +1,146 @@
+# bench_workers.py
+# Throughput vs gunicorn worker count: the same load_test.py run against
+# gunicorn_conf.py with 1..N workers (STATE_BACKEND=sqlite), Gemini replaced by
+# fake_model_server.py so only our own CPU time limits throughput.
+#
+#   python bench_workers.py                       # 1..cpu_count workers
+#   python bench_workers.py --workers 1,2,4,8 --users 400 --concurrency 64 --out bench/workers.json
+#
+# Each run gets a fresh work directory (customers.json, DB, uploads/, letters).
+# Speedup is req/s relative to the first worker count; efficiency = speedup /
+# (workers / first). It cannot exceed the number of cores on the host.
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench_utils import REPO_DIR, prepare_workdir
+
+
+def _wait_ready(url, proc, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with {proc.returncode}")
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+
+def _stop(proc):
+    if proc.poll() is None:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+def run_one(workers, args, model_url):
+    workdir = prepare_workdir("loanbot-load-")
+    port = args.port + workers
+    env = {
+        **os.environ,
+        "PYTHONPATH": REPO_DIR,
+        "STATE_BACKEND": "sqlite",
+        "WEB_CONCURRENCY": str(workers),
+        "BIND": f"127.0.0.1:{port}",
+        "GEMINI_API_ENDPOINT": model_url,
+        "GOOGLE_API_KEY": "fake",
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+    }
+    out = os.path.join(workdir, "load.json")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", os.path.join(REPO_DIR, "gunicorn_conf.py"), "main:app"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL,
+    )
+    try:
+        t0 = time.perf_counter()
+        _wait_ready(f"http://127.0.0.1:{port}/", server)
+        ready_s = time.perf_counter() - t0
+        subprocess.run(
+            [sys.executable, os.path.join(REPO_DIR, "load_test.py"), "--url", f"http://127.0.0.1:{port}",
+             "--users", str(args.users), "--concurrency", str(args.concurrency),
+             "--warmup", str(args.warmup), "--out", out],
+            check=True, stdout=subprocess.PIPE if not args.verbose else None,
+        )
+        with open(out, encoding="utf-8") as f:
+            res = json.load(f)
+    finally:
+        _stop(server)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "workers": workers,
+        "ready_s": round(ready_s, 2),
+        "requests_per_s": res["requests_per_s"],
+        "p50_ms": res["p50_ms"],
+        "p95_ms": res["p95_ms"],
+        "failures": res["failure_count"],
+    }
+
+
+def main():
+    cores = multiprocessing.cpu_count()
+    parser = argparse.ArgumentParser(description="Throughput scaling across gunicorn worker counts")
+    parser.add_argument("--workers", default=",".join(str(n) for n in range(1, cores + 1)),
+                        help="comma-separated worker counts (default 1..cpu_count)")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake model latency (s)")
+    parser.add_argument("--port", type=int, default=8100, help="server port base (port + workers)")
+    parser.add_argument("--model-port", type=int, default=8091)
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    counts = [int(n) for n in args.workers.split(",")]
+
+    model_url = f"http://127.0.0.1:{args.model_port}"
+    model = subprocess.Popen(
+        [sys.executable, os.path.join(REPO_DIR, "fake_model_server.py"),
+         "--port", str(args.model_port), "--latency", str(args.latency)],
+        cwd=tempfile.gettempdir(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    runs = []
+    try:
+        time.sleep(0.5)
+        for n in counts:
+            runs.append(run_one(n, args, model_url))
+            r = runs[-1]
+            print(f"workers={n}: {r['requests_per_s']} req/s, p95 {r['p95_ms']}ms, failures {r['failures']}",
+                  flush=True)
+    finally:
+        _stop(model)
+
+    base = runs[0]
+    print(f"\n{'workers':>8}{'req/s':>10}{'speedup':>9}{'effic.':>8}{'p50':>9}{'p95':>9}{'fail':>6}{'ready':>8}")
+    for r in runs:
+        r["speedup"] = round(r["requests_per_s"] / base["requests_per_s"], 2) if base["requests_per_s"] else None
+        r["efficiency"] = round(r["speedup"] / (r["workers"] / base["workers"]), 2) if r["speedup"] else None
+        print(f"{r['workers']:>8}{r['requests_per_s']:>10}{r['speedup']:>9}{r['efficiency']:>8}"
+              f"{r['p50_ms']:>9}{r['p95_ms']:>9}{r['failures']:>6}{r['ready_s']:>7}s")
+    print(f"host: {cores} cores, {platform.platform()}")
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"cores": cores, "config": vars(args), "runs": runs}, f, indent=2)
+        print(f"results -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
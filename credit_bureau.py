@@ -0,0 +1,244 @@
+# credit_bureau.py
+# Credit scores from a remote bureau (CREDIT_BUREAU_URL; fake_bureau_server.py
+# stands in for it locally). Unset, there is no bureau: every score() is the
+# caller's default, i.e. the score stored in customers.json.
+#
+# One httpx.AsyncClient (keep-alive connection pool) lives on a private event
+# loop thread, so the sync graph, worker threads and the async graph share it.
+# Per process:
+#   - a report is cached for BUREAU_TTL seconds (a whole conversation), so
+#     verification, pricing and underwriting in later turns make no request
+#   - concurrent lookups of one phone share a single request (coalescing)
+#   - a failed lookup falls back to the caller's default and is not retried
+#     for BUREAU_ERROR_TTL seconds, so a slow bureau costs at most one
+#     timeout per phone, not one per turn
+#
+# The verification stage pulls the report in its "bureau" branch when the
+# phone number arrives (verification_checks.py); everything after that is a
+# cache hit.
+#
+#   python credit_bureau.py bench --lookups 2000 --phones 50 --concurrency 64
+import argparse
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import httpx
+
+from bench_utils import percentile
+from telemetry import counter, get_logger, histogram
+
+CREDIT_BUREAU_URL = os.getenv("CREDIT_BUREAU_URL", "").rstrip("/")
+BUREAU_TIMEOUT = float(os.getenv("BUREAU_TIMEOUT", "2"))
+BUREAU_TTL = float(os.getenv("BUREAU_TTL", "3600"))
+BUREAU_ERROR_TTL = float(os.getenv("BUREAU_ERROR_TTL", "30"))
+BUREAU_MAX_CONNECTIONS = int(os.getenv("BUREAU_MAX_CONNECTIONS", "20"))
+CACHE_MAX = 100000
+
+log = get_logger("credit_bureau")
+REQUEST_SECONDS = histogram("loanbot_bureau_request_seconds", "Credit bureau HTTP request latency")
+LOOKUPS = counter("loanbot_bureau_lookups_total", "Credit score lookups by outcome")
+
+_MISS = object()
+
+
+class CreditBureau:
+    def __init__(self, url=CREDIT_BUREAU_URL, timeout=BUREAU_TIMEOUT, ttl=BUREAU_TTL,
+                 error_ttl=BUREAU_ERROR_TTL, max_connections=BUREAU_MAX_CONNECTIONS):
+        self.url = url
+        self.enabled = bool(url)
+        self.timeout = timeout
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.max_connections = max_connections
+        self._cache = OrderedDict()   # phone -> (expires_at, report or None for a failed lookup)
+        self._inflight = {}           # phone -> Future of the request in flight
+        self._lock = threading.Lock()
+        self._loop = None
+        self._client = None
+
+    # ---------------- event loop + pooled client ----------------
+    def _ensure_loop(self):
+        if self._loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="credit-bureau", daemon=True).start()
+            self._loop = loop
+        return self._loop
+
+    async def _fetch(self, phone):
+        if self._client is None:   # created on the bureau loop, which it is bound to
+            self._client = httpx.AsyncClient(
+                base_url=self.url,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+            )
+        t0 = time.perf_counter()
+        try:
+            resp = await self._client.get(f"/v1/reports/{phone}")
+            resp.raise_for_status()
+            report = resp.json()
+            int(report["credit_score"])
+            return report
+        finally:
+            REQUEST_SECONDS.observe(time.perf_counter() - t0)
+
+    # ---------------- cache + coalescing ----------------
+    def _cached(self, phone):
+        entry = self._cache.get(phone)
+        if entry is not None and entry[0] > time.monotonic():
+            LOOKUPS.inc(outcome="hit" if entry[1] else "error_cached")
+            return entry[1]
+        return _MISS
+
+    def _lookup(self, phone):
+        """Future of the report for phone: the request in flight, or a new one."""
+        with self._lock:
+            future = self._inflight.get(phone)
+            if future is not None:
+                LOOKUPS.inc(outcome="coalesced")
+                return future
+            report = self._cached(phone)
+            if report is not _MISS:   # filled while we waited for the lock
+                future = Future()
+                future.set_result(report)
+                return future
+            future = asyncio.run_coroutine_threadsafe(self._fetch(phone), self._ensure_loop())
+            self._inflight[phone] = future
+        future.add_done_callback(lambda f: self._store(phone, f))
+        return future
+
+    def _store(self, phone, future):
+        error = None if future.cancelled() else future.exception()
+        if future.cancelled() or error is not None:
+            report, ttl = None, self.error_ttl
+            LOOKUPS.inc(outcome="error")
+            log.warning("bureau.lookup_failed", phone=phone, error=repr(error) if error else "cancelled")
+        else:
+            report, ttl = future.result(), self.ttl
+            LOOKUPS.inc(outcome="fetched")
+        with self._lock:
+            self._inflight.pop(phone, None)
+            self._cache[phone] = (time.monotonic() + ttl, report)
+            self._cache.move_to_end(phone)
+            while len(self._cache) > CACHE_MAX:
+                self._cache.popitem(last=False)
+
+    # ---------------- API ----------------
+    def report(self, phone, wait=True):
+        """
+        Bureau report for phone (blocking on a miss), or None (no bureau / lookup
+        failed). wait=False only reads the cache: a miss is None, with no request.
+        """
+        if not self.enabled or not phone:
+            return None
+        report = self._cached(phone)
+        if report is _MISS and not wait:
+            return None
+        if report is _MISS:
+            try:
+                report = self._lookup(phone).result(timeout=self.timeout + 1)
+            except Exception:
+                report = None   # logged in _store
+        return report
+
+    def score(self, phone, default=None, wait=True):
+        """Credit score for phone; default (the stored score) when there is no bureau answer."""
+        report = self.report(phone, wait)
+        return int(report["credit_score"]) if report else default
+
+    async def prefetch(self, phone):
+        """Fetch phone's report into the cache without blocking the event loop."""
+        if not self.enabled or not phone or self._cached(phone) is not _MISS:
+            return
+        try:
+            # shielded: giving up here must not cancel a request other lookups share
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(self._lookup(phone))), self.timeout + 1)
+        except Exception:
+            pass
+
+    def invalidate(self, phone):
+        with self._lock:
+            self._cache.pop(phone, None)
+
+    def close(self):
+        loop, client = self._loop, self._client
+        self._loop = self._client = None
+        if loop is None:
+            return
+        if client is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(client.aclose(), loop).result(timeout=5)
+            except Exception:
+                pass
+        loop.call_soon_threadsafe(loop.stop)
+
+    def _after_fork(self):
+        # the loop thread does not survive fork; the child starts its own on first use
+        self._loop = self._client = None
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+
+credit_bureau = CreditBureau()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=credit_bureau._after_fork)
+
+
+# ----------------------------------------------------------
+# CLI
+# ----------------------------------------------------------
+def bench(url, lookups, phones, concurrency, ttl):
+    """lookups concurrent score() calls over `phones` distinct numbers; returns a summary dict."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    client = CreditBureau(url=url, ttl=ttl)
+    numbers = [f"7{i:09d}" for i in range(phones)]
+    before = httpx.get(f"{url}/stats").json()["reports"]
+    latencies = []
+
+    def one(i):
+        t0 = time.perf_counter()
+        client.score(numbers[i % phones])
+        latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(lookups)))
+    elapsed = time.perf_counter() - t0
+    requests = httpx.get(f"{url}/stats").json()["reports"] - before
+    client.close()
+    return {
+        "lookups": lookups,
+        "phones": phones,
+        "bureau_requests": requests,
+        "seconds": round(elapsed, 3),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Credit bureau client tools")
+    parser.add_argument("command", choices=["bench"])
+    parser.add_argument("--url", default=CREDIT_BUREAU_URL or "http://127.0.0.1:8091",
+                        help="bureau (start one with: python fake_bureau_server.py --latency 0.2)")
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--phones", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    # ttl 0: only concurrent lookups of a phone are shared (coalescing)
+    for label, ttl in (("coalesced", 0), ("cached", BUREAU_TTL)):
+        result = bench(args.url, args.lookups, args.phones, args.concurrency, ttl)
+        print(f"{label:<10} {result['lookups']} lookups of {result['phones']} phones -> "
+              f"{result['bureau_requests']} bureau requests in {result['seconds']}s "
+              f"(p50 {result['p50_ms']}ms, p99 {result['p99_ms']}ms)")
+
+
+if __name__ == "__main__":
+    main()
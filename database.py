@@ -1,6 +1,7 @@
 # database.py
 import sqlite3
 from langchain_core.messages import HumanMessage, AIMessage
+from telemetry import timed
 
 DB_NAME = "chat_history.db"
 
@@ -8,6 +9,7 @@ DB_NAME = "chat_history.db"
 # ----------------------------------------------------------
 # Create DB table if not exists
 # ----------------------------------------------------------
+@timed("sqlite.init_db")
 def init_db():
     conn = sqlite3.connect(DB_NAME)
     cur = conn.cursor()
@@ -20,6 +22,16 @@ def init_db():
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
         )
     """)
+    # sanction letters: (phone, application) -> content digest (letter_store.py)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS letters (
+            phone TEXT,
+            application_id TEXT,
+            digest TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (phone, application_id, digest)
+        )
+    """)
     conn.commit()
     conn.close()
 
@@ -27,6 +39,7 @@ def init_db():
 # ----------------------------------------------------------
 # Reset session history correctly
 # ----------------------------------------------------------
+@timed("sqlite.reset_session")
 def reset_session(session_id: str):
     conn = sqlite3.connect(DB_NAME)
     cur = conn.cursor()
@@ -40,6 +53,7 @@ def reset_session(session_id: str):
 # ----------------------------------------------------------
 # Save chat messages
 # ----------------------------------------------------------
+@timed("sqlite.save_message")
 def save_message(session_id, sender_type, content):
     """
     sender_type = 'human' or 'ai'
@@ -57,6 +71,7 @@ def save_message(session_id, sender_type, content):
 # ----------------------------------------------------------
 # Fetch full chat as LangChain format
 # ----------------------------------------------------------
+@timed("sqlite.get_chat_history")
 def get_chat_history(session_id):
     conn = sqlite3.connect(DB_NAME)
     cur = conn.cursor()
@@ -76,3 +91,34 @@ def get_chat_history(session_id):
             HumanMessage(content=msg) if sender=="human" else AIMessage(content=msg)
         )
     return history
+
+
+# ----------------------------------------------------------
+# Sanction letter index
+# ----------------------------------------------------------
+@timed("sqlite.save_letter")
+def save_letter(phone, application_id, digest):
+    conn = sqlite3.connect(DB_NAME)
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT OR IGNORE INTO letters(phone, application_id, digest) VALUES (?, ?, ?)",
+        (phone, application_id, digest)
+    )
+    conn.commit()
+    conn.close()
+
+
+@timed("sqlite.get_letters")
+def get_letters(phone, application_id=None):
+    """Letters issued to a phone (optionally one application), newest first."""
+    conn = sqlite3.connect(DB_NAME)
+    cur = conn.cursor()
+    sql = "SELECT application_id, digest, created_at FROM letters WHERE phone = ?"
+    params = [phone]
+    if application_id:
+        sql += " AND application_id = ?"
+        params.append(application_id)
+    cur.execute(sql + " ORDER BY created_at DESC, rowid DESC", params)
+    rows = cur.fetchall()
+    conn.close()
+    return [{"application_id": a, "digest": d, "created_at": c} for a, d, c in rows]
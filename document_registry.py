@@ -0,0 +1,225 @@
+# document_registry.py
+# In-process registry of uploaded salary slips, one record per phone:
+#   uploaded -> extracting -> extracted | failed
+# /upload records the file and salary extraction starts right away on a small
+# thread pool; GraphExecutor and underwriting_node look the phone up here (a
+# dict lookup, no disk access) and reuse the extracted salary instead of
+# parsing the PDF again. Listeners (GET /uploads/{phone}/events) are told about
+# every status change; "extracted" means underwriting can run.
+#
+# Slips already in uploads/ when the process starts are picked up by a single
+# directory scan on first use (status "uploaded", extracted on demand).
+#
+# STATE_BACKEND=sqlite (several workers): records are also written to the
+# shared store; a slip uploaded through another worker is read from there and
+# its extraction awaited by polling rather than started a second time.
+#
+# A re-upload replaces the phone's record; the extraction still running for
+# the old one finishes but publishes nothing (no event, no shared write), and
+# shared entries for an older upload than the local record are ignored.
+import asyncio
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from shared_state import SHARED, kv
+from telemetry import get_logger, histogram
+
+UPLOAD_DIR = "uploads"
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "2"))
+EXTRACT_WAIT = float(os.getenv("EXTRACT_WAIT", "30"))   # max seconds underwriting waits for a running extraction
+SHARED_POLL = 0.1                                        # seconds between shared-store checks
+
+_SLIP_RE = re.compile(r"^(\d+)_salary_slip\.pdf$")
+
+log = get_logger("document_registry")
+EXTRACT_SECONDS = histogram("loanbot_slip_extract_seconds", "Salary slip upload -> extracted / failed")
+
+
+def slip_path(phone):
+    return f"{UPLOAD_DIR}/{phone}_salary_slip.pdf"
+
+
+class SlipRecord:
+    def __init__(self, phone, path):
+        self.phone = phone
+        self.path = path
+        self.status = "uploaded"    # uploaded -> extracting -> extracted | failed
+        self.salary = None
+        self.error = None
+        self.uploaded_at = time.time()
+        self.updated_at = self.uploaded_at
+        self.future = None
+        self.remote = False         # read from the shared store (another worker owns it)
+
+    def to_dict(self):
+        return {
+            "phone": self.phone,
+            "status": self.status,
+            "salary": self.salary,
+            "error": self.error,
+            "uploaded_at": self.uploaded_at,
+            "updated_at": self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        rec = cls(d["phone"], slip_path(d["phone"]))
+        rec.status, rec.salary, rec.error = d["status"], d.get("salary"), d.get("error")
+        rec.uploaded_at, rec.updated_at = d["uploaded_at"], d["updated_at"]
+        rec.remote = True
+        return rec
+
+
+class DocumentRegistry:
+    def __init__(self, upload_dir=UPLOAD_DIR, workers=EXTRACT_WORKERS):
+        self.upload_dir = upload_dir
+        self.slips = {}
+        self.shared = kv("slip") if SHARED else None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="slip-extract")
+        self._listeners = defaultdict(list)   # phone -> [(loop, asyncio.Queue)]
+
+    # ---------------- lookup ----------------
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            if os.path.isdir(self.upload_dir):
+                for name in os.listdir(self.upload_dir):
+                    m = _SLIP_RE.match(name)
+                    path = os.path.join(self.upload_dir, name)
+                    if m and m.group(1) not in self.slips and os.path.getsize(path) > 0:
+                        self.slips[m.group(1)] = SlipRecord(m.group(1), path)
+            self._loaded = True
+            log.info("registry.loaded", slips=len(self.slips))
+
+    def get(self, phone):
+        if not phone:
+            return None
+        self._ensure_loaded()
+        rec = self.slips.get(phone)
+        if self.shared is not None and (rec is None or rec.future is None or rec.future.done()):
+            d = self.shared.get(phone)
+            # an entry for an older upload than ours is stale, however recently it changed
+            if d and (rec is None or (d["uploaded_at"] >= rec.uploaded_at and d["updated_at"] > rec.updated_at)):
+                rec = SlipRecord.from_dict(d)
+        return rec
+
+    def has_slip(self, phone):
+        return self.get(phone) is not None
+
+    # ---------------- updates ----------------
+    def record_upload(self, phone, path):
+        """Called by /upload once the file is fully written; starts extraction."""
+        self._ensure_loaded()
+        rec = SlipRecord(phone, path)
+        uploaded = rec.to_dict()   # snapshot: extraction may move on before listeners are told
+        with self._lock:
+            self.slips[phone] = rec   # a re-upload replaces the previous record
+            rec.future = self._pool.submit(self._extract, rec)
+        log.info("slip.uploaded", phone=phone, path=path)
+        self._publish(rec, uploaded)
+        return rec
+
+    def _set_status(self, rec, status, **fields):
+        for k, v in fields.items():
+            setattr(rec, k, v)
+        rec.status, rec.updated_at = status, time.time()
+        self._publish(rec)
+
+    def _extract(self, rec):
+        from salary_handling import get_monthly_salary_from_payslip
+
+        self._set_status(rec, "extracting")
+        try:
+            with open(rec.path, "rb") as f:
+                salary = get_monthly_salary_from_payslip(f)
+        except Exception as e:
+            salary, error = None, str(e)
+        else:
+            error = None if salary else "no salary amount found"
+        EXTRACT_SECONDS.observe(time.time() - rec.uploaded_at)
+
+        if salary:
+            self._set_status(rec, "extracted", salary=salary)
+        else:
+            self._set_status(rec, "failed", error=error)
+        log.info("slip.extracted", phone=rec.phone, status=rec.status, salary=salary, error=error)
+        return salary
+
+    def salary(self, phone, timeout=EXTRACT_WAIT):
+        """
+        Extracted monthly salary for phone, waiting (bounded) for a running
+        extraction; slips found on disk are extracted on first request.
+        None if there is no slip, extraction failed or it is still running.
+        """
+        rec = self.get(phone)
+        if rec is None:
+            return None
+        if rec.remote and rec.status in ("extracted", "failed"):
+            return rec.salary
+        if rec.remote and time.time() - rec.updated_at < timeout:
+            return self._wait_shared(phone, timeout)
+        with self._lock:
+            if rec.remote:   # the owning worker stalled or died: extract here
+                rec.remote = False
+                self.slips[phone] = rec
+            if rec.future is None:
+                rec.future = self._pool.submit(self._extract, rec)
+        try:
+            return rec.future.result(timeout=timeout)
+        except FutureTimeout:
+            return None
+
+    def _wait_shared(self, phone, timeout):
+        """Poll the shared store for another worker's extraction of phone."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            d = self.shared.get(phone) or {}
+            if d.get("status") in ("extracted", "failed"):
+                return d.get("salary")
+            time.sleep(SHARED_POLL)
+        return None
+
+    # ---------------- events ----------------
+    def subscribe(self, phone):
+        """Queue receiving this phone's record dicts; call from the event loop."""
+        queue = asyncio.Queue()
+        with self._lock:
+            self._listeners[phone].append((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, phone, queue):
+        with self._lock:
+            self._listeners[phone] = [(lp, q) for lp, q in self._listeners[phone] if q is not queue]
+            if not self._listeners[phone]:
+                del self._listeners[phone]
+
+    def _publish(self, rec, event=None):
+        with self._lock:
+            if self.slips.get(rec.phone) is not rec:
+                return   # superseded by a re-upload: its extraction result is not news
+            listeners = list(self._listeners.get(rec.phone, ()))
+        event = event or rec.to_dict()
+        if self.shared is not None:
+            try:
+                current = self.shared.get(rec.phone)
+                if current is None or current["uploaded_at"] <= rec.uploaded_at:   # newer upload on another worker
+                    self.shared.set(rec.phone, rec.to_dict())
+            except Exception as e:
+                log.error("slip.share_failed", phone=rec.phone, error=str(e))
+        for loop, queue in listeners:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                pass   # listener's loop already closed
+
+
+document_registry = DocumentRegistry()
@@ -0,0 +1,271 @@
+# document_service.py
+# Sanction letters are rendered off the chat path: submit_sanction_letter()
+# queues a render on a worker pool and returns a job id right away; the chat
+# reply links to /documents/<job_id>, which redirects to /pdfs/<file> once the
+# letter exists. Each worker loads the logo once at start-up.
+# Letters are content-addressed (letter_store.py): a letter whose digest is
+# already on disk completes immediately without touching the pool.
+# With STATE_BACKEND=sqlite every job is also written to the shared store, so
+# a link can be resolved by whichever worker process the client reaches.
+import asyncio
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+import multiprocessing
+
+import database
+from letter_store import application_key, letter_digest, letter_path, store_sanction_letter
+from scheduler import resource
+from shared_state import SHARED, kv
+from telemetry import counter, gauge, get_logger, histogram
+
+DOC_WORKERS = int(os.getenv("DOC_WORKERS", "2"))      # 0 = render inline (no pool)
+DOC_WAIT = float(os.getenv("DOC_WAIT", "10"))         # max seconds /documents/<id> waits for a pending job
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "http://127.0.0.1:8000")
+MAX_JOBS = 10000                                      # finished jobs kept for link resolution
+JOB_TTL = 24 * 3600                                   # shared-store copy of a job (seconds)
+
+log = get_logger("document_service")
+RENDER_SECONDS = histogram("loanbot_document_render_seconds", "Sanction letter render time (worker)")
+QUEUE_LATENCY = histogram("loanbot_document_queue_seconds", "Submit -> letter ready")
+PENDING = gauge("loanbot_document_jobs_pending", "Letters queued or rendering")
+REUSED = counter("loanbot_document_reused_total", "Letters served from the store without rendering")
+
+
+# ----------------------------------------------------------
+# Worker side
+# ----------------------------------------------------------
+_LOGO = None
+
+def _init_worker(cwd):
+    global _LOGO
+    os.chdir(cwd)   # static_pdfs/ and assets/ are relative to the app directory
+    from pdf_generator import load_logo
+    _LOGO = load_logo()
+
+
+def _ready():
+    return _LOGO is not None
+
+
+def _render(digest, customer_name, phone, amount, emi, tenure, now, rate=None):
+    t0 = time.perf_counter()
+    path, _ = store_sanction_letter(digest, customer_name, phone, amount, emi, tenure, now, logo=_LOGO, rate=rate)
+    return path, time.perf_counter() - t0
+
+
+# ----------------------------------------------------------
+# Jobs
+# ----------------------------------------------------------
+class DocumentJob:
+    def __init__(self, job_id, kind, phone, application_id=None, digest=None):
+        self.id = job_id
+        self.kind = kind
+        self.phone = phone
+        self.application_id = application_id
+        self.digest = digest
+        self.status = "pending"     # pending -> ready | failed
+        self.path = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self.future = None
+        self.reused = False         # identical letter already in the store
+
+    @property
+    def filename(self):
+        return os.path.basename(self.path) if self.path else None
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "file": self.filename,
+            "digest": self.digest,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "finished_at": self.finished_at,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        """Job published by another worker (no future: poll the shared store)."""
+        job = cls(d["job_id"], d["kind"], d.get("phone"), d.get("application_id"), d.get("digest"))
+        job.status, job.error = d["status"], d.get("error")
+        job.path = letter_path(job.digest) if d.get("file") else None
+        job.submitted_at, job.finished_at = d["submitted_at"], d.get("finished_at")
+        return job
+
+    def shared_dict(self):
+        return {**self.to_dict(), "phone": self.phone, "application_id": self.application_id}
+
+
+class DocumentService:
+    def __init__(self, workers=DOC_WORKERS):
+        self.workers = workers
+        self.jobs = OrderedDict()
+        self.shared = kv("doc_job", ttl=JOB_TTL) if SHARED else None
+        self._prerenders = {}   # digest -> Future of a speculative render still running
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Spin up the worker pool (also done lazily by the first submit)."""
+        with self._lock:
+            if self._pool is None and self.workers > 0:
+                # spawn: workers must not inherit the app's threads / event loop
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(os.getcwd(),),
+                )
+                # workers start on demand; make them spawn (and load the logo) now
+                for _ in range(self.workers):
+                    self._pool.submit(_ready)
+        return self
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool:
+            pool.shutdown(wait=True)
+
+    def _track(self, job):
+        with self._lock:
+            self.jobs[job.id] = job
+            while len(self.jobs) > MAX_JOBS:
+                oldest_id, oldest = next(iter(self.jobs.items()))
+                if oldest.status == "pending":
+                    break
+                self.jobs.pop(oldest_id)
+        self._share(job)
+
+    def _share(self, job):
+        if self.shared is not None:
+            try:
+                self.shared.set(job.id, job.shared_dict())
+            except Exception as e:
+                log.error("document.share_failed", job_id=job.id, error=str(e))
+
+    def _on_done(self, job, future):
+        PENDING.inc(-1)
+        job.finished_at = time.time()
+        try:
+            path, render_s = future.result()
+        except Exception as e:
+            job.error, job.status = str(e), "failed"
+            log.error("document.failed", job_id=job.id, phone=job.phone, error=str(e))
+            self._share(job)
+            return
+        job.path, job.status = path, "ready"
+        self._share(job)
+        if not job.reused:
+            RENDER_SECONDS.observe(render_s)
+        QUEUE_LATENCY.observe(job.finished_at - job.submitted_at)
+        log.info("document.ready", job_id=job.id, file=job.filename, reused=job.reused,
+                 render_ms=round(render_s * 1000, 1))
+        try:
+            database.save_letter(job.phone, job.application_id, job.digest)
+        except Exception as e:
+            log.error("document.index_failed", job_id=job.id, digest=job.digest, error=str(e))
+
+    def submit_sanction_letter(self, customer_name, phone, amount, emi, tenure, application_id=None, rate=None):
+        """
+        Queue a sanction letter; returns the DocumentJob (status "pending", or
+        already "ready" when an identical letter is in the store). rate is the
+        approved rate (default: the base rate).
+        """
+        now = datetime.now()
+        digest = letter_digest(customer_name, phone, amount, emi, tenure, now, rate)
+        job = DocumentJob(uuid.uuid4().hex, "sanction_letter", phone,
+                          application_id or application_key(amount, tenure), digest)
+        self._track(job)
+        PENDING.inc()
+        args = (digest, customer_name, phone, amount, emi, tenure, now, rate)
+        prerender = self._prerenders.get(digest)
+
+        if os.path.exists(letter_path(digest)):
+            REUSED.inc()
+            job.reused = True
+            job.future = Future()
+            job.future.set_result((letter_path(digest), 0.0))
+        elif prerender is not None:
+            job.future = prerender   # speculative render of this exact letter is under way
+        elif self.workers > 0:
+            self.start()
+            job.future = self._pool.submit(_render, *args)
+        else:
+            job.future = Future()
+            try:
+                if _LOGO is None:
+                    _init_worker(os.getcwd())
+                with resource("pdf").slot():   # inline renders run on request threads
+                    job.future.set_result(_render(*args))
+            except Exception as e:
+                job.future.set_exception(e)
+        job.future.add_done_callback(lambda f: self._on_done(job, f))
+        return job
+
+    def prerender_sanction_letter(self, customer_name, phone, amount, emi, tenure, rate=None):
+        """
+        Render a letter into the store ahead of an expected approval (see
+        speculation.py). No job and no letters index entry: a later
+        submit_sanction_letter for the same letter finds it and completes at once.
+        Returns the digest.
+        """
+        now = datetime.now()
+        digest = letter_digest(customer_name, phone, amount, emi, tenure, now, rate)
+        args = (digest, customer_name, phone, amount, emi, tenure, now, rate)
+        if self.workers > 0:
+            self.start()
+        with self._lock:
+            if digest in self._prerenders or os.path.exists(letter_path(digest)):
+                return digest
+            future = self._pool.submit(_render, *args) if self.workers > 0 else Future()
+            self._prerenders[digest] = future
+        future.add_done_callback(lambda f: self._prerenders.pop(digest, None))
+        if self.workers == 0:
+            try:
+                if _LOGO is None:
+                    _init_worker(os.getcwd())
+                with resource("pdf").slot():
+                    future.set_result(_render(*args))
+            except Exception as e:
+                future.set_exception(e)
+        return digest
+
+    def get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None and self.shared is not None:
+            d = self.shared.get(job_id)   # submitted through another worker
+            job = DocumentJob.from_dict(d) if d else None
+        return job
+
+    async def wait(self, job_id, timeout=DOC_WAIT):
+        """Wait (bounded) for a pending job; returns the job or None if unknown."""
+        job = self.get(job_id)
+        if job and job.status == "pending" and job.future is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job.future)), timeout)
+            except Exception:
+                pass   # timeout or failed render: the caller reports job.status
+        elif job and job.status == "pending":
+            # another worker's job: poll the shared store
+            deadline = time.monotonic() + timeout
+            while job.status == "pending" and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+                job = self.get(job_id) or job
+        return job
+
+
+def document_link(job):
+    return f"{PUBLIC_BASE_URL}/documents/{job.id}"
+
+
+document_service = DocumentService()
@@ -0,0 +1,97 @@
+# fake_bureau_server.py
+# Local stand-in for the credit bureau (see credit_bureau.py), with
+# configurable latency and failures.
+#
+#   python fake_bureau_server.py --port 8091 --latency 0.2 --error-rate 0.05
+#   CREDIT_BUREAU_URL=http://127.0.0.1:8091 GOOGLE_API_KEY=... uvicorn main:app
+#
+# Handles  GET /v1/reports/<phone>   -> {"phone", "credit_score", "report_id", "as_of"}
+#          GET /stats                -> {"reports": <report requests served>}
+# Customers in customers.json get their score from there; any other phone a
+# stable score derived from the number.
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONFIG = {"latency": 0.0, "jitter": 0.0, "error_rate": 0.0, "hang_rate": 0.0, "hang_seconds": 120.0}
+SCORES = {}
+STATS = {"reports": 0}
+_stats_lock = threading.Lock()
+
+
+def bureau_score(phone):
+    if phone in SCORES:
+        return SCORES[phone]
+    return random.Random(phone).randint(600, 850)   # same number -> same score
+
+
+class FakeBureauHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive: the client pools connections
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            return self._send_json(200, STATS)
+        prefix = "/v1/reports/"
+        phone = self.path[len(prefix):] if self.path.startswith(prefix) else ""
+        if not (phone.isdigit() and len(phone) == 10):
+            return self._send_json(404, {"error": "unknown report"})
+        with _stats_lock:
+            STATS["reports"] += 1
+
+        # failure injection
+        roll = random.random()
+        if roll < CONFIG["hang_rate"]:
+            time.sleep(CONFIG["hang_seconds"])
+        elif roll < CONFIG["hang_rate"] + CONFIG["error_rate"]:
+            return self._send_json(503, {"error": "fake bureau unavailable"})
+
+        delay = CONFIG["latency"] + random.uniform(-CONFIG["jitter"], CONFIG["jitter"])
+        time.sleep(max(0.0, delay))
+        self._send_json(200, {
+            "phone": phone,
+            "credit_score": bureau_score(phone),
+            "report_id": f"FAKE-{phone}-{date.today():%Y%m%d}",
+            "as_of": date.today().isoformat(),
+        })
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake credit bureau server")
+    parser.add_argument("--port", type=int, default=8091)
+    parser.add_argument("--customers", default="customers.json", help="scores for known phones")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per report")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction answered with HTTP 503")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="fraction that stall for --hang-seconds")
+    parser.add_argument("--hang-seconds", type=float, default=120.0)
+    args = parser.parse_args()
+
+    try:
+        with open(args.customers, encoding="utf-8") as f:
+            SCORES.update({c["phone"]: c["credit_score"] for c in json.load(f)})
+    except OSError:
+        pass
+    CONFIG.update(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                  hang_rate=args.hang_rate, hang_seconds=args.hang_seconds)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), FakeBureauHandler)
+    print(f"Fake bureau listening on http://127.0.0.1:{args.port} {CONFIG} ({len(SCORES)} known scores)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
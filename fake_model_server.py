@@ -0,0 +1,106 @@
+# fake_model_server.py
+# Local stand-in for the Gemini REST API, for exercising llm_gateway timeouts,
+# retries and the circuit breaker without the real upstream.
+#
+#   python fake_model_server.py --port 8090 --latency 0.3 --error-rate 0.1 --hang-rate 0.05
+#   GEMINI_API_ENDPOINT=http://127.0.0.1:8090 GOOGLE_API_KEY=fake uvicorn main:app
+#
+# Handles  POST /v1beta/models/<model>:generateContent
+#          POST /v1beta/models/<model>:streamGenerateContent[?alt=sse]
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from stub_llm import stub_reply
+
+CONFIG = {"latency": 0.0, "jitter": 0.0, "error_rate": 0.0, "hang_rate": 0.0, "hang_seconds": 120.0}
+
+
+def _candidate(text):
+    return {
+        "candidates": [{
+            "content": {"parts": [{"text": text}], "role": "model"},
+            "finishReason": "STOP",
+            "index": 0,
+        }],
+        "usageMetadata": {"promptTokenCount": 0, "candidatesTokenCount": len(text.split()), "totalTokenCount": len(text.split())},
+    }
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            req = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send_json(400, {"error": {"code": 400, "message": "bad json"}})
+
+        # failure injection
+        roll = random.random()
+        if roll < CONFIG["hang_rate"]:
+            time.sleep(CONFIG["hang_seconds"])
+        elif roll < CONFIG["hang_rate"] + CONFIG["error_rate"]:
+            return self._send_json(503, {"error": {"code": 503, "message": "fake upstream overloaded", "status": "UNAVAILABLE"}})
+
+        delay = CONFIG["latency"] + random.uniform(-CONFIG["jitter"], CONFIG["jitter"])
+        time.sleep(max(0.0, delay))
+
+        prompt = ""
+        for content in req.get("contents", []):
+            for part in content.get("parts", []):
+                prompt += part.get("text", "")
+        text = stub_reply(prompt)
+
+        if ":streamGenerateContent" not in self.path:
+            return self._send_json(200, _candidate(text))
+
+        # streaming: one chunk per word
+        words = text.split(" ")
+        chunks = [_candidate(w + (" " if i < len(words) - 1 else "")) for i, w in enumerate(words)]
+        if "alt=sse" in self.path:
+            body = "".join(f"data: {json.dumps(c)}\r\n\r\n" for c in chunks).encode()
+            ctype = "text/event-stream"
+        else:
+            body = json.dumps(chunks).encode()
+            ctype = "application/json"
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Gemini REST server")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction answered with HTTP 503")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="fraction that stall for --hang-seconds")
+    parser.add_argument("--hang-seconds", type=float, default=120.0)
+    args = parser.parse_args()
+
+    CONFIG.update(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                  hang_rate=args.hang_rate, hang_seconds=args.hang_seconds)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), FakeGeminiHandler)
+    print(f"Fake Gemini listening on http://127.0.0.1:{args.port} {CONFIG}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 import { useState, useCallback, useEffect } from "react";
-import { sendMessage, ChatResponse } from "@/services/api";
+import { sendMessage, streamMessage, ChatResponse } from "@/services/api";
 
 export interface Message {
   id: string;
@@ -80,13 +80,36 @@ export const useChat = (sessionId: string, tenure: number = 12) => {
       addMessage("user", message);
       setIsLoading(true);
 
-      try {
-        const response: ChatResponse = await sendMessage(
-          sessionId,
-          message,
-          tenure
+      // Placeholder bubble that fills in as LLM tokens stream in
+      let streamingId: string | null = null;
+      const setStreamingContent = (update: (prev: string) => string) => {
+        if (!streamingId) {
+          streamingId = addMessage("assistant", update("")).id;
+          setIsLoading(false);
+          return;
+        }
+        setMessages((prev) =>
+          prev.map((m) =>
+            m.id === streamingId ? { ...m, content: update(m.content) } : m
+          )
         );
-        addMessage("assistant", response.response);
+      };
+
+      try {
+        let response: ChatResponse;
+        try {
+          response = await streamMessage(sessionId, message, tenure, {
+            onToken: (text) => setStreamingContent((prev) => prev + text),
+            // the model call was retried: its tokens start over
+            onTokenReset: () => setStreamingContent(() => ""),
+          });
+        } catch (streamErr) {
+          // Nothing rendered yet -> fall back to the plain /chat endpoint
+          if (streamingId) throw streamErr;
+          response = await sendMessage(sessionId, message, tenure);
+        }
+        // Final reply carries the structured card tags; it replaces the token preview
+        setStreamingContent(() => response.response);
       } catch (err) {
         let errorMessage = "Failed to send message";
         if (err instanceof Error) {
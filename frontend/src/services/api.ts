@@ -50,6 +50,64 @@ export const sendMessage = async (
   return response.data;
 };
 
+export interface StreamHandlers {
+  onToken?: (text: string) => void;
+  onTokenReset?: () => void;
+  onNode?: (node: string, status: "start" | "end") => void;
+  onCard?: (kind: string, payload: unknown) => void;
+}
+
+// Streaming chat endpoint (Server-Sent Events). Resolves with the same
+// payload as sendMessage once the "done" event arrives.
+export const streamMessage = async (
+  sessionId: string,
+  message: string,
+  tenure: number = 12,
+  handlers: StreamHandlers = {}
+): Promise<ChatResponse> => {
+  const response = await fetch(`${API_BASE}/chat/stream`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ session_id: sessionId, message, tenure }),
+  });
+  if (!response.ok || !response.body) {
+    throw new Error(`Stream request failed (${response.status})`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // SSE frames are separated by a blank line
+    let sep: number;
+    while ((sep = buffer.indexOf("\n\n")) !== -1) {
+      const frame = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+
+      let event = "message";
+      let data = "";
+      for (const line of frame.split("\n")) {
+        if (line.startsWith("event: ")) event = line.slice(7);
+        else if (line.startsWith("data: ")) data += line.slice(6);
+      }
+      const payload = data ? JSON.parse(data) : {};
+
+      if (event === "token") handlers.onToken?.(payload.text);
+      else if (event === "token_reset") handlers.onTokenReset?.();
+      else if (event === "node") handlers.onNode?.(payload.node, payload.status);
+      else if (event === "error") throw new Error(payload.detail);
+      else if (event === "done") return { response: payload.response };
+      else if (event !== "message") handlers.onCard?.(event, payload);
+    }
+  }
+  throw new Error("Stream ended before the reply was complete");
+};
+
 // Upload salary slip
 export const uploadSalarySlip = async (
   sessionId: string,
@@ -0,0 +1,40 @@
+# gunicorn_conf.py
+# Multi-worker mode: several uvicorn workers behind one gunicorn master.
+#
+#   STATE_BACKEND=sqlite gunicorn -c gunicorn_conf.py main:app
+#
+# - preload_app: main (LangGraph, pdf / OCR libraries, intent model) is imported
+#   once in the master and shared copy-on-write by the forked workers.
+# - The master creates the SQLite tables and primes pure caches
+#   (warmup.prime_caches) before forking; each worker then runs warmup() at
+#   startup, before it accepts connections.
+# - Session state, letter jobs, slip status and dedup replies live behind
+#   shared_state (STATE_BACKEND=sqlite); with the default "memory" backend only
+#   WEB_CONCURRENCY=1 is safe, so that combination is refused.
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))           # LLM + OCR turns can be slow
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+max_requests = int(os.getenv("MAX_REQUESTS", "0"))          # 0 = never recycle workers
+max_requests_jitter = max_requests // 10
+accesslog = os.getenv("ACCESS_LOG") or None                 # e.g. "-" for stdout
+
+
+def on_starting(server):
+    import database
+    import shared_state
+    from warmup import prime_caches
+
+    if server.cfg.workers > 1 and not shared_state.SHARED:
+        raise RuntimeError("WEB_CONCURRENCY > 1 needs STATE_BACKEND=sqlite (see shared_state.py)")
+    database.init_db()
+    shared_state.init_state()
+    os.environ["LOANBOT_INITIALIZED"] = "1"   # inherited by workers: skip init in startup_event
+    steps = prime_caches()
+    server.log.info("loanbot: %d workers, state=%s, primed %s", server.cfg.workers, shared_state.STATE_BACKEND, steps)
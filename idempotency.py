@@ -0,0 +1,131 @@
+# idempotency.py
+# Duplicate / retried chat messages answered without re-running the agent.
+# A message is keyed by a hash of (session, the client's message_id) when it
+# sends one, otherwise of (session, normalized text). A text key only stands
+# for a retry: it is kept for DEDUP_TEXT_TTL seconds, only the session's latest
+# message counts, and the reply is tied to the session state it left behind
+# (step, slip; see main._dedup_state) -- once that changes (a later turn, an
+# /upload, the slip's extraction finishing) the key is dropped and the same
+# text runs the agent again ("uploaded" after actually uploading).
+# Finished replies live in a small LRU with a TTL; a message whose first
+# submission is still running waits for that run instead of starting another.
+# With STATE_BACKEND=sqlite finished replies are also kept in the shared store,
+# so a retry that lands on another worker is still answered from cache.
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from shared_state import SHARED, kv
+from telemetry import counter
+
+DEDUP_TTL = float(os.getenv("DEDUP_TTL", "300"))        # seconds a reply can answer a duplicate
+DEDUP_MAX = int(os.getenv("DEDUP_MAX", "10000"))        # replies kept
+DEDUP_TEXT_TTL = float(os.getenv("DEDUP_TEXT_TTL", "10"))   # retry window for messages without a message_id
+
+DEDUP_HITS = counter("loanbot_chat_dedup_total", "Chat messages answered from the idempotency cache")
+
+
+def _normalize(text):
+    return " ".join((text or "").lower().split())
+
+
+def _hashed(key):
+    """Key built from the message text (no message_id)."""
+    return key.startswith("h:")
+
+
+class IdempotencyCache:
+    def __init__(self, ttl=DEDUP_TTL, max_entries=DEDUP_MAX, text_ttl=DEDUP_TEXT_TTL):
+        self.ttl = ttl
+        self.text_ttl = min(text_ttl, ttl)
+        self.max_entries = max_entries
+        self._replies = OrderedDict()   # key -> (reply, expires_at, state, session_id)
+        self._latest = {}               # session_id -> hashed key of its latest message
+        self._inflight = {}             # key -> asyncio.Future
+        self._lock = threading.Lock()
+        self.shared = kv("dedup", ttl=ttl) if SHARED else None
+        self.shared_latest = kv("dedup_latest", ttl=ttl) if SHARED else None
+
+    def key(self, session_id, text, message_id=None):
+        # session ids and message ids are client-supplied: hashed, so no id can be mistaken for another's
+        kind, value = ("id", message_id) if message_id else ("h", _normalize(text))
+        digest = hashlib.sha256(f"{session_id}\0{value}".encode("utf-8")).hexdigest()[:32]
+        return f"{kind}:{digest}"
+
+    def get(self, key, state=None):
+        """Stored reply for key, or None; a hashed key's reply only while the session is still in `state`."""
+        with self._lock:
+            entry = self._replies.get(key)
+            if entry is not None and (entry[1] < time.monotonic() or not self._same_state(key, entry[2], state)):
+                del self._replies[key]
+                entry = None
+            if entry is not None:
+                self._replies.move_to_end(key)
+        reply = entry[0] if entry is not None else None
+        if reply is None and self.shared is not None:
+            stored = self.shared.get(key)   # answered by another worker
+            if stored is not None and self._same_state(key, stored["state"], state):
+                reply = stored["reply"]
+            elif stored is not None:
+                self.shared.delete(key)
+        if reply is None:
+            return None
+        DEDUP_HITS.inc(kind="cached")
+        return reply
+
+    @staticmethod
+    def _same_state(key, stored, current):
+        return not _hashed(key) or stored == current
+
+    def claim(self, key):
+        """
+        None if the caller now owns the run for key (it must call complete() or
+        release()); otherwise the in-flight run's future to await.
+        """
+        with self._lock:
+            fut = self._inflight.get(key)
+            if fut is None:
+                self._inflight[key] = asyncio.get_running_loop().create_future()
+                return None
+        DEDUP_HITS.inc(kind="in_flight")
+        return fut
+
+    def complete(self, key, session_id, reply, state=None):
+        hashed = _hashed(key)
+        ttl = self.text_ttl if hashed else self.ttl
+        with self._lock:
+            if hashed:
+                previous = self._latest.get(session_id)
+                if previous and previous != key:
+                    self._replies.pop(previous, None)
+                self._latest[session_id] = key
+            self._replies[key] = (reply, time.monotonic() + ttl, state, session_id)
+            self._replies.move_to_end(key)
+            while len(self._replies) > self.max_entries:
+                old_key, (_, _, _, session) = self._replies.popitem(last=False)
+                if self._latest.get(session) == old_key:
+                    del self._latest[session]
+            fut = self._inflight.pop(key, None)
+        if self.shared is not None:
+            if hashed:
+                previous = self.shared_latest.get(session_id)
+                if previous and previous != key:
+                    self.shared.delete(previous)
+                self.shared_latest.set(session_id, key)
+            self.shared.set(key, {"reply": reply, "state": state}, ttl=ttl)
+        if fut is not None and not fut.done():
+            fut.set_result(reply)
+
+    def release(self, key, error=None):
+        """Owner finished without a reply (error / client went away): fail any waiters."""
+        with self._lock:
+            fut = self._inflight.pop(key, None)
+        if fut is not None and not fut.done():
+            fut.set_exception(error or RuntimeError("original request did not complete"))
+            fut.exception()   # mark retrieved: there may be no waiters
+
+
+chat_dedup = IdempotencyCache()
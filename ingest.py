@@ -0,0 +1,308 @@
+# ingest.py
+# Upload normalisation: every salary slip is stored as one canonical, compact
+# PDF (document_registry.slip_path), whatever was uploaded.
+#
+#   format     sniffed from the bytes (the filename and content type are not
+#              trusted): PDF, JPEG, PNG, WebP, TIFF; anything else is rejected
+#   images     EXIF rotation applied, grayscale, long side <= INGEST_IMAGE_PX,
+#              JPEG (quality INGEST_JPEG_QUALITY) wrapped in a one-page PDF.
+#              Phone photos are decoded at reduced size (JPEG draft mode)
+#              instead of at full resolution.
+#   PDFs       first INGEST_MAX_PAGES pages; attachments, embedded files,
+#              JavaScript, thumbnails, metadata and form state removed; page
+#              images above MAX_IMAGE_DPI resampled to IMAGE_DPI grayscale;
+#              objects deduplicated and compressed
+#   size       uploads over INGEST_MAX_UPLOAD_BYTES are rejected; a normalised
+#              PDF still over INGEST_MAX_BYTES is rasterised (pages as grayscale
+#              JPEGs, like a scan)
+#
+# The artifact is written atomically, so extraction never reads a partial file.
+# A slip without a text layer (photo, scan) is OCR'd (payslip_ocr.py); one with
+# text goes to the LLM (salary_handling.py).
+#
+#   python ingest.py bench --docs 12      # disk and OCR time: raw uploads vs normalised artifacts
+import argparse
+import io
+import os
+import tempfile
+import time
+
+import fitz  # pymupdf
+from PIL import Image, ImageOps
+
+from telemetry import counter, get_logger, histogram
+
+INGEST_MAX_UPLOAD_BYTES = int(os.getenv("INGEST_MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+INGEST_MAX_BYTES = int(os.getenv("INGEST_MAX_BYTES", str(2 * 1024 * 1024)))
+INGEST_IMAGE_PX = int(os.getenv("INGEST_IMAGE_PX", "2200"))
+INGEST_JPEG_QUALITY = int(os.getenv("INGEST_JPEG_QUALITY", "75"))
+INGEST_MAX_PAGES = int(os.getenv("INGEST_MAX_PAGES", "5"))
+IMAGE_DPI = 200       # physical size given to image pages (A4 photo at 2200 px ~ A4 page)
+MAX_IMAGE_DPI = 250   # PDF page images above this are resampled to IMAGE_DPI
+
+log = get_logger("ingest")
+INGEST_SECONDS = histogram("loanbot_ingest_seconds", "Upload normalisation time")
+INGESTED = counter("loanbot_ingest_total", "Uploads by detected format and outcome")
+INGEST_BYTES = counter("loanbot_ingest_bytes_total", "Upload bytes received / stored")
+
+
+class UnsupportedUpload(ValueError):
+    """Not a readable PDF or image, or too large: /upload answers 4xx."""
+
+    def __init__(self, message, status=415):
+        super().__init__(message)
+        self.status = status
+
+
+def sniff_format(head):
+    """Real format of an upload from its first bytes: pdf | jpeg | png | webp | tiff, or None."""
+    if b"%PDF-" in head[:1024]:   # the spec allows junk before the header
+        return "pdf"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return "tiff"
+    return None
+
+
+def _image_pdf(pages):
+    """One PDF page per (JPEG bytes, width px, height px), sized at IMAGE_DPI."""
+    doc = fitz.open()
+    for jpeg, w, h in pages:
+        page = doc.new_page(width=w * 72 / IMAGE_DPI, height=h * 72 / IMAGE_DPI)
+        page.insert_image(page.rect, stream=jpeg)   # stored as-is (DCT), not re-encoded
+    data = doc.tobytes(garbage=4, deflate=True)
+    doc.close()
+    return data
+
+
+def _jpeg(img):
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=INGEST_JPEG_QUALITY, optimize=True)
+    return buf.getvalue()
+
+
+def normalize_image(data):
+    img = Image.open(io.BytesIO(data))
+    if img.format == "JPEG":
+        img.draft("L", (INGEST_IMAGE_PX, INGEST_IMAGE_PX))   # DCT-domain downscale while decoding
+    img = ImageOps.exif_transpose(img)
+    if img.mode in ("P", "LA", "RGBA"):   # transparent background -> white, not black
+        img = img.convert("RGBA")
+        img = Image.alpha_composite(Image.new("RGBA", img.size, "white"), img)
+    img = img.convert("L")
+    img.thumbnail((INGEST_IMAGE_PX, INGEST_IMAGE_PX), Image.LANCZOS)
+    return _image_pdf([(_jpeg(img), img.width, img.height)])
+
+
+def _rasterize(doc):
+    """Pages as grayscale JPEGs: bounds a PDF whose content is too large to keep."""
+    pages = []
+    for page in doc:
+        zoom = min(IMAGE_DPI / 72, INGEST_IMAGE_PX / max(page.rect.width, page.rect.height))
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+        pages.append((pix.tobytes("jpeg", jpg_quality=INGEST_JPEG_QUALITY), pix.width, pix.height))
+    return _image_pdf(pages)
+
+
+def _downsample_images(doc):
+    """Page images above MAX_IMAGE_DPI (as placed) -> IMAGE_DPI grayscale JPEG, in place."""
+    done = set()
+    for page in doc:
+        for item in page.get_images(full=True):
+            xref, smask, width, height = item[:4]
+            if xref in done or smask:   # masked images keep their alpha
+                continue
+            done.add(xref)
+            bbox = page.get_image_bbox(item)   # from the content stream: no decode (get_image_info decodes)
+            if bbox.is_empty or bbox.is_infinite:
+                continue
+            dpi = width / (bbox.width / 72)
+            if dpi <= MAX_IMAGE_DPI:
+                continue
+            raw = doc.extract_image(xref)
+            if not raw:
+                continue
+            size = (max(1, round(width * IMAGE_DPI / dpi)), max(1, round(height * IMAGE_DPI / dpi)))
+            img = Image.open(io.BytesIO(raw["image"]))
+            if img.format == "JPEG":
+                img.draft("L", size)
+            img = img.convert("L").resize(size, Image.LANCZOS)
+            page.replace_image(xref, stream=_jpeg(img))
+
+
+def normalize_pdf(data):
+    try:
+        doc = fitz.open(stream=data, filetype="pdf")
+    except Exception as e:
+        raise UnsupportedUpload(f"unreadable PDF: {e}")
+    try:
+        if doc.needs_pass:
+            raise UnsupportedUpload("password-protected PDF")
+        if doc.page_count < 1:
+            raise UnsupportedUpload("PDF has no pages")
+        if doc.page_count > INGEST_MAX_PAGES:
+            doc.select(range(INGEST_MAX_PAGES))
+        # hidden text stays: it is the text layer of OCR'd scans
+        doc.scrub(attached_files=True, embedded_files=True, javascript=True, metadata=True, thumbnails=True,
+                  xml_metadata=True, reset_fields=True, remove_links=True, hidden_text=False, redactions=False)
+        _downsample_images(doc)
+        out = doc.tobytes(garbage=4, deflate=True, clean=True)
+        if len(out) > INGEST_MAX_BYTES:
+            out = _rasterize(doc)
+        return out
+    finally:
+        doc.close()
+
+
+def normalize(data):
+    """(canonical PDF bytes, detected format) for an upload's bytes."""
+    fmt = sniff_format(data[:1024])
+    if fmt is None:
+        raise UnsupportedUpload("unsupported file type: upload a PDF or an image (JPEG, PNG, WebP, TIFF)")
+    if fmt == "pdf":
+        return normalize_pdf(data), fmt
+    try:
+        return normalize_image(data), fmt
+    except UnsupportedUpload:
+        raise
+    except Exception as e:   # truncated / corrupt image, decompression bomb
+        raise UnsupportedUpload(f"unreadable {fmt} image: {e}")
+
+
+def _read_bounded(file_obj):
+    data = file_obj.read(INGEST_MAX_UPLOAD_BYTES + 1)
+    if len(data) > INGEST_MAX_UPLOAD_BYTES:
+        raise UnsupportedUpload(f"file larger than {INGEST_MAX_UPLOAD_BYTES // (1024 * 1024)} MB", status=413)
+    if not data:
+        raise UnsupportedUpload("empty file", status=400)
+    return data
+
+
+def _write_atomic(path, data):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, 0o644)   # mkstemp's 0600 -> what open() would have created
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def ingest_upload(file_obj, path):
+    """Normalise an uploaded file object into the canonical artifact at path; returns a summary dict."""
+    t0 = time.perf_counter()
+    data = _read_bounded(file_obj)
+    try:
+        out, fmt = normalize(data)
+    except UnsupportedUpload:
+        INGESTED.inc(format=sniff_format(data[:1024]) or "unknown", outcome="rejected")
+        raise
+    _write_atomic(path, out)
+    elapsed = time.perf_counter() - t0
+    INGEST_SECONDS.observe(elapsed)
+    INGESTED.inc(format=fmt, outcome="stored")
+    INGEST_BYTES.inc(len(data), direction="received")
+    INGEST_BYTES.inc(len(out), direction="stored")
+    summary = {"format": fmt, "received_bytes": len(data), "stored_bytes": len(out),
+               "ms": round(elapsed * 1000, 1)}
+    log.info("ingest.stored", path=path, **summary)
+    return summary
+
+
+# ----------------------------------------------------------
+# CLI
+# ----------------------------------------------------------
+def _raw_uploads(slips, out_dir):
+    """What customers send: phone photos, screenshots and scanner PDFs of the corpus slips."""
+    import numpy as np
+
+    uploads = []
+    for i, slip in enumerate(slips):
+        kind = ("photo", "screenshot", "scan_pdf")[i % 3]
+        with fitz.open(slip["path"]) as doc:
+            page = doc[0]
+            if kind == "photo":   # 12 MP colour camera shot: warm tint, sensor noise, q95
+                pix = page.get_pixmap(matrix=fitz.Matrix(4000 / page.rect.height, 4000 / page.rect.height))
+                arr = np.frombuffer(pix.samples, np.uint8).reshape(pix.height, pix.width, pix.n).astype(np.int16)
+                arr = arr * np.array([1.0, 0.95, 0.85]) + np.random.default_rng(i).normal(0, 6, arr.shape)
+                img = Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8))
+                path = os.path.join(out_dir, f"upload_{i:03d}.jpg")
+                img.save(path, "JPEG", quality=95)
+            elif kind == "screenshot":   # 2x RGB PNG
+                path = os.path.join(out_dir, f"upload_{i:03d}.png")
+                page.get_pixmap(matrix=fitz.Matrix(2, 2)).save(path)
+            else:   # 600 dpi colour scan of every page, with the scanner's metadata and thumbnails
+                scan = fitz.open()
+                for p in doc:
+                    pix = p.get_pixmap(matrix=fitz.Matrix(600 / 72, 600 / 72))
+                    new = scan.new_page(width=p.rect.width, height=p.rect.height)
+                    new.insert_image(new.rect, stream=pix.tobytes("jpeg", jpg_quality=92))
+                scan.set_metadata({"producer": "ScanSoft 3000", "title": "scan"})
+                path = os.path.join(out_dir, f"upload_{i:03d}.pdf")
+                scan.save(path)
+                scan.close()
+        uploads.append({**slip, "upload": path, "kind": kind})
+    return uploads
+
+
+def _ocr_seconds(path):
+    from payslip_ocr import salary_from_file
+
+    source_type = "pdf" if path.endswith(".pdf") else "image"
+    t0 = time.perf_counter()
+    val, _ = salary_from_file(path, source_type)
+    return time.perf_counter() - t0, val
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload normalisation: disk and OCR time before / after")
+    parser.add_argument("command", choices=["bench"])
+    parser.add_argument("--docs", type=int, default=12)
+    parser.add_argument("--corpus-dir", default="/tmp/payslips")
+    parser.add_argument("--out-dir", default="/tmp/ingest_bench")
+    args = parser.parse_args()
+
+    from ocr_engine import ocr_engine
+    from payslip_corpus import build_corpus
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    slips = [s for s in build_corpus(args.corpus_dir, max(args.docs, 40)) if not s["scanned"]][:args.docs]
+    uploads = _raw_uploads(slips, args.out_dir)
+    ocr_engine.warm()
+    rows = {}
+    for u in uploads:
+        raw_s, raw_val = _ocr_seconds(u["upload"])
+        artifact = os.path.join(args.out_dir, f"slip_{os.path.basename(u['upload'])}.pdf")
+        with open(u["upload"], "rb") as f:
+            summary = ingest_upload(f, artifact)
+        norm_s, norm_val = _ocr_seconds(artifact)
+        r = rows.setdefault(u["kind"], {"n": 0, "raw_bytes": 0, "stored_bytes": 0, "raw_s": 0.0, "norm_s": 0.0,
+                                        "ingest_s": 0.0, "raw_ok": 0, "norm_ok": 0})
+        r["n"] += 1
+        r["raw_bytes"] += summary["received_bytes"]
+        r["stored_bytes"] += summary["stored_bytes"]
+        r["raw_s"] += raw_s
+        r["norm_s"] += norm_s
+        r["ingest_s"] += summary["ms"] / 1000
+        r["raw_ok"] += raw_val == u["net_pay"]
+        r["norm_ok"] += norm_val == u["net_pay"]
+    print(f"{'upload':<11} {'n':>2} {'raw KB':>8} {'stored KB':>9} {'ingest ms':>9} {'OCR ms raw':>10} "
+          f"{'OCR ms stored':>13} {'correct raw/stored':>18}")
+    for kind, r in rows.items():
+        n = r["n"]
+        print(f"{kind:<11} {n:>2} {r['raw_bytes'] / n / 1024:>8.0f} {r['stored_bytes'] / n / 1024:>9.0f} "
+              f"{r['ingest_s'] / n * 1000:>9.0f} {r['raw_s'] / n * 1000:>10.0f} {r['norm_s'] / n * 1000:>13.0f} "
+              f"{r['raw_ok']:>8}/{r['norm_ok']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+# intent_classifier.py
+# Local intent classifier for master_node's fallback controller.
+# Rules first (phone numbers, "uploaded", "my name is X from Y" with a valid
+# name and city), then a
+# TF-IDF + multinomial logistic regression model shipped as intent_model.json.
+# The LLM tool-selection prompt is only used below INTENT_THRESHOLD.
+#
+#   python intent_classifier.py train      # intent_training.jsonl -> intent_model.json
+#   python intent_classifier.py report     # fallback rate / latency over chat_history.db
+#   python intent_classifier.py predict "send the sanction letter again"
+import argparse
+import json
+import math
+import os
+import random
+import re
+import sqlite3
+import time
+
+MODEL_FILE = "intent_model.json"
+TRAINING_FILE = "intent_training.jsonl"
+INTENT_THRESHOLD = float(os.getenv("INTENT_THRESHOLD", "0.6"))
+
+# intent -> fallback-controller decision (same shape as the LLM's JSON reply)
+INTENT_ACTIONS = {
+    "verify": {"tool": "verify", "next_step": "verifying",
+               "assistant_reply": "Let me verify that number for you."},
+    "register": {"tool": "register", "next_step": "sales",
+                 "assistant_reply": "Thanks! Let me register you."},
+    "underwrite": {"tool": "underwrite", "next_step": "underwriting",
+                   "assistant_reply": "Let me re-check your application."},
+    "create_pdf": {"tool": "create_pdf", "next_step": "done",
+                   "assistant_reply": "Here's your sanction letter again."},
+    "apply": {"tool": None, "next_step": "waiting_for_phone",
+              "assistant_reply": "Sure! Please share your **10-digit phone number** to start a new application."},
+    "goodbye": {"tool": None, "next_step": "done",
+                "assistant_reply": "Thank you for choosing Tata Capital! Feel free to come back anytime. 😊"},
+    "chitchat": {"tool": None, "next_step": "greet",
+                 "assistant_reply": ("I'm here to help with personal loans — type **offers** to see current deals, "
+                                     "or share your **10-digit phone number** to apply.")},
+}
+
+_PHONE_RE = re.compile(r"(?<!\d)(?:\+?91[\s-]?)?([6-9]\d{9})(?!\d)")
+# "i am ... in ..." is too common ("i am looking for a loan in mumbai"): only "my name is"
+_REGISTER_RE = re.compile(
+    r"my name is\s+([a-z][a-z .'-]{1,40}?)\s*,?\s+"
+    r"(?:from|in|and i (?:live|stay) in|city)\s+([a-z][a-z .-]{1,30}?)\s*\.?$"
+)
+_UPLOAD_PHRASES = {"uploaded", "i uploaded", "file uploaded", "uploaded here", "upload done", "done upload"}
+_TOKEN_RE = re.compile(r"[a-z']+|\d+")
+
+
+# ----------------------------------------------------------
+# Features
+# ----------------------------------------------------------
+def _tokens(text):
+    toks = []
+    for t in _TOKEN_RE.findall((text or "").lower()):
+        if t.isdigit():
+            t = "<phone>" if len(t) == 10 else "<num>"
+        toks.append(t)
+    return toks + [f"{a}_{b}" for a, b in zip(toks, toks[1:])]
+
+
+def _tfidf(tokens, idf):
+    tf = {}
+    for t in tokens:
+        if t in idf:
+            tf[t] = tf.get(t, 0) + 1
+    vec = {t: c * idf[t] for t, c in tf.items()}
+    norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+    return {t: v / norm for t, v in vec.items()}
+
+
+def _softmax(scores):
+    m = max(scores)
+    exps = [math.exp(s - m) for s in scores]
+    total = sum(exps)
+    return [e / total for e in exps]
+
+
+# ----------------------------------------------------------
+# Model
+# ----------------------------------------------------------
+class IntentModel:
+    def __init__(self, labels, idf, weights, bias):
+        self.labels = labels
+        self.idf = idf
+        self.weights = weights   # term -> [w per label]
+        self.bias = bias
+
+    @classmethod
+    def load(cls, path=MODEL_FILE):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["labels"], data["idf"], data["weights"], data["bias"])
+
+    def save(self, path=MODEL_FILE):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "labels": self.labels, "idf": self.idf,
+                       "weights": self.weights, "bias": self.bias}, f, indent=0, sort_keys=True)
+
+    def predict_proba(self, text):
+        vec = _tfidf(_tokens(text), self.idf)
+        scores = list(self.bias)
+        for t, v in vec.items():
+            for k, w in enumerate(self.weights.get(t, ())):
+                scores[k] += v * w
+        return dict(zip(self.labels, _softmax(scores)))
+
+    @classmethod
+    def train(cls, examples, epochs=80, lr=0.5, l2=1e-4, seed=13):
+        labels = sorted({y for _, y in examples})
+        docs = [_tokens(x) for x, _ in examples]
+
+        # smoothed idf over training docs
+        df = {}
+        for toks in docs:
+            for t in set(toks):
+                df[t] = df.get(t, 0) + 1
+        n = len(docs)
+        idf = {t: round(math.log((1 + n) / (1 + c)) + 1, 6) for t, c in df.items()}
+
+        X = [_tfidf(toks, idf) for toks in docs]
+        Y = [labels.index(y) for _, y in examples]
+        W = {t: [0.0] * len(labels) for t in idf}
+        b = [0.0] * len(labels)
+
+        rng = random.Random(seed)
+        order = list(range(n))
+        for _ in range(epochs):
+            rng.shuffle(order)
+            for i in order:
+                x, y = X[i], Y[i]
+                scores = list(b)
+                for t, v in x.items():
+                    for k, w in enumerate(W[t]):
+                        scores[k] += v * w
+                p = _softmax(scores)
+                for k in range(len(labels)):
+                    g = p[k] - (1.0 if k == y else 0.0)
+                    b[k] -= lr * g
+                    for t, v in x.items():
+                        W[t][k] -= lr * (g * v + l2 * W[t][k])
+
+        weights = {t: [round(w, 5) for w in ws] for t, ws in W.items()}
+        return cls(labels, idf, weights, [round(v, 5) for v in b])
+
+
+_MODEL = None
+
+def _model():
+    global _MODEL
+    if _MODEL is None:
+        _MODEL = IntentModel.load(MODEL_FILE) if os.path.exists(MODEL_FILE) else False
+    return _MODEL
+
+
+def _registration(low):
+    """(name, city) from "my name is X from Y", if both read as a name and a city; else None."""
+    from master_agent import _is_probable_city, _is_probable_name, _looks_like_amount_or_noise
+
+    reg = _REGISTER_RE.search(low)
+    if not reg:
+        return None
+    name, city = reg.group(1).strip().title(), reg.group(2).strip().title()
+    if (_looks_like_amount_or_noise(name) or not _is_probable_name(name)
+            or _looks_like_amount_or_noise(city) or not _is_probable_city(city)):
+        return None
+    return name, city
+
+
+# ----------------------------------------------------------
+# Public API
+# ----------------------------------------------------------
+def classify_intent(text: str, history: str = "") -> dict:
+    """
+    Returns {"intent", "confidence", "source", "assistant_reply", "tool", "tool_args", "next_step"}.
+    `history` is the conversation string (used to refuse letters that were never approved).
+    """
+    raw = (text or "").strip()
+    low = raw.lower()
+    intent, confidence, source, tool_args = "chitchat", 0.0, "none", {}
+
+    phone = _PHONE_RE.search(raw)
+    reg = None if phone else _registration(low)
+    if phone:
+        intent, confidence, source = "verify", 1.0, "rule"
+        tool_args = {"phone": phone.group(1)}
+    elif low in _UPLOAD_PHRASES:
+        intent, confidence, source = "underwrite", 1.0, "rule"
+    elif reg:
+        intent, confidence, source = "register", 0.95, "rule"
+        tool_args = {"name": reg[0], "city": reg[1]}
+    elif _model():
+        probs = _model().predict_proba(raw)
+        intent = max(probs, key=probs.get)
+        confidence, source = probs[intent], "model"
+
+    action = dict(INTENT_ACTIONS[intent])
+
+    # a model-predicted "register" has no name/city -> ask for the name instead
+    if intent == "register" and not tool_args.get("name"):
+        action = {"tool": None, "next_step": "get_name", "assistant_reply": "Sure! What is your **Full Name**?"}
+
+    # never re-issue a letter unless this conversation saw an approval
+    if intent == "create_pdf" and "[approval]" not in history.lower() and "loan approved" not in history.lower():
+        confidence = 0.0
+
+    return {"intent": intent, "confidence": round(confidence, 4), "source": source,
+            "tool_args": tool_args, **action}
+
+
+# ----------------------------------------------------------
+# CLI: train / report / predict
+# ----------------------------------------------------------
+def _load_examples(path=TRAINING_FILE):
+    with open(path, "r", encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return [(r["text"], r["intent"]) for r in rows]
+
+
+def _train(args):
+    examples = _load_examples(args.data)
+    model = IntentModel.train(examples)
+    model.save(args.out)
+    hits = sum(1 for x, y in examples
+               if max(model.predict_proba(x).items(), key=lambda kv: kv[1])[0] == y)
+    print(f"trained on {len(examples)} examples, {len(model.idf)} terms -> {args.out}")
+    print(f"training accuracy: {hits / len(examples):.1%}")
+
+
+def _report(args):
+    conn = sqlite3.connect(args.db)
+    rows = conn.execute("SELECT session_id, sender_type, content FROM messages ORDER BY session_id, id").fetchall()
+    conn.close()
+
+    # "reaches fallback": turns after a terminal reply (step == done), minus the
+    # global interrupts master_node handles before the fallback controller
+    terminal = ("[approval]", "[rejection]", "application rejected", "sanction letter generated")
+    interrupts = ("reset", "restart", "cancel", "offer")
+
+    stats = {"all": [0, 0], "fallback_path": [0, 0]}  # [messages, sent to LLM]
+    latencies, by_intent = [], {}
+    prev_session, prev_ai = None, ""
+    for session_id, sender, content in rows:
+        if session_id != prev_session:
+            prev_session, prev_ai = session_id, ""
+        if sender != "human":
+            prev_ai = (content or "").lower()
+            continue
+
+        t0 = time.perf_counter()
+        res = classify_intent(content)
+        latencies.append(time.perf_counter() - t0)
+        to_llm = res["confidence"] < args.threshold
+
+        buckets = ["all"]
+        low = (content or "").lower()
+        if any(m in prev_ai for m in terminal) and not any(w in low for w in interrupts):
+            buckets.append("fallback_path")
+            if not to_llm:
+                by_intent[res["intent"]] = by_intent.get(res["intent"], 0) + 1
+        for b in buckets:
+            stats[b][0] += 1
+            stats[b][1] += int(to_llm)
+
+    if not latencies:
+        print("no human messages found")
+        return
+    latencies.sort()
+    p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1e6
+    print(f"replayed {stats['all'][0]} human messages from {args.db} (threshold {args.threshold})")
+    for name, (n, llm) in stats.items():
+        if n:
+            print(f"  {name:<14} LLM fallback rate: {llm / n:.1%} ({llm}/{n})")
+    print(f"classifier latency (added per fallback turn): p50 {p(0.5):.0f}us  p95 {p(0.95):.0f}us  p99 {p(0.99):.0f}us")
+    print("fallback-path turns handled locally: " + (", ".join(f"{k}={v}" for k, v in sorted(by_intent.items())) or "none"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Intent classifier for the master_node fallback")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    t = sub.add_parser("train")
+    t.add_argument("--data", default=TRAINING_FILE)
+    t.add_argument("--out", default=MODEL_FILE)
+    r = sub.add_parser("report")
+    r.add_argument("--db", default="chat_history.db")
+    r.add_argument("--threshold", type=float, default=INTENT_THRESHOLD)
+    pr = sub.add_parser("predict")
+    pr.add_argument("text")
+    args = parser.parse_args()
+
+    if args.cmd == "train":
+        _train(args)
+    elif args.cmd == "report":
+        _report(args)
+    else:
+        print(json.dumps(classify_intent(args.text), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
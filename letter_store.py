@@ -0,0 +1,55 @@
+# letter_store.py
+# Sanction letters stored by content: the file name is the SHA-256 of exactly
+# what the letter says (its per-letter fields + LETTER_LAYOUT_VERSION), so a
+# re-approval writes a new file instead of overwriting one a client may still
+# be downloading, and an identical letter is never rendered twice.
+# database.letters maps (phone, application_id) -> digest; /letters/<digest>.pdf
+# serves the files with a strong ETag and immutable caching.
+import hashlib
+import json
+import os
+import re
+
+from pdf_generator import LETTER_LAYOUT_VERSION, _letter_fields, create_sanction_letter
+
+LETTER_DIR = "static_pdfs/letters"
+DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def application_key(amount, tenure):
+    """Default application id when the caller has none: one per set of loan terms."""
+    return f"{int(amount)}x{int(tenure)}m"
+
+
+def letter_digest(customer_name, phone, amount, emi, tenure, now, rate=None):
+    fields = _letter_fields(customer_name, phone, amount, emi, tenure, now, rate)
+    canonical = json.dumps({"layout": LETTER_LAYOUT_VERSION, **fields}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def letter_path(digest):
+    return os.path.join(LETTER_DIR, f"{digest}.pdf")
+
+
+def has_letter(digest):
+    return os.path.exists(letter_path(digest))
+
+
+def store_sanction_letter(digest, customer_name, phone, amount, emi, tenure, now, logo=None, rate=None):
+    """
+    Render the letter to letter_path(digest) unless it already exists.
+    Returns (path, rendered). The file appears atomically (temp file + rename),
+    so readers never see a partial PDF.
+    """
+    path = letter_path(digest)
+    if os.path.exists(path):
+        return path, False
+    os.makedirs(LETTER_DIR, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        create_sanction_letter(customer_name, phone, amount, emi, tenure, logo=logo, filename=tmp, now=now, rate=rate)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return path, True
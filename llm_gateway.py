@@ -0,0 +1,331 @@
+# llm_gateway.py
+# Shared wrapper around the Gemini chat clients (master_agent, salary_handling):
+# per-call deadlines, bounded retries with jitter, optional hedging and a
+# circuit breaker. Callers catch LLMUnavailable and answer deterministically.
+#
+# Each call holds an "llm" resource slot (scheduler.py) until the model call
+# itself has finished, not just until the caller stops waiting, so a timed-out
+# call still running in _CALL_POOL keeps its slot. Not getting a slot in time
+# is load, not an upstream failure: no retry, no breaker failure (LLMOverloaded).
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+from scheduler import SlotTimeout, resource
+from telemetry import counter, histogram
+
+LLM_SECONDS = histogram("loanbot_llm_call_seconds", "LLM gateway call latency incl. retries")
+LLM_CALLS = counter("loanbot_llm_calls_total", "LLM gateway calls by outcome")
+
+# ----------------------- CONFIG (env) -----------------------
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "15"))        # per attempt (s)
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "30"))      # whole call incl. retries (s)
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))           # extra attempts after the first
+LLM_BACKOFF = float(os.getenv("LLM_BACKOFF", "0.5"))       # base for exponential backoff (s)
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", "0")) # 0 = no hedged second request
+BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+
+# Local fake model server (see fake_model_server.py), e.g. http://127.0.0.1:8090
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+
+
+class LLMUnavailable(Exception):
+    """Raised when the model could not answer within the deadline / retry budget, or the breaker is open."""
+
+
+class LLMOverloaded(LLMUnavailable):
+    """No LLM slot came free within the call's budget (shed locally; the model was not asked)."""
+
+
+def make_chat_model(model="gemini-2.5-flash", temperature=0):
+    """Gemini client with its own retries disabled (the gateway owns retries)."""
+    kwargs = {"model": model, "temperature": temperature, "timeout": LLM_TIMEOUT, "max_retries": 0}
+    if GEMINI_API_ENDPOINT:
+        kwargs["transport"] = "rest"
+        kwargs["client_options"] = {"api_endpoint": GEMINI_API_ENDPOINT}
+    return ChatGoogleGenerativeAI(**kwargs)
+
+
+# ----------------------------------------------------------
+# Circuit breaker
+# ----------------------------------------------------------
+class CircuitBreaker:
+    """
+    closed    -> calls pass; `failure_threshold` consecutive failures trip it
+    open      -> calls fail fast for `reset_after` seconds
+    half_open -> one probe call; success closes, failure re-opens
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURES, reset_after=BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_after:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def abandon_probe(self):
+        """The call holding the half-open probe ended without an outcome (cancelled): let another probe run."""
+        with self._lock:
+            if self.state == "half_open":
+                self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.trips += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+# ----------------------------------------------------------
+# Latency window
+# ----------------------------------------------------------
+class LatencyTracker:
+    def __init__(self, window=1000):
+        self.samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentiles(self, pcts=(50, 95, 99)):
+        with self._lock:
+            values = sorted(self.samples)
+        if not values:
+            return {f"p{p}_ms": None for p in pcts}
+        out = {}
+        for p in pcts:
+            k = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+            out[f"p{p}_ms"] = round(values[k] * 1000, 1)
+        return out
+
+
+# ----------------------------------------------------------
+# Gateway
+# ----------------------------------------------------------
+# Attempts run here so a hung upstream call cannot hold the caller past its deadline.
+_CALL_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_POOL_SIZE", "32")), thread_name_prefix="llm")
+
+GATEWAYS = {}
+
+
+def _unstreamed(config):
+    # a hedged duplicate runs without the caller's streaming callbacks (no doubled tokens)
+    return {**(config or {}), "callbacks": []}
+
+
+class LLMGateway:
+    def __init__(self, model, name, timeout=LLM_TIMEOUT, deadline=LLM_DEADLINE,
+                 retries=LLM_RETRIES, backoff=LLM_BACKOFF, hedge_after=LLM_HEDGE_AFTER,
+                 breaker=None):
+        self.model = model
+        self.name = name
+        self.timeout = timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge_after = hedge_after or None
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+        self.counts = {"calls": 0, "ok": 0, "retries": 0, "timeouts": 0, "errors": 0, "hedged": 0,
+                       "short_circuited": 0, "shed": 0}
+        GATEWAYS[name] = self
+
+    # ---------------- helpers ----------------
+    def _backoff_delay(self, attempt):
+        # full jitter: uniform(0, base * 2^attempt), capped
+        return random.uniform(0, min(5.0, self.backoff * (2 ** attempt)))
+
+    def _start(self):
+        self.counts["calls"] += 1
+        if not self.breaker.allow():
+            self.counts["short_circuited"] += 1
+            LLM_CALLS.inc(gateway=self.name, outcome="short_circuited")
+            raise LLMUnavailable(f"{self.name}: circuit open")
+        return time.monotonic()
+
+    def _finish_ok(self, started):
+        elapsed = time.monotonic() - started
+        self.latency.add(elapsed)
+        self.counts["ok"] += 1
+        self.breaker.record_success()
+        LLM_SECONDS.observe(elapsed, gateway=self.name)
+        LLM_CALLS.inc(gateway=self.name, outcome="ok")
+
+    def _finish_failed(self, last_error):
+        self.breaker.record_failure()
+        LLM_CALLS.inc(gateway=self.name, outcome="failed")
+        raise LLMUnavailable(f"{self.name}: {last_error}")
+
+    def _finish_shed(self, e):
+        # never reached the model: says nothing about its health, but a half-open probe is given back
+        self.counts["shed"] += 1
+        self.breaker.abandon_probe()
+        LLM_CALLS.inc(gateway=self.name, outcome="shed")
+        raise LLMOverloaded(f"{self.name}: {e}") from e
+
+    def _record_attempt_error(self, e):
+        if isinstance(e, TimeoutError):
+            self.counts["timeouts"] += 1
+        else:
+            self.counts["errors"] += 1
+
+    # ---------------- sync ----------------
+    def _attempt(self, prompt, budget, config=None):
+        started = time.monotonic()
+        limiter = resource("llm")
+        if not limiter.acquire(budget):   # waiting for a slot counts against the attempt
+            raise SlotTimeout(f"no llm slot within {budget:.1f}s")
+        return self._attempt_call(prompt, budget - (time.monotonic() - started), limiter, config)
+
+    def _submit(self, prompt, limiter, config=None):
+        """Run model.invoke in the pool on a slot the caller acquired; the slot is freed when the call ends."""
+        try:
+            # the caller's context (callbacks, tracing span) follows the call into the pool
+            fut = _CALL_POOL.submit(contextvars.copy_context().run, self.model.invoke, prompt, config)
+        except BaseException:
+            limiter.release()
+            raise
+        fut.add_done_callback(lambda _: limiter.release())
+        return fut
+
+    def _attempt_call(self, prompt, budget, limiter, config=None):
+        futures = {self._submit(prompt, limiter, config)}
+        first_wait = min(budget, self.hedge_after) if self.hedge_after else budget
+        done, _ = wait(futures, timeout=first_wait, return_when=FIRST_COMPLETED)
+        if not done and self.hedge_after and budget > first_wait and limiter.acquire(0):
+            # slow attempt -> fire a hedged duplicate (only on a spare slot), take whichever answers first
+            self.counts["hedged"] += 1
+            futures.add(self._submit(prompt, limiter, _unstreamed(config)))
+            done, _ = wait(futures, timeout=budget - first_wait, return_when=FIRST_COMPLETED)
+        if not done:
+            raise TimeoutError(f"no reply within {budget:.1f}s")
+        return next(iter(done)).result()
+
+    def invoke(self, prompt, config=None):
+        """Model reply to prompt; config (tags, metadata) is passed to the model call as a RunnableConfig."""
+        started = self._start()
+        last_error = None
+        for attempt in range(self.retries + 1):
+            remaining = self.deadline - (time.monotonic() - started)
+            if remaining <= 0:
+                break
+            try:
+                response = self._attempt(prompt, min(self.timeout, remaining), config)
+                self._finish_ok(started)
+                return response
+            except SlotTimeout as e:
+                self._finish_shed(e)
+            except Exception as e:
+                last_error = e
+                self._record_attempt_error(e)
+            if attempt < self.retries:
+                self.counts["retries"] += 1
+                time.sleep(min(self._backoff_delay(attempt), max(0.0, self.deadline - (time.monotonic() - started))))
+        self._finish_failed(last_error or "deadline exceeded")
+
+    # ---------------- async ----------------
+    async def _aattempt(self, prompt, budget, config=None):
+        started = time.monotonic()
+        limiter = resource("llm")
+        if not await limiter.aacquire(budget):
+            raise SlotTimeout(f"no llm slot within {budget:.1f}s")
+        return await self._aattempt_call(prompt, budget - (time.monotonic() - started), limiter, config)
+
+    @staticmethod
+    def _spawn(coro, limiter):
+        """Task for coro on a slot the caller acquired; the slot is freed once the task has finished (or cancelled)."""
+        task = asyncio.ensure_future(coro)
+        task.add_done_callback(lambda _: limiter.release())
+        return task
+
+    async def _aattempt_call(self, prompt, budget, limiter, config=None):
+        tasks = {self._spawn(self.model.ainvoke(prompt, config), limiter)}
+        try:
+            first_wait = min(budget, self.hedge_after) if self.hedge_after else budget
+            done, _ = await asyncio.wait(tasks, timeout=first_wait, return_when=asyncio.FIRST_COMPLETED)
+            if not done and self.hedge_after and budget > first_wait and limiter.acquire(0):
+                self.counts["hedged"] += 1
+                tasks.add(self._spawn(self.model.ainvoke(prompt, _unstreamed(config)), limiter))
+                done, _ = await asyncio.wait(tasks, timeout=budget - first_wait, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError(f"no reply within {budget:.1f}s")
+            return next(iter(done)).result()
+        finally:
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
+
+    async def ainvoke(self, prompt, config=None):
+        started = self._start()
+        try:
+            return await self._ainvoke(prompt, started, config)
+        except asyncio.CancelledError:
+            # client disconnect / caller deadline: no outcome, but a half-open probe must not stay taken
+            self.breaker.abandon_probe()
+            raise
+
+    async def _ainvoke(self, prompt, started, config=None):
+        last_error = None
+        for attempt in range(self.retries + 1):
+            remaining = self.deadline - (time.monotonic() - started)
+            if remaining <= 0:
+                break
+            try:
+                response = await self._aattempt(prompt, min(self.timeout, remaining), config)
+                self._finish_ok(started)
+                return response
+            except SlotTimeout as e:
+                self._finish_shed(e)
+            except Exception as e:
+                last_error = e
+                self._record_attempt_error(e)
+            if attempt < self.retries:
+                self.counts["retries"] += 1
+                await asyncio.sleep(min(self._backoff_delay(attempt), max(0.0, self.deadline - (time.monotonic() - started))))
+        self._finish_failed(last_error or "deadline exceeded")
+
+    # ---------------- reporting ----------------
+    def stats(self):
+        return {
+            "breaker": self.breaker.state,
+            "breaker_trips": self.breaker.trips,
+            **self.counts,
+            **self.latency.percentiles(),
+        }
+
+
+def gateway_stats():
+    return {name: gw.stats() for name, gw in GATEWAYS.items()}
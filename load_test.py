@@ -0,0 +1,302 @@
+# load_test.py
+# Offline load test: scripted customer journeys against /chat and /upload with
+# the Gemini clients swapped for the deterministic stub (stub_llm.py).
+#
+#   python load_test.py --users 200 --concurrency 50 --latency 0.5
+#   python load_test.py --users 200 --out results/after.json --compare results/before.json
+#   python load_test.py --url http://127.0.0.1:8000      # live server (pair with fake_model_server.py)
+#
+# In-process runs use a throwaway working directory (copy of customers.json,
+# intent_model.json, static_content.json and assets/), so chat_history.db / uploads / static_pdfs
+# in the repo are never touched.
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench_utils import REPO_DIR, percentile, prepare_workdir
+
+
+# ----------------------------------------------------------
+# Journeys: (step label, message or UPLOAD, expected substring in the reply)
+# {phone} is filled per virtual user; "phone" templates take the user index,
+# so journeys that register or upload never share a phone (uploads/<phone>_...).
+# ----------------------------------------------------------
+UPLOAD = object()
+LETTER = object()   # follow the sanction-letter link in the previous reply until the PDF arrives
+_DOC_LINK_RE = re.compile(r"/documents/[0-9a-f]+")
+
+JOURNEYS = {
+    # pre-approved customer, amount within limit -> instant approval + letter
+    "known_customer": {
+        "phone": "9999999991",
+        "steps": [
+            ("small_talk", "what can you help me with today", ""),
+            ("verify", "{phone}", "KYC Verification Successful"),
+            ("amount_purpose", "2 lakh for wedding", "[LOAN_SUMMARY]"),
+            ("confirm", "yes", "Loan Approved"),
+            ("letter", LETTER, ""),
+        ],
+    },
+    # unknown phone -> name -> city -> amount -> approval
+    "registration": {
+        "phone": "80{n:08d}",
+        "steps": [
+            ("intent", "i want a personal loan", "phone number"),
+            ("verify", "{phone}", "Full Name"),
+            ("name", "Rahul Mehta", "Nice to meet you"),
+            ("city", "Pune", "Registration Complete"),
+            ("amount_purpose", "1 lakh for medical", "[LOAN_SUMMARY]"),
+            ("confirm", "yes", "Loan Approved"),
+            ("letter", LETTER, ""),
+        ],
+    },
+    # amount above 2x limit -> counter-offer -> accept counter-offer
+    "soft_reject": {
+        "phone": "9999999993",
+        "steps": [
+            ("verify", "{phone}", "KYC Verification Successful"),
+            ("amount_purpose", "15 lakh for home renovation", "[LOAN_SUMMARY]"),
+            ("confirm", "yes", "Alternative Offer"),
+            ("accept_offer", "yes, go ahead", "Loan Approved"),
+            ("letter", LETTER, ""),
+        ],
+    },
+    # new customer (limit 3-5 lakh), amount between 1x and 2x limit -> salary slip upload -> approval
+    "salary_slip": {
+        "phone": "70{n:08d}",
+        "steps": [
+            ("verify", "{phone}", "Full Name"),
+            ("name", "Neha Kapoor", "Nice to meet you"),
+            ("city", "Mumbai", "Registration Complete"),
+            ("amount_purpose", "5.5 lakh for education", "[LOAN_SUMMARY]"),
+            ("confirm", "yes", "salary slip"),
+            ("upload", UPLOAD, ""),
+            ("uploaded", "uploaded", "Loan Approved"),
+            ("letter", LETTER, ""),
+        ],
+    },
+}
+
+
+def _make_payslip(path, net_pay="2,50,000"):
+    from fpdf import FPDF
+
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", "", 12)
+    for line in ["ACME Industries Pvt Ltd", "Payslip for the month of March",
+                 "Basic Salary: 1,80,000", "HRA: 90,000", "Deductions: 20,000",
+                 f"Net Pay: {net_pay}"]:
+        pdf.cell(0, 10, line, 0, 1)
+    pdf.output(path)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+# ----------------------------------------------------------
+# Virtual user
+# ----------------------------------------------------------
+async def _run_journey(client, name, user_idx, payslip, samples, failures):
+    journey = JOURNEYS[name]
+    phone = journey["phone"].format(n=user_idx)
+    session_id = f"load-{name}-{user_idx}-{random.randrange(1 << 30):x}"
+    reply = ""
+
+    for label, message, expect in journey["steps"]:
+        key = f"{name}:{label}"
+        t0 = time.perf_counter()
+        try:
+            if message is UPLOAD:
+                r = await client.post("/upload", params={"phone": phone},
+                                      files={"file": ("salary_slip.pdf", payslip, "application/pdf")})
+                reply = json.dumps(r.json())
+            elif message is LETTER:
+                link = _DOC_LINK_RE.search(reply)
+                if not link:
+                    failures.append({"step": key, "expected": "document link", "got": reply[:200]})
+                    return False
+                r = await client.get(link.group(0), follow_redirects=True)
+                while r.status_code == 202:   # still rendering past the server's wait
+                    r = await client.get(link.group(0), follow_redirects=True)
+                reply = "%PDF" if r.content[:4] == b"%PDF" else r.text
+                expect = "%PDF"
+            else:
+                r = await client.post("/chat", json={"session_id": session_id,
+                                                     "message": message.format(phone=phone)})
+                reply = (r.json() or {}).get("response") or ""
+            elapsed = time.perf_counter() - t0
+        except Exception as e:
+            failures.append({"step": key, "error": repr(e)})
+            return False
+
+        samples.setdefault(key, []).append(elapsed)
+        if r.status_code != 200:
+            failures.append({"step": key, "status": r.status_code, "body": r.text[:200]})
+            return False
+        if expect and expect not in reply:
+            failures.append({"step": key, "expected": expect, "got": reply[:200]})
+            return False
+    return True
+
+
+async def run_load(client, users, concurrency, mix, payslip, start=0):
+    samples, failures = {}, []
+    names = [name for name in mix for _ in range(mix[name])]
+    sem = asyncio.Semaphore(concurrency)
+    completed = {name: 0 for name in mix}
+
+    async def one(i):
+        name = names[i % len(names)]
+        async with sem:
+            if await _run_journey(client, name, i, payslip, samples, failures):
+                completed[name] += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(start, start + users)))
+    wall = time.perf_counter() - t0
+
+    all_samples = [s for values in samples.values() for s in values]
+    steps = {}
+    for key, values in sorted(samples.items()):
+        steps[key] = {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50) * 1000, 1),
+            "p95_ms": round(percentile(values, 95) * 1000, 1),
+            "p99_ms": round(percentile(values, 99) * 1000, 1),
+            "mean_ms": round(statistics.mean(values) * 1000, 1),
+        }
+    return {
+        "wall_s": round(wall, 2),
+        "requests": len(all_samples),
+        "requests_per_s": round(len(all_samples) / wall, 1) if wall else 0.0,
+        "journeys_completed": completed,
+        "journeys_per_s": round(sum(completed.values()) / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(all_samples, 50) * 1000, 1),
+        "p95_ms": round(percentile(all_samples, 95) * 1000, 1),
+        "p99_ms": round(percentile(all_samples, 99) * 1000, 1),
+        "steps": steps,
+        "failures": failures[:50],
+        "failure_count": len(failures),
+    }
+
+
+# ----------------------------------------------------------
+# Setup: in-process app (stub LLM, temp CWD) or a live URL
+# ----------------------------------------------------------
+def _in_process_app(latency, jitter):
+    # main / mock_data resolve customers.json, uploads/, static_pdfs/ and the DB relative to CWD
+    os.environ.setdefault("GOOGLE_API_KEY", "stub")
+    from stub_llm import install_stub_llm
+    import main
+
+    install_stub_llm(latency=latency, jitter=jitter)
+    main.startup_event()
+    return main
+
+
+def _print_report(res, baseline=None):
+    print(f"{res['requests']} requests in {res['wall_s']}s -> {res['requests_per_s']} req/s, "
+          f"{res['journeys_per_s']} journeys/s | p50 {res['p50_ms']}ms p95 {res['p95_ms']}ms p99 {res['p99_ms']}ms")
+    print(f"completed: {res['journeys_completed']}  failures: {res['failure_count']}")
+    print(f"{'step':<32}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for key, s in res["steps"].items():
+        line = f"{key:<32}{s['count']:>6}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}"
+        old = (baseline or {}).get("steps", {}).get(key)
+        if old and old["p95_ms"]:
+            line += f"   p95 {(s['p95_ms'] - old['p95_ms']) / old['p95_ms']:+.0%}"
+        print(line)
+    if baseline:
+        b = baseline
+        print(f"vs baseline: req/s {b['requests_per_s']} -> {res['requests_per_s']}, "
+              f"p95 {b['p95_ms']}ms -> {res['p95_ms']}ms, p99 {b['p99_ms']}ms -> {res['p99_ms']}ms")
+    for f in res["failures"][:5]:
+        print("  failure:", f)
+
+
+async def _main(args):
+    mix = {name: int(w) for name, w in (part.split("=") for part in args.mix.split(","))}
+    unknown = set(mix) - set(JOURNEYS)
+    if unknown:
+        raise SystemExit(f"unknown journeys: {', '.join(sorted(unknown))}")
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits)
+    else:
+        app_module = _in_process_app(args.latency, args.jitter)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app_module.app), base_url="http://loadtest",
+                                   timeout=args.timeout)
+
+    payslip = _make_payslip(os.path.join(tempfile.gettempdir(), "loadtest_payslip.pdf"))
+    try:
+        async with client:
+            if args.warmup:
+                await run_load(client, args.warmup, args.concurrency, mix, payslip)
+            # measured users continue the index range so generated phones stay unique
+            return await run_load(client, args.users, args.concurrency, mix, payslip, start=args.warmup)
+    finally:
+        if not args.url:
+            app_module.shutdown_event()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test: scripted journeys against /chat and /upload")
+    parser.add_argument("--users", type=int, default=100, help="virtual users (one journey each)")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--mix", default="known_customer=4,registration=2,soft_reject=2,salary_slip=2",
+                        help="journey weights, name=weight,...")
+    parser.add_argument("--latency", type=float, default=0.3, help="stub LLM latency (s), in-process only")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--warmup", type=int, default=0, help="unrecorded users before the measured run")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--url", help="drive a running server instead of the in-process app")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--compare", help="baseline results JSON to diff against")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    out = os.path.abspath(args.out) if args.out else None
+
+    workdir = None
+    if not args.url:
+        workdir = prepare_workdir("loanbot-load-")
+        sys.path.insert(0, REPO_DIR)
+        os.chdir(workdir)
+
+    try:
+        res = asyncio.run(_main(args))
+    finally:
+        if workdir:
+            os.chdir(REPO_DIR)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    res["config"] = {k: v for k, v in vars(args).items() if k not in ("out", "compare")}
+    res["env"] = {"python": platform.python_version(), "platform": platform.platform(),
+                  "async_graph": os.getenv("ASYNC_GRAPH", "1"), "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    _print_report(res, baseline)
+
+    if out:
+        os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump(res, f, indent=2)
+        print(f"results -> {out}")
+
+
+if __name__ == "__main__":
+    main()
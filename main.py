@@ -1,16 +1,34 @@
 # main.py
+import asyncio
+import hmac
 import os
-import shutil
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import Depends, FastAPI, Header, HTTPException, Request, Response, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from help import router as help_router
+from ingest import UnsupportedUpload, ingest_upload
+from streaming import format_sse, split_structured_tags
 
 # Import Agent & DB
-from master_agent import agent_executor
+from master_agent import SESSION_STORE, agent_executor
+from llm_gateway import gateway_stats
+from document_registry import SHARED_POLL, document_registry, slip_path
+from document_service import document_service, DOC_WAIT, PUBLIC_BASE_URL
+from credit_bureau import credit_bureau
+from idempotency import chat_dedup
+from static_content import etag_matches, static_content
+from scheduler import Overloaded, turn_scheduler
+from shared_state import init_state
+from letter_store import DIGEST_RE, letter_path
+from telemetry import get_logger, profiler, render_metrics
+from warmup import warmup
 import database
 
+log = get_logger("api")
+
 app = FastAPI(title="Tata Capital Agent API")
 
 # -------------------- CORS CONFIGURATION --------------------
@@ -35,10 +53,30 @@ os.makedirs("static_pdfs", exist_ok=True)   # For sanction letter PDFs
 app.mount("/pdfs", StaticFiles(directory="static_pdfs"), name="pdfs")
 
 
+# -------------------- LOAD SHEDDING --------------------
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse(
+        {"detail": "Server busy, please retry", "reason": exc.reason},
+        status_code=429,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 # -------------------- RUN DB ON STARTUP --------------------
 @app.on_event("startup")
 def startup_event():
-    database.init_db()
+    if not os.getenv("LOANBOT_INITIALIZED"):   # gunicorn_conf.py does this once, in the master
+        database.init_db()
+        init_state()
+    document_service.start()   # letter workers load the logo before the first approval
+    warmup()
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    document_service.shutdown()
+    credit_bureau.close()
 
 
 # -------------------- REQUEST MODELS --------------------
@@ -46,88 +84,318 @@ class ChatRequest(BaseModel):
     session_id: str
     message: str
     tenure: int | None = None
+    message_id: str | None = None   # client id for retries; otherwise the text is hashed
+
+
+static_content.register("health", {"status": "OK", "agent": "Loan Bot Ready 🚀"})
 
 
 @app.get("/")
-def home():
-    return {"status": "OK", "agent": "Loan Bot Ready 🚀"}
+def home(request: Request):
+    # polled by the frontend every 30 s: pre-encoded bytes, 304 on If-None-Match
+    return static_content.response("health", request)
+
+
+@app.get("/api/offers")
+def offers(request: Request):
+    return static_content.response("offers", request)
+
+
+@app.get("/llm/stats")
+def llm_stats():
+    # per-gateway breaker state, retry/timeout counters and latency percentiles
+    return gateway_stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    # Prometheus text format: node / span / LLM latency histograms and counters
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+# -------------------- SAMPLING PROFILER --------------------
+# Operator-only: stack samples expose code paths and arguments. Disabled (404)
+# unless ADMIN_TOKEN is set; then the X-Admin-Token header must match it.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+def require_admin(x_admin_token: str = Header(default="")):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+@app.post("/debug/profiler/start", dependencies=[Depends(require_admin)])
+def profiler_start(reset: bool = True):
+    if reset:
+        profiler.reset()
+    profiler.start()
+    return {"running": profiler.running, "interval": profiler.interval}
+
+
+@app.post("/debug/profiler/stop", dependencies=[Depends(require_admin)])
+def profiler_stop():
+    profiler.stop()
+    return {"running": profiler.running, "samples": profiler.samples}
+
+
+@app.get("/debug/profiler", response_class=PlainTextResponse, dependencies=[Depends(require_admin)])
+def profiler_dump(top: int | None = None):
+    # collapsed stacks -> flamegraph.pl / speedscope
+    return PlainTextResponse(profiler.collapsed(top))
 
 
 # ==========================================================
 #                       CHAT API
 # ==========================================================
-@app.post("/chat")
-def chat_endpoint(request: ChatRequest):
+def _dedup_state(session_id):
+    """What a repeated message's reply depends on besides its text: the session's step and its slip."""
+    sess = SESSION_STORE.get(session_id) or {}
+    slip = document_registry.get(sess.get("customer_phone"))
+    return [sess.get("step"), sess.get("loan_amount"), slip and slip.uploaded_at, slip and slip.status]
+
+
+async def _chat_turn(request: ChatRequest):
+    """
+    Run one chat turn as a stream of executor events (see GraphExecutor.astream).
+    The final {"event": "result"} carries the full reply; it is saved to the DB
+    before being yielded.
+    """
     session_id = request.session_id
     user_input = (request.message or "").strip()
 
+    # --- DEDUP CHECK: retry / duplicate of a message we already answered ---
+    # Answered from the idempotency cache; the duplicate is NOT saved again.
+    key = chat_dedup.key(session_id, user_input, request.message_id)
+    state = None if request.message_id else _dedup_state(session_id)
+    duplicate = chat_dedup.get(key, state)
+    if duplicate is not None:
+        yield {"event": "result", "data": {"output": duplicate}}
+        return
+    in_flight = chat_dedup.claim(key)
+    if in_flight is not None:
+        # same message still being answered -> share that run's reply
+        yield {"event": "result", "data": {"output": await asyncio.shield(in_flight)}}
+        return
+
     try:
-        # Fetch past messages for that user-session
-        history = database.get_chat_history(session_id)
-
-        # --- DEDUP CHECK: if identical to last human message, return last AI reply ---
-        last_human = None
-        last_ai = None
-        # history assumed to be list of dicts like {"role": "human"/"ai", "content": "..."}
-        for m in reversed(history):
-            role = m.get("role") if isinstance(m, dict) else None
-            content = m.get("content") if isinstance(m, dict) else getattr(m, "content", None)
-            if not last_human and role == "human" and content is not None:
-                last_human = content.strip()
-            if not last_ai and role == "ai" and content is not None:
-                last_ai = content
-            if last_human and last_ai:
-                break
-
-        if last_human and user_input and last_human.lower() == user_input.lower():
-            # Duplicate user message — avoid re-processing.
-            # Return the last AI response (if any). Do NOT save duplicate human message.
-            if last_ai:
-                return {"response": last_ai}
-            else:
-                # No previous AI reply found — fall back to processing
-                pass
-
-        # Run Agent
-        response = agent_executor.invoke({
-            "input": user_input,
-            "chat_history": history,
-            "session_id": session_id,
-            "tenure": request.tenure or 12
-        })
-
-        bot_response = response['output']
-
-        # Save to DB (only AFTER agent produced a response)
-        database.save_message(session_id, "human", user_input)
-        database.save_message(session_id, "ai", bot_response)
+        # one turn per session at a time (history + SESSION_STORE), fair across sessions
+        async with turn_scheduler.turn(session_id):
+            # a duplicate sent to another worker may have finished while we queued
+            state = None if request.message_id else _dedup_state(session_id)
+            duplicate = chat_dedup.get(key, state)
+            if duplicate is not None:
+                chat_dedup.complete(key, session_id, duplicate, state)
+                yield {"event": "result", "data": {"output": duplicate}}
+                return
 
+            # Fetch past messages for that user-session
+            history = await run_in_threadpool(database.get_chat_history, session_id)
+
+            # Run Agent
+            async for ev in agent_executor.astream({
+                "input": user_input,
+                "chat_history": history,
+                "session_id": session_id,
+                "tenure": request.tenure or 12
+            }):
+                if ev["event"] == "result":
+                    bot_response = ev["data"]["output"]
+                    # Save to DB (only AFTER agent produced a response)
+                    await run_in_threadpool(database.save_message, session_id, "human", user_input)
+                    await run_in_threadpool(database.save_message, session_id, "ai", bot_response)
+                    chat_dedup.complete(key, session_id, bot_response,
+                                        None if request.message_id else _dedup_state(session_id))
+                yield ev
+    except Exception as e:
+        chat_dedup.release(key, e)
+        raise
+    finally:
+        chat_dedup.release(key)   # no-op once completed
+
+
+@app.post("/chat")
+async def chat_endpoint(request: ChatRequest):
+    # Compatibility wrapper: drain the streaming pipeline, return only the final reply
+    try:
+        bot_response = None
+        async for ev in _chat_turn(request):
+            if ev["event"] == "result":
+                bot_response = ev["data"]["output"]
         return {"response": bot_response}
 
+    except Overloaded:
+        raise   # -> 429 (overloaded_handler)
     except Exception as e:
-        print(f"[CHAT ERROR] {e}")
+        log.error("chat.failed", session_id=request.session_id, error=str(e), exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Server-Sent Events version of /chat:
+      node       -> graph node started / finished
+      token      -> LLM token as it arrives
+      token_reset -> the streaming call was retried: discard the tokens so far
+      loan_offer / loan_summary / approval / rejection -> structured card payloads
+      message    -> plain text part of the final reply
+      done       -> {"response": <full reply, same as /chat>}
+      error      -> {"detail": ...}
+    """
+    # shed before the 200 + stream headers go out; the turn itself queues inside
+    turn_scheduler.check_admission(request.session_id)
+
+    async def event_source():
+        try:
+            async for ev in _chat_turn(request):
+                if ev["event"] != "result":
+                    yield format_sse(ev["event"], ev["data"])
+                    continue
+                bot_response = ev["data"]["output"]
+                for event, data in split_structured_tags(bot_response):
+                    yield format_sse(event, data)
+                yield format_sse("done", {"response": bot_response})
+
+        except Overloaded as e:
+            yield format_sse("error", {"detail": "Server busy, please retry", "reason": e.reason,
+                                       "status": 429, "retry_after": e.retry_after})
+        except Exception as e:
+            log.error("chat_stream.failed", session_id=request.session_id, error=str(e), exc_info=True)
+            yield format_sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 
 # ==========================================================
 #                    SALARY SLIP UPLOAD API
 # ==========================================================
 # User uploads PDF BEFORE confirmation or when bot requests salary slip.
-# filename saved as "<phone>_salary_slip.pdf"
+# PDF or photo / image: stored as one canonical PDF, "<phone>_salary_slip.pdf" (ingest.py)
 @app.post("/upload")
 async def upload_file(phone: str, file: UploadFile = File(...)):
     try:
-        filepath = f"uploads/{phone}_salary_slip.pdf"
-        with open(filepath, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        filepath = slip_path(phone)
+        # decoding and compressing is CPU work: off the event loop
+        ingested = await run_in_threadpool(ingest_upload, file.file, filepath)
 
-        print(f"📄 [UPLOAD SUCCESS] -> {filepath}")
-        return {"status": True, "msg": "Salary Slip uploaded successfully"}
+        log.info("upload.saved", phone=phone, path=filepath)
+        # salary extraction starts now, in the background
+        slip = document_registry.record_upload(phone, filepath)
+        return {"status": True, "msg": "Salary Slip uploaded successfully", "slip": slip.to_dict(),
+                "ingest": ingested}
 
+    except UnsupportedUpload as e:
+        log.warning("upload.rejected", phone=phone, error=str(e))
+        raise HTTPException(status_code=e.status, detail=str(e))
     except Exception as e:
-        print(f"[UPLOAD ERROR] {e}")
+        log.error("upload.failed", phone=phone, error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
     
+@app.get("/uploads/{phone}/status")
+def upload_status(phone: str):
+    slip = document_registry.get(phone)
+    if slip is None:
+        raise HTTPException(status_code=404, detail="No salary slip uploaded")
+    return slip.to_dict()
+
+
+@app.get("/uploads/{phone}/events")
+async def upload_events(phone: str):
+    """
+    Server-Sent Events for one phone's salary slip:
+      slip_status        -> {"status": "uploaded" | "extracting" | "extracted" | "failed", ...}
+      underwriting_ready -> salary extracted; the chat can run underwriting
+    The stream ends after "extracted" or "failed".
+    """
+    async def event_source():
+        queue = document_registry.subscribe(phone)
+        try:
+            slip = document_registry.get(phone)
+            event = slip.to_dict() if slip else None
+            last, idle = None, 0.0
+            poll = SHARED_POLL * 5 if document_registry.shared is not None else 15
+            while True:
+                # the snapshot above may also still be queued: send each state once
+                if event is not None and (event["status"], event["updated_at"]) != last:
+                    last = (event["status"], event["updated_at"])
+                    yield format_sse("slip_status", event)
+                    if event["status"] == "extracted":
+                        yield format_sse("underwriting_ready", {"phone": phone, "salary": event["salary"]})
+                    if event["status"] in ("extracted", "failed"):
+                        return
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=poll)
+                except asyncio.TimeoutError:
+                    event, idle = None, idle + poll
+                    if document_registry.shared is not None:
+                        # extraction may be running in another worker: re-read the shared record
+                        slip = document_registry.get(phone)
+                        event = slip.to_dict() if slip else None
+                    if idle >= 15:
+                        idle = 0.0
+                        yield ": keep-alive\n\n"
+        finally:
+            document_registry.unsubscribe(phone, queue)
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ==========================================================
+#                 SANCTION LETTER DOCUMENTS
+# ==========================================================
+# Chat replies link here; the letter is rendered in the background.
+@app.get("/documents/{job_id}")
+async def get_document(job_id: str, wait: float = DOC_WAIT):
+    job = await document_service.wait(job_id, timeout=max(0.0, min(wait, DOC_WAIT)))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown document")
+    if job.status == "ready":
+        return RedirectResponse(url=f"/letters/{job.digest}.pdf", status_code=303)
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=f"Document generation failed: {job.error}")
+    return JSONResponse(job.to_dict(), status_code=202, headers={"Retry-After": "1"})
+
+
+@app.get("/documents/{job_id}/status")
+def get_document_status(job_id: str):
+    job = document_service.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown document")
+    return job.to_dict()
+
+
+# Content-addressed letters never change, so clients and proxies may cache
+# them forever; FileResponse answers Range requests (resumable downloads).
+@app.get("/letters/{digest}.pdf")
+def get_letter(digest: str, request: Request):
+    path = letter_path(digest)
+    if not DIGEST_RE.match(digest) or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Unknown letter")
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type="application/pdf", headers=headers)
+
+
+@app.get("/letters")
+def list_letters(phone: str, application_id: str = None):
+    letters = database.get_letters(phone, application_id)
+    for letter in letters:
+        letter["url"] = f"{PUBLIC_BASE_URL}/letters/{letter['digest']}.pdf"
+    return {"phone": phone, "letters": letters}
+
+
 app.include_router(help_router)
 
@@ -2,12 +2,12 @@
 # master_agent.py  (Enhanced with KYC & Sales Logic)
 # ===============================================
 
-import os, re, json, operator
+import os, re, json, operator, asyncio, contextvars, functools
+from concurrent.futures import ThreadPoolExecutor
 from typing import TypedDict, Annotated, Optional
 from dotenv import load_dotenv
 load_dotenv()
 
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
 from langgraph.graph import StateGraph, END
 
@@ -16,24 +16,69 @@ from agents import (
     underwriting_agent,
     register_agent,
     fetch_general_offers,
-    calculate_emi,
     parse_loan_amount,
     check_salary_slip_exists,
-    ANNUAL_INTEREST_RATE
+    quote_rate,
 )
 
-from pdf_generator import create_sanction_letter
-from mock_data import get_customer_by_phone, INTEREST_RATE
-from salary_handling import get_monthly_salary_from_payslip
+from llm_gateway import LLMGateway, LLMUnavailable, make_chat_model
+from intent_classifier import classify_intent, INTENT_THRESHOLD
+from telemetry import get_logger, instrument_node
+from document_registry import document_registry
+from document_service import document_service, document_link
+from mock_data import get_customer_by_phone
+from credit_bureau import credit_bureau
+from verification_checks import CHECKS, arun_check, blocking_failures, run_check
+from shared_state import kv
+from speculation import speculator
+from offer_table import OFFER_TENURE, offer_table
 
 # top of module
-SESSION_STORE = {}
+# session_id -> {customer_phone, loan_amount, step}; shared by all workers
+# when STATE_BACKEND=sqlite (see shared_state.py)
+SESSION_STORE = kv("session")
+
+log = get_logger("master_agent")
 
 
 # ----------------------------------------------------------
 # LLM
 # ----------------------------------------------------------
-llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0)
+# Gemini behind the shared gateway (deadlines, retries, circuit breaker)
+llm = LLMGateway(make_chat_model(), name="master")
+
+# Calls whose reply goes to the user word for word; only their tokens are
+# streamed (GraphExecutor.astream), never the JSON tool-selection prompt's.
+USER_REPLY_TAG = "user_reply"
+USER_REPLY_CONFIG = {"tags": [USER_REPLY_TAG]}
+
+# Deterministic replies used when the gateway raises LLMUnavailable
+SMALL_TALK_UNAVAILABLE_REPLY = (
+    "I can help you with personal loans! Share your **10-digit phone number** to check "
+    "your pre-approved offer, or type **offers** to see current deals."
+)
+FALLBACK_UNAVAILABLE_REPLY = (
+    "Sorry, I didn't quite get that. You can type **offers** to see current deals, "
+    "share your **10-digit phone number** to apply, or say **restart** to begin again."
+)
+
+# ----------------------------------------------------------
+# Async execution mode
+# ----------------------------------------------------------
+# ASYNC_GRAPH=1 (default) runs turns on async_app_graph: LLM calls are awaited,
+# blocking work (PDF rendering, salary extraction, customer file writes) goes to
+# a bounded executor instead of pinning a thread for the whole turn.
+ASYNC_GRAPH = os.getenv("ASYNC_GRAPH", "1") == "1"
+BLOCKING_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("BLOCKING_WORKERS", "8")),
+    thread_name_prefix="blocking",
+)
+
+async def run_blocking(fn, *args):
+    """Run a blocking call on BLOCKING_EXECUTOR (context vars / callbacks preserved)."""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(BLOCKING_EXECUTOR, ctx.run, functools.partial(fn, *args))
 
 # ----------------------------------------------------------
 # Agent State
@@ -49,6 +94,7 @@ class AgentState(TypedDict):
     step: str
     offered_discount: bool
     final_decision: Optional[dict]
+    verification: Annotated[dict, operator.or_]  # check name -> result; parallel branches merge here
 
 def get_history_string(messages, limit=50):
     s=""
@@ -61,7 +107,7 @@ def get_history_string(messages, limit=50):
 # Structured Response Helpers (for Frontend Card Rendering)
 # ----------------------------------------------------------
 
-def create_loan_offer_card(pre_approved_limit: int, interest_rate: float = 12, max_tenure: int = 60) -> str:
+def create_loan_offer_card(pre_approved_limit: int, interest_rate: float, max_tenure: int = 60) -> str:
     """Create structured tag for loan offer card."""
     return f'[LOAN_OFFER]{{"preApprovedLimit":{pre_approved_limit},"interestRate":{interest_rate},"maxTenure":{max_tenure}}}[/LOAN_OFFER]'
 
@@ -156,10 +202,11 @@ def _is_probable_city(text: str) -> bool:
 # ==========================================================
 # ================  MASTER CONTROLLER NODE  ================
 # ==========================================================
-def master_node(state: AgentState):
+def _master_rules(state: AgentState):
     """
-    Deterministic-first controller (no salary fields).
-    Tools: verify, register, underwrite, create_pdf
+    Deterministic part of the master controller.
+    Returns a state update, or the name of the remaining work:
+      "final_outcome" (sanction letter), "small_talk" / "fallback" (LLM calls)
     """
     # If no messages yet => friendly greeting
     if not state.get('messages'):
@@ -176,9 +223,8 @@ def master_node(state: AgentState):
     msg_raw = state['messages'][-1].content
     msg = (msg_raw or "").lower()
     step = state.get('step', 'greet')
-    history_context = get_history_string(state['messages'], limit=50)
 
-    print(f"--- MASTER: Step '{step}' | User said: {msg[:60]} ---")
+    log.info("master.step", step=step, user_said=msg[:60])
 
     # -------- Global interrupts --------
     if any(w in msg for w in ["reset", "restart", "cancel"]):
@@ -255,51 +301,11 @@ def master_node(state: AgentState):
                 "step": "waiting_for_phone"
             }
 
-        # fallback LLM for small talk
-        prompt = f"""
-You are the Master Agent for Tata Capital.
-
-PAST CONVERSATION:
-{history_context}
-
-INSTRUCTIONS:
-- Answer user's latest message politely in 1-3 sentences.
-- Use context to understand the user's intent.
-- Mention offers if appropriate.
-"""
-        response = llm.invoke(prompt)
-        text = getattr(response, "content", str(response))
-        return {"messages": [AIMessage(content=text)], "step": "greet"}
+        return "small_talk"
 
     # -------- Final outcome routing (deterministic) --------
     if step == "final_outcome":
-        decision = state.get("final_decision", {})
-        if decision.get("status") == "APPROVED":
-            pdf_path = create_sanction_letter(
-                state['customer_name'],
-                state['customer_phone'],
-                state['loan_amount'],
-                decision['new_emi'],
-                12
-            )
-            link = f"http://127.0.0.1:8000/pdfs/{os.path.basename(pdf_path)}"
-            final_msg = (
-                f"🎉 **Sanction Letter Generated!**\n\n"
-                f"✅ **Name:** {state['customer_name']}\n"
-                f"✅ **Loan Amount:** ₹{state['loan_amount']}\n"
-                f"✅ **Final EMI:** ₹{decision['new_emi']}\n\n"
-                f"[Click to Download Final Slip]({link})"
-            )
-            return {"messages": [AIMessage(content=final_msg)], "step": "done"}
-
-        if decision.get("status") == "NEEDS_DOCS":
-            return {"messages": [AIMessage(content="⚠️ Request exceeds instant limit. Please upload **Salary Slip**.")], "step": "underwriting"}
-
-        if decision.get("status") == "SOFT_REJECT":
-            fallback = decision.get('fallback_offer')
-            return {"messages": [AIMessage(content=f"We cannot approve the full amount. We can instantly approve **₹{fallback}**. Shall we proceed?")], "step": "sales"}
-
-        return {"messages": [AIMessage(content=f"Application Rejected. Reason: {decision.get('reason','Not specified')}")], "step": "done"}
+        return "final_outcome"
 
     # -------- waiting_for_phone helper --------
     if step == "waiting_for_phone":
@@ -318,7 +324,58 @@ INSTRUCTIONS:
         return {"step": step}
 
     # -------- LLM fallback controller (rare) --------
-    fallback_prompt = f"""
+    return "fallback"
+
+
+def _final_outcome_reply(state: AgentState):
+    """Deterministic final-outcome routing (may render the sanction letter)."""
+    decision = state.get("final_decision", {})
+    if decision.get("status") == "APPROVED":
+        # same terms the decision was priced at (underwrite tool stores the tenure it used)
+        job = document_service.submit_sanction_letter(
+            state['customer_name'],
+            state['customer_phone'],
+            state['loan_amount'],
+            decision['new_emi'],
+            int(state.get('loan_tenure') or 12),
+            rate=decision.get("interest_rate")
+        )
+        link = document_link(job)
+        final_msg = (
+            f"🎉 **Sanction Letter Generated!**\n\n"
+            f"✅ **Name:** {state['customer_name']}\n"
+            f"✅ **Loan Amount:** ₹{state['loan_amount']}\n"
+            f"✅ **Final EMI:** ₹{decision['new_emi']}\n\n"
+            f"[Click to Download Final Slip]({link})"
+        )
+        return {"messages": [AIMessage(content=final_msg)], "step": "done"}
+
+    if decision.get("status") == "NEEDS_DOCS":
+        return {"messages": [AIMessage(content="⚠️ Request exceeds instant limit. Please upload **Salary Slip**.")], "step": "underwriting"}
+
+    if decision.get("status") == "SOFT_REJECT":
+        fallback = decision.get('fallback_offer')
+        return {"messages": [AIMessage(content=f"We cannot approve the full amount. We can instantly approve **₹{fallback}**. Shall we proceed?")], "step": "sales"}
+
+    return {"messages": [AIMessage(content=f"Application Rejected. Reason: {decision.get('reason','Not specified')}")], "step": "done"}
+
+
+def _small_talk_prompt(history_context):
+    return f"""
+You are the Master Agent for Tata Capital.
+
+PAST CONVERSATION:
+{history_context}
+
+INSTRUCTIONS:
+- Answer user's latest message politely in 1-3 sentences.
+- Use context to understand the user's intent.
+- Mention offers if appropriate.
+"""
+
+
+def _fallback_prompt(history_context):
+    return f"""
 You are the Master Loan Agent for a bank. You are given the full conversation history below.
 
 Conversation history:
@@ -341,118 +398,216 @@ Rules (must follow):
 
 Return ONLY valid JSON.
 """
-    try:
-        response = llm.invoke(fallback_prompt)
-        llm_text = getattr(response, "content", str(response)).strip()
-        parsed = json.loads(llm_text)
-
-        # Defensive: ensure assistant_reply is string
-        assistant_reply = str(parsed.get("assistant_reply", ""))  
-        tool = parsed.get("tool")
-        tool_args = parsed.get("tool_args") or {}
-        next_step = parsed.get("next_step", state.get("step", "greet"))
-
-        tool_result = None
-
-        # ---- VERIFY TOOL ----
-        if tool == "verify":
-            phone = str(tool_args.get("phone") or state.get("customer_phone") or "")
-            tool_result = verification_agent(phone)
-            if tool_result.get("status") == "VERIFIED":
-                assistant_reply += (
-                    f"\n\n✅ Verification succeeded for {tool_result.get('name')}."
-                    f" Pre-approved: ₹{tool_result.get('limit')}."
-                )
-                next_step = "sales"
-            else:
-                assistant_reply += "\n\nℹ️ Verification failed."
-                next_step = "get_name"
-
-        # ---- REGISTER TOOL ----
-        elif tool == "register":
-            phone = str(tool_args.get("phone") or state.get("customer_phone") or "")
-            name = tool_args.get("name") or tool_args.get("customer_name") or state.get("customer_name")
-            city = tool_args.get("city", "Unknown")
+
+
+def _local_intent_decision(state: AgentState, history_context: str):
+    """
+    Fallback-controller decision from the local intent classifier, or None when
+    it is not confident enough (-> LLM tool-selection prompt).
+    """
+    decision = classify_intent(state['messages'][-1].content, history_context)
+    if decision["confidence"] < INTENT_THRESHOLD:
+        return None
+    # underwriting needs a known customer and amount in state
+    if decision["tool"] == "underwrite" and not (state.get("customer_phone") and state.get("loan_amount")):
+        return None
+    log.info("master.intent", intent=decision["intent"], source=decision["source"],
+             confidence=decision["confidence"], llm_call=False)
+    return decision
+
+
+def _apply_fallback_reply(state: AgentState, llm_text: str):
+    """Parse the fallback controller's JSON reply and run the selected backend tool."""
+    return _apply_fallback_decision(state, json.loads(llm_text))
+
+
+def _apply_fallback_decision(state: AgentState, parsed: dict):
+    """Run the tool picked by the fallback controller (LLM JSON or local intent classifier)."""
+    # Defensive: ensure assistant_reply is string
+    assistant_reply = str(parsed.get("assistant_reply", ""))  
+    tool = parsed.get("tool")
+    tool_args = parsed.get("tool_args") or {}
+    next_step = parsed.get("next_step", state.get("step", "greet"))
+
+    tool_result = None
+
+    # ---- VERIFY TOOL ----
+    if tool == "verify":
+        phone = str(tool_args.get("phone") or state.get("customer_phone") or "")
+        tool_result = verification_agent(phone)
+        if tool_result.get("status") == "VERIFIED":
+            assistant_reply += (
+                f"\n\n✅ Verification succeeded for {tool_result.get('name')}."
+                f" Pre-approved: ₹{tool_result.get('limit')}."
+            )
+            next_step = "sales"
+        else:
+            assistant_reply += "\n\nℹ️ Verification failed."
+            next_step = "get_name"
+
+    # ---- REGISTER TOOL ----
+    elif tool == "register":
+        phone = str(tool_args.get("phone") or state.get("customer_phone") or "")
+        name = tool_args.get("name") or tool_args.get("customer_name") or state.get("customer_name")
+        city = tool_args.get("city", "Unknown")
+        existing = get_customer_by_phone(phone) if phone else None
+        if not phone:
+            # registering needs the number first (an empty phone would add a junk customer)
+            assistant_reply = "Sure! Please share your **10-digit phone number** first."
+            next_step = "waiting_for_phone"
+        elif existing:
+            # already on file: never append a duplicate customer
+            tool_result = {"status": "ALREADY_REGISTERED", "name": existing.get("name")}
+            assistant_reply += f"\n\n✅ You're already registered as {existing.get('name')}."
+            next_step = "sales"
+        else:
             res = register_agent(phone, name, city)
             tool_result = res
             assistant_reply += f"\n\n✅ Registered {res.get('name')} with limit ₹{res.get('limit')}."
             next_step = "sales"
 
-        # ---- UNDERWRITE TOOL ----
-        elif tool == "underwrite":
-            phone = str(tool_args.get("phone") or state.get("customer_phone") or "")
-            amount = int(tool_args.get("amount") or state.get("loan_amount") or 0)
-            # prefer explicit tenure from tool_args, otherwise state default (12)
-            tenure = int(tool_args.get("tenure") or state.get("loan_tenure", 12))
-            uploaded = bool(tool_args.get("salary_slip_uploaded", False) or check_salary_slip_exists(phone))
-            salary = None
-            if uploaded : 
-                path = f"uploads/{phone}_salary_slip.pdf"
-                with open(path, "rb") as f:
-                    salary = get_monthly_salary_from_payslip(f)           
-            decision = underwriting_agent(phone, amount, monthly_salary=salary, tenure_months=tenure)
-            tool_result = decision
-
-            if decision.get("status") == "APPROVED":
-                assistant_reply += f"\n\n✅ Approved. EMI: ₹{decision.get('new_emi')}"
-                next_step = "final_outcome"
-            elif decision.get("status") == "NEEDS_DOCS":
-                assistant_reply += "\n\n⚠️ Income proof required. Please upload salary slip."
-                next_step = "underwriting"
-            elif decision.get("status") == "SOFT_REJECT":
-                assistant_reply += f"\n\nWe can offer ₹{decision.get('fallback_offer')} instantly."
-                next_step = "sales"
-            else:
-                assistant_reply += f"\n\nRejected. Reason: {decision.get('reason', 'N/A')}"
-                next_step = "done"
-
-        # ---- CREATE PDF TOOL ----
-        elif tool == "create_pdf":
-            phone = str(tool_args.get("phone") or state.get("customer_phone") or "")
-            name = tool_args.get("name") or state.get("customer_name")
-            amount = int(tool_args.get("amount") or state.get("loan_amount") or 0)
-            emi = tool_args.get("emi") or calculate_emi(amount, 14, state.get("loan_tenure", 12))
-            pdf_path = create_sanction_letter(name, phone, amount, emi, 12)
-            link = f"http://127.0.0.1:8000/pdfs/{os.path.basename(pdf_path)}"
-            assistant_reply += f"\n\nSanction letter ready: {link}"
+    # ---- UNDERWRITE TOOL ----
+    elif tool == "underwrite":
+        phone = str(tool_args.get("phone") or state.get("customer_phone") or "")
+        amount = int(tool_args.get("amount") or state.get("loan_amount") or 0)
+        # prefer explicit tenure from tool_args, otherwise state default (12)
+        tenure = int(tool_args.get("tenure") or state.get("loan_tenure", 12))
+        uploaded = bool(tool_args.get("salary_slip_uploaded", False) or check_salary_slip_exists(phone))
+        salary = None
+        if uploaded : 
+            salary = document_registry.salary(phone)
+        decision = underwriting_agent(phone, amount, monthly_salary=salary, tenure_months=tenure)
+        tool_result = decision
+
+        if decision.get("status") == "APPROVED":
+            assistant_reply += f"\n\n✅ Approved. EMI: ₹{decision.get('new_emi')}"
+            next_step = "final_outcome"
+        elif decision.get("status") == "NEEDS_DOCS":
+            assistant_reply += "\n\n⚠️ Income proof required. Please upload salary slip."
+            next_step = "underwriting"
+        elif decision.get("status") == "SOFT_REJECT":
+            assistant_reply += f"\n\nWe can offer ₹{decision.get('fallback_offer')} instantly."
+            next_step = "sales"
+        else:
+            assistant_reply += f"\n\nRejected. Reason: {decision.get('reason', 'N/A')}"
             next_step = "done"
 
-        # package AI response into result state
-        ai_msg = AIMessage(content=assistant_reply)
-        result_state = {"messages": [ai_msg], "step": next_step}
+    # ---- CREATE PDF TOOL ----
+    elif tool == "create_pdf":
+        phone = str(tool_args.get("phone") or state.get("customer_phone") or "")
+        name = tool_args.get("name") or state.get("customer_name")
+        amount = int(tool_args.get("amount") or state.get("loan_amount") or 0)
+        tenure = int(state.get("loan_tenure") or 12)
+        rate, quoted_emi = offer_table.quote(phone, amount, tenure)
+        emi = tool_args.get("emi") or quoted_emi
+        job = document_service.submit_sanction_letter(name, phone, amount, emi, tenure, rate=rate)
+        link = document_link(job)
+        assistant_reply += f"\n\nSanction letter ready: {link}"
+        next_step = "done"
+
+    # package AI response into result state
+    ai_msg = AIMessage(content=assistant_reply)
+    result_state = {"messages": [ai_msg], "step": next_step}
+
+    # attach tool results where relevant
+    if tool == "underwrite" and tool_result:
+        result_state["final_decision"] = tool_result
+        result_state["loan_amount"] = amount
+        result_state["loan_tenure"] = tenure
+
+    if tool in ("verify", "register") and tool_result and isinstance(tool_result, dict):
+        if tool_result.get("name"):
+            result_state["customer_name"] = (tool_args.get("name") or tool_result.get("name") or state.get("customer_name"))
+        if tool_args.get("phone"):
+            result_state["customer_phone"] = str(tool_args.get("phone"))
+
+    if tool_args.get("amount") is not None:
+        try:
+            result_state["loan_amount"] = int(tool_args.get("amount"))
+        except:
+            result_state["loan_amount"] = state.get("loan_amount", 0)
 
-        # attach tool results where relevant
-        if tool == "underwrite" and tool_result:
-            result_state["final_decision"] = tool_result
+    return result_state
 
-        if tool in ("verify", "register") and tool_result and isinstance(tool_result, dict):
-            if tool_result.get("name"):
-                result_state["customer_name"] = (tool_args.get("name") or tool_result.get("name") or state.get("customer_name"))
-            if tool_args.get("phone"):
-                result_state["customer_phone"] = str(tool_args.get("phone"))
 
-        if tool_args.get("amount") is not None:
-            try:
-                result_state["loan_amount"] = int(tool_args.get("amount"))
-            except:
-                result_state["loan_amount"] = state.get("loan_amount", 0)
+def _fallback_error_reply(e):
+    # LLM unavailable or unusable output -> deterministic clarifying reply (never echo raw model text)
+    log.warning("master.fallback_error", error=str(e))
+    return {"messages": [AIMessage(content=FALLBACK_UNAVAILABLE_REPLY)], "step": "greet"}
+
+
+def master_node(state: AgentState):
+    """
+    Deterministic-first controller (no salary fields).
+    Tools: verify, register, underwrite, create_pdf
+    """
+    plan = _master_rules(state)
+    if isinstance(plan, dict):
+        return plan
+    if plan == "final_outcome":
+        return _final_outcome_reply(state)
+
+    history_context = get_history_string(state['messages'], limit=50)
+
+    # fallback LLM for small talk
+    if plan == "small_talk":
+        try:
+            response = llm.invoke(_small_talk_prompt(history_context), USER_REPLY_CONFIG)
+            text = getattr(response, "content", str(response))
+        except LLMUnavailable as e:
+            log.warning("master.small_talk_unavailable", error=str(e))
+            text = SMALL_TALK_UNAVAILABLE_REPLY
+        return {"messages": [AIMessage(content=text)], "step": "greet"}
 
-        return result_state
+    decision = _local_intent_decision(state, history_context)
+    if decision:
+        return _apply_fallback_decision(state, decision)
 
+    try:
+        response = llm.invoke(_fallback_prompt(history_context))
+        llm_text = getattr(response, "content", str(response)).strip()
+        return _apply_fallback_reply(state, llm_text)
     except Exception as e:
-        # If LLM fallback failed, show its raw output (defensive)
+        return _fallback_error_reply(e)
+
+
+async def amaster_node(state: AgentState):
+    """Async variant of master_node: awaits the LLM, offloads letter rendering / tools."""
+    plan = _master_rules(state)
+    if isinstance(plan, dict):
+        return plan
+    if plan == "final_outcome":
+        return await run_blocking(_final_outcome_reply, state)
+
+    history_context = get_history_string(state['messages'], limit=50)
+
+    if plan == "small_talk":
         try:
-            raw_text = getattr(response, "content", str(response))
-        except Exception:
-            raw_text = str(e)
-        print("LLM fallback error:", e)
-        return {"messages": [AIMessage(content=str(raw_text))], "step": "greet"}
+            response = await llm.ainvoke(_small_talk_prompt(history_context), USER_REPLY_CONFIG)
+            text = getattr(response, "content", str(response))
+        except LLMUnavailable as e:
+            log.warning("master.small_talk_unavailable", error=str(e))
+            text = SMALL_TALK_UNAVAILABLE_REPLY
+        return {"messages": [AIMessage(content=text)], "step": "greet"}
+
+    decision = _local_intent_decision(state, history_context)
+    if decision:
+        return await run_blocking(_apply_fallback_decision, state, decision)
+
+    try:
+        response = await llm.ainvoke(_fallback_prompt(history_context))
+        llm_text = getattr(response, "content", str(response)).strip()
+        # tools may extract salary / render PDFs -> executor
+        return await run_blocking(_apply_fallback_reply, state, llm_text)
+    except Exception as e:
+        return _fallback_error_reply(e)
+
 
 # ==========================================================
 # ===============  WORKER NODES (Enhanced with KYC) ========
 # ==========================================================
 
-def verification_node(state:AgentState):
+def verify_start_node(state:AgentState):
     # Extract exactly 10 digits
     phone_match = re.findall(r"\d{10}", state['messages'][-1].content)
     if not phone_match:
@@ -466,18 +621,53 @@ def verification_node(state:AgentState):
         phone = digits
     else:
         phone = phone_match[0]
-    
-    r=verification_agent(phone)
+    # the checks (verification_checks.py) now run as parallel branches
+    return {"customer_phone": phone}
+
+def check_node(name):
+    """Graph branch running one verification check."""
+    def _node(state):
+        return {"verification": {name: run_check(name, state["customer_phone"])}}
+    _node.__name__ = f"check_{name}"
+    return _node
+
+def acheck_node(name):
+    async def _node(state):
+        return {"verification": {name: await arun_check(name, state["customer_phone"])}}
+    _node.__name__ = f"acheck_{name}"
+    return _node
 
-    if r["status"]=="VERIFIED":
+def verification_node(state:AgentState):
+    """Join of the verification stage: every check has reported (or timed out)."""
+    phone = state["customer_phone"]
+    checks = state.get("verification") or {}
+    log.info("verify.checks", phone=phone, **{name: r["status"] for name, r in checks.items()})
+
+    failed = blocking_failures(checks)
+    if failed:
+        reasons = "; ".join(r.get("reason") or name for name, r in failed)
+        return {
+            "messages": [AIMessage(content=(
+                f"❌ We couldn't verify your details ({reasons}), so we can't continue with this application. "
+                f"Please contact customer service for help."
+            ))],
+            "customer_phone": phone,
+            "step": "done"
+        }
+
+    # materialized offer record (offer_table.py): a lookup, not a rebuild;
+    # the bureau branch has already fetched (or given up on) the score
+    r = offer_table.get(phone, wait_bureau=False)
+
+    if r is not None:
         # Include address verification for KYC compliance
-        address = r.get('address', 'Address not on file')
+        address = r['address']
         
         # Add structured tag for frontend card rendering
         loan_offer_tag = create_loan_offer_card(
             pre_approved_limit=r['limit'],
-            interest_rate=INTEREST_RATE,
-            max_tenure=60
+            interest_rate=r['rate'],
+            max_tenure=r['max_tenure']
         )
         
         msg = (
@@ -485,7 +675,7 @@ def verification_node(state:AgentState):
             f"✅ **KYC Verification Successful!**\n\n"
             f"👤 **Name:** {r['name']}\n"
             f"📍 **Address on file:** {address}\n"
-            f"💳 **Credit Score:** {r.get('credit_score', 'N/A')}\n"
+            f"💳 **Credit Score:** {r['credit_score']}\n"
             f"🏦 **Pre-approved Limit:** ₹{r['limit']:,}\n\n"
             f"Congratulations! You're pre-approved for a personal loan!\n\n"
             f"Is your address correct? If yes, please tell me:\n"
@@ -563,7 +753,7 @@ def registration_city_node(state):
     # Add structured tag for frontend card rendering
     loan_offer_tag = create_loan_offer_card(
         pre_approved_limit=r['limit'],
-        interest_rate=INTEREST_RATE,
+        interest_rate=quote_rate(r['credit_score'], r['limit'], OFFER_TENURE),
         max_tenure=60
     )
 
@@ -597,13 +787,13 @@ def sales_node(state):
     
     tenure = state.get('loan_tenure', 12)
 
-    emi=calculate_emi(amt, INTEREST_RATE, tenure)
+    rate, emi = offer_table.quote(state.get("customer_phone"), amt, tenure)
     purpose = state.get('loan_purpose', '')
     
     # Add structured tag for frontend card rendering
     loan_summary_tag = create_loan_summary_card(
         amount=amt,
-        interest_rate=INTEREST_RATE,
+        interest_rate=rate,
         tenure=tenure,
         emi=emi
     )
@@ -618,7 +808,7 @@ def sales_node(state):
             f"{loan_summary_tag}\n"
             f"💰 **Loan Summary**\n\n"
             f"📊 **Amount:** ₹{amt:,}\n"
-            f"📈 **Interest Rate:** {INTEREST_RATE}% p.a.\n"
+            f"📈 **Interest Rate:** {rate}% p.a.\n"
             f"📅 **Tenure:** {tenure} months\n"
             f"💵 **Est. EMI:** ₹{emi:,.2f}/month"
             f"{purpose_msg}\n\n"
@@ -633,12 +823,60 @@ def confirmation_node(state):
     if "no" in m:return{"messages":[AIMessage(content="Enter new amount.")],"step":"sales"}
     return{"messages":[AIMessage(content="Reply **yes** to continue.")],"step":"confirm_deal"}
 
+def _decision_reply(state, phone, amt, tenure, decision, lead=()):
+    """APPROVED / SOFT_REJECT / HARD_REJECT branches shared by both underwriting paths."""
+    lead = list(lead)
+    status = decision.get("status")
+
+    # 2️⃣ Approved – generate sanction letter
+    if status == "APPROVED":
+        customer_name = state.get("customer_name") or (get_customer_by_phone(phone) or {}).get("name", "Customer")
+        # rendered on the document worker pool; the link resolves once the PDF exists
+        job = document_service.submit_sanction_letter(customer_name, phone, amt, decision["new_emi"], tenure,
+                                                      rate=decision.get("interest_rate"))
+        link = document_link(job)
+        approval_tag = create_approval_card(name=customer_name, amount=amt, emi=decision['new_emi'], pdf_link=link)
+        msg = (
+            f"{approval_tag}\n"
+            f"🎉 **Loan Approved!**\n\n"
+            f"✅ **Name:** {customer_name}\n"
+            f"✅ **Loan Amount:** ₹{amt:,}\n"
+            f"✅ **Final EMI:** ₹{decision['new_emi']:,.2f}\n\n"
+            f"📄 [Click here to download your Sanction Letter]({link})"
+        )
+        return {"messages": lead + [AIMessage(content=msg)], "final_decision": decision, "step": "done"}
+
+    # 3️⃣ Soft reject – fallback offer
+    if status == "SOFT_REJECT":
+        fallback = decision.get("fallback_offer", 0)
+        persuasion = decision.get("persuasion", "")
+        fallback_rate, fallback_emi = offer_table.quote(phone, fallback, tenure)
+        loan_summary_tag = create_loan_summary_card(amount=fallback, interest_rate=fallback_rate, tenure=tenure, emi=fallback_emi)
+        msg = (
+            f"{loan_summary_tag}\n"
+            f"I understand you were looking for ₹{amt:,}, but let me share some good news! 🌟\n\n"
+            f"{persuasion}\n\n"
+            f"📊 **Alternative Offer:**\n"
+            f"💰 **Amount:** ₹{fallback:,}\n"
+            f"💵 **EMI:** ₹{fallback_emi:,.2f}/month\n\n"
+            f"Would you like to proceed with ₹{fallback:,}? (yes/no)"
+        )
+        return {"messages": lead + [AIMessage(content=msg)], "final_decision": decision, "loan_amount": fallback, "step": "confirm_deal"}
+
+    # 4️⃣ Hard reject – show reason and finish
+    reason = decision.get("reason", "Not specified")
+    user = get_customer_by_phone(phone)
+    credit_score = credit_bureau.score(phone, user.get('credit_score')) if user else None
+    rejection_tag = create_rejection_card(reason=reason, credit_score=credit_score)
+    msg = f"{rejection_tag}\n❌ **Application Rejected**\n\nReason: {reason}"
+    return {"messages": lead + [AIMessage(content=msg)], "final_decision": decision, "step": "done"}
+
 def underwriting_node(state: AgentState):
     """
     Improved flow:
-    1. Detect upload (user "uploaded" OR file exists on disk)
+    1. Detect upload (user "uploaded" OR slip in the document registry)
     2. If uploaded -> immediately return a "Processing..." msg (visible) then:
-       - extract salary
+       - take the salary extracted in the background (waits if still running)
        - if salary extraction fails -> ask to re-upload
        - if amt missing -> tell user extracted salary and ask for loan amount (don't bail to the initial generic prompt)
        - if amt present -> run underwriting_agent and return result
@@ -648,9 +886,7 @@ def underwriting_node(state: AgentState):
     amt = state.get("loan_amount", 0)
     tenure = state.get("loan_tenure", 12)
 
-    print(phone) 
-    print(amt)
-    print(tenure)
+    log.info("underwriting.start", phone=phone, amount=amt, tenure=tenure)
 
     # read last user message to detect explicit 'uploaded'
     last_msg = ""
@@ -659,14 +895,9 @@ def underwriting_node(state: AgentState):
     ui_text = last_msg.strip().lower()
     user_says_uploaded = ui_text in {"uploaded", "i uploaded", "file uploaded", "done upload", "uploaded here"}
 
-    # check filesystem (safe)
-    file_on_disk = False
-    if phone:
-        try:
-            file_on_disk = check_salary_slip_exists(phone)
-        except Exception as e:
-            print(f"[WARN] check_salary_slip_exists error: {e}")
-            file_on_disk = False
+    # document registry (dict lookup)
+    slip = document_registry.get(phone)
+    file_on_disk = slip is not None
 
     uploaded = user_says_uploaded or file_on_disk
 
@@ -698,15 +929,17 @@ def underwriting_node(state: AgentState):
     # If there is an uploaded file -> process it first (do not early-bail on missing amt)
     if uploaded and file_on_disk:
         processing_msg = AIMessage(content="👍 Got your file. Processing your salary slip now — this may take a few seconds...")
-        # run salary extraction
-        path = f"uploads/{phone}_salary_slip.pdf"
-        with open(path, "rb") as f:
-            salary = get_monthly_salary_from_payslip(f)
+        # extraction started at upload time; wait for it if it is still running
+        salary = document_registry.salary(phone)
 
-        print(salary)
-        print(amt)
-        print(phone)
-        print(tenure)
+        log.info("underwriting.salary_extracted", phone=phone, salary=salary, status=slip.status,
+                 amount=amt, tenure=tenure)
+
+        if not salary and slip.status != "failed":
+            still_msg = AIMessage(content=(
+                "Your salary slip is still being processed. Please type `uploaded` again in a few seconds."
+            ))
+            return {"messages": [processing_msg, still_msg], "step": "underwriting", "customer_phone": phone}
 
         if not salary:
             # extraction failed, ask to re-upload
@@ -730,7 +963,9 @@ def underwriting_node(state: AgentState):
             }
 
         # If amount exists -> proceed to underwriting with salary_slip_uploaded=True
-        decision = underwriting_agent(phone, amt, monthly_salary=salary, tenure_months=tenure)
+        # (precomputed while the summary card was on screen, if the terms still match)
+        decision = (speculator.take(phone, amt, tenure, salary)
+                    or underwriting_agent(phone, amt, monthly_salary=salary, tenure_months=tenure))
 
         status = decision.get("status")
 
@@ -749,46 +984,7 @@ def underwriting_node(state: AgentState):
                 "step": "underwriting",
             }
 
-        # 2️⃣ Approved – generate sanction letter
-        if status == "APPROVED":
-            customer_name = state.get("customer_name") or (get_customer_by_phone(phone) or {}).get("name", "Customer")
-            pdf_path = create_sanction_letter(customer_name, phone, amt, decision["new_emi"], tenure)
-            link = f"http://127.0.0.1:8000/pdfs/{os.path.basename(pdf_path)}"
-            approval_tag = create_approval_card(name=customer_name, amount=amt, emi=decision['new_emi'], pdf_link=link)
-            msg = (
-                f"{approval_tag}\n"
-                f"🎉 **Loan Approved!**\n\n"
-                f"✅ **Name:** {customer_name}\n"
-                f"✅ **Loan Amount:** ₹{amt:,}\n"
-                f"✅ **Final EMI:** ₹{decision['new_emi']:,.2f}\n\n"
-                f"📄 [Click here to download your Sanction Letter]({link})"
-            )
-            return {"messages": [processing_msg, AIMessage(content=msg)], "final_decision": decision, "step": "done"}
-
-        # 3️⃣ Soft reject – fallback offer
-        if status == "SOFT_REJECT":
-            fallback = decision.get("fallback_offer", 0)
-            persuasion = decision.get("persuasion", "")
-            fallback_emi = calculate_emi(fallback, INTEREST_RATE, tenure)
-            loan_summary_tag = create_loan_summary_card(amount=fallback, interest_rate=INTEREST_RATE, tenure=tenure, emi=fallback_emi)
-            msg = (
-                f"{loan_summary_tag}\n"
-                f"I understand you were looking for ₹{amt:,}, but let me share some good news! 🌟\n\n"
-                f"{persuasion}\n\n"
-                f"📊 **Alternative Offer:**\n"
-                f"💰 **Amount:** ₹{fallback:,}\n"
-                f"💵 **EMI:** ₹{fallback_emi:,.2f}/month\n\n"
-                f"Would you like to proceed with ₹{fallback:,}? (yes/no)"
-            )
-            return {"messages": [processing_msg, AIMessage(content=msg)], "final_decision": decision, "loan_amount": fallback, "step": "confirm_deal"}
-
-        # 4️⃣ Hard reject – show reason and finish
-        reason = decision.get("reason", "Not specified")
-        user = get_customer_by_phone(phone)
-        credit_score = user.get('credit_score') if user else None
-        rejection_tag = create_rejection_card(reason=reason, credit_score=credit_score)
-        msg = f"{rejection_tag}\n❌ **Application Rejected**\n\nReason: {reason}"
-        return {"messages": [processing_msg, AIMessage(content=msg)], "final_decision": decision, "step": "done"}
+        return _decision_reply(state, phone, amt, tenure, decision, lead=[processing_msg])
 
     # ---------------- If NOT uploaded - original logic ----------------
     # If amount missing, ask for it (original safety)
@@ -810,7 +1006,8 @@ def underwriting_node(state: AgentState):
         }
 
     # Otherwise, if not uploaded but amount present - call underwriting without salary slip
-    decision = underwriting_agent(phone, amt , monthly_salary=None, tenure_months=tenure)
+    decision = (speculator.take(phone, amt, tenure)
+                or underwriting_agent(phone, amt , monthly_salary=None, tenure_months=tenure))
     status = decision.get("status")
 
     if status == "NEEDS_DOCS":
@@ -827,9 +1024,7 @@ def underwriting_node(state: AgentState):
             "step": "underwriting",
         }
 
-    # (Then same branches for APPROVED / SOFT_REJECT / REJECT as above)
-    # For brevity reuse the same blocks: (copy/paste the approved/soft_reject/reject blocks from above)
-    # ...
+    return _decision_reply(state, phone, amt, tenure, decision)
 
 # ==========================================================
 # ===============  LOAN PURPOSE NODE (Needs Analysis) ======
@@ -903,12 +1098,12 @@ def loan_purpose_node(state: AgentState):
     
     # If we have both, proceed to sales with personalized message
     if amt > 0 and purpose:
-        emi = calculate_emi(amt, INTEREST_RATE, 12)
+        rate, emi = offer_table.quote(state.get("customer_phone"), amt, 12)
         
         # Add structured tag for frontend card rendering
         loan_summary_tag = create_loan_summary_card(
             amount=amt,
-            interest_rate=INTEREST_RATE,
+            interest_rate=rate,
             tenure=12,
             emi=emi
         )
@@ -919,7 +1114,7 @@ def loan_purpose_node(state: AgentState):
                 f"Perfect! For your **{purpose}** needs, here's what I can offer:\n\n"
                 f"💰 **Loan Summary**\n"
                 f"📊 **Amount:** ₹{amt:,}\n"
-                f"📈 **Interest Rate:** {INTEREST_RATE}% p.a.\n"
+                f"📈 **Interest Rate:** {rate}% p.a.\n"
                 f"📅 **Tenure:** 12 months\n"
                 f"💵 **Est. EMI:** ₹{emi:,.2f}/month\n\n"
                 f"✅ Ready to proceed? (yes/no)"
@@ -941,57 +1136,150 @@ def loan_purpose_node(state: AgentState):
 
 
 # ==========================================================
-# ================ BUILD FLOW GRAPH ========================
+# ===============  ASYNC NODE VARIANTS =====================
 # ==========================================================
 
-workflow=StateGraph(AgentState)
-workflow.add_node("router",master_node)
-workflow.add_node("verifier",verification_node)
-workflow.add_node("register_name",registration_name_node)
-workflow.add_node("register_city",registration_city_node)
-workflow.add_node("loan_purpose", loan_purpose_node)  # New node for needs analysis
-workflow.add_node("sales",sales_node)
-workflow.add_node("confirmer",confirmation_node)
-workflow.add_node("underwriter",underwriting_node)
+def _inline_async(node):
+    """Pure (CPU-only, microsecond) nodes run directly on the event loop."""
+    async def _node(state):
+        return node(state)
+    _node.__name__ = f"a{node.__name__}"
+    return _node
+
+async def aregistration_city_node(state):
+    # register_agent writes customers.json
+    return await run_blocking(registration_city_node, state)
+
+async def aunderwriting_node(state: AgentState):
+    # salary extraction (PDF + LLM) and sanction-letter rendering
+    return await run_blocking(underwriting_node, state)
+
 
-workflow.set_entry_point("router")
+# ==========================================================
+# ================ BUILD FLOW GRAPH ========================
+# ==========================================================
 
 def route(state):
     s=state['step']
     if s in["greet","waiting_for_phone","done"]: return "stop"
     return s
 
-workflow.add_conditional_edges(
-    "router",route,{
-        "verifying":"verifier",
-        "get_name":"register_name",
-        "get_city":"register_city",
-        "get_loan_purpose": "loan_purpose",  # New route for loan purpose
-        "sales":"sales",
-        "confirm_deal":"confirmer",
-        "underwriting":"underwriter",
-        "final_outcome":"router",
-        "stop":END
-    }
-)
+def route_verification(state):
+    """Fan out to one branch per check once verify_start has a phone number."""
+    if state['step'] == "waiting_for_phone":
+        return END
+    return [f"check_{name}" for name in CHECKS]
+
+def build_workflow(nodes):
+    workflow=StateGraph(AgentState)
+    for name, node in nodes.items():
+        workflow.add_node(name, instrument_node(name, node))
+
+    workflow.set_entry_point("router")
+
+    workflow.add_conditional_edges(
+        "router",route,{
+            "verifying":"verify_start",
+            "get_name":"register_name",
+            "get_city":"register_city",
+            "get_loan_purpose": "loan_purpose",  # New route for loan purpose
+            "sales":"sales",
+            "confirm_deal":"confirmer",
+            "underwriting":"underwriter",
+            "final_outcome":"router",
+            "stop":END
+        }
+    )
 
-workflow.add_edge("verifier", END)
-workflow.add_edge("register_name", END)
-workflow.add_edge("register_city", END)
-workflow.add_edge("loan_purpose", END)  # New edge
-workflow.add_edge("sales", END)
-workflow.add_edge("confirmer", "router")
-workflow.add_edge("underwriter", END)
+    checks = [f"check_{name}" for name in CHECKS]
+    workflow.add_conditional_edges("verify_start", route_verification, [*checks, END])
+    workflow.add_edge(checks, "verifier")   # the join waits for every branch
+    workflow.add_edge("verifier", END)
+    workflow.add_edge("register_name", END)
+    workflow.add_edge("register_city", END)
+    workflow.add_edge("loan_purpose", END)  # New edge
+    workflow.add_edge("sales", END)
+    workflow.add_edge("confirmer", "router")
+    workflow.add_edge("underwriter", END)
+    return workflow
+
+SYNC_NODES = {
+    "router": master_node,
+    "verify_start": verify_start_node,
+    **{f"check_{name}": check_node(name) for name in CHECKS},
+    "verifier": verification_node,
+    "register_name": registration_name_node,
+    "register_city": registration_city_node,
+    "loan_purpose": loan_purpose_node,  # New node for needs analysis
+    "sales": sales_node,
+    "confirmer": confirmation_node,
+    "underwriter": underwriting_node,
+}
+
+ASYNC_NODES = {
+    "router": amaster_node,
+    "verify_start": _inline_async(verify_start_node),
+    **{f"check_{name}": acheck_node(name) for name in CHECKS},
+    "verifier": _inline_async(verification_node),
+    "register_name": _inline_async(registration_name_node),
+    "register_city": aregistration_city_node,
+    "loan_purpose": _inline_async(loan_purpose_node),
+    "sales": _inline_async(sales_node),
+    "confirmer": _inline_async(confirmation_node),
+    "underwriter": aunderwriting_node,
+}
 
+workflow=build_workflow(SYNC_NODES)
 app_graph=workflow.compile()
 
+# same topology, coroutine nodes -> ainvoke / astream_events only
+async_workflow=build_workflow(ASYNC_NODES)
+async_app_graph=async_workflow.compile()
+
 
 # ==========================================================
 # EXECUTOR WORKS SAME — no change required
 # ==========================================================
+# graph nodes reported as discrete "node" events when streaming
+GRAPH_NODES = set(workflow.nodes)
+
+_LOAN_SUMMARY_RE = re.compile(r"\[LOAN_SUMMARY\](.*?)\[/LOAN_SUMMARY\]", re.DOTALL)
+
+def infer_step_from_reply(text):
+    """
+    Step implied by an AI reply, as the executor reads it back from history
+    (None when the reply does not pin down a step). Later checks win.
+    """
+    content = text or ""
+    low = content.lower()
+    step = None
+    if (
+        ("sanction letter" in low and "download" in low)
+        or ("congratulations" in low and "approved" in low)
+        or "[approval]" in low
+        or "application rejected" in low
+        or "[rejection]" in low
+    ):
+        step = "done"
+
+    if _LOAN_SUMMARY_RE.search(content) or "loan summary" in low or "est. emi" in low:
+        step = "confirm_deal"
+
+    # both replies also say "Congratulations! You're pre-approved", which reads as "done" above
+    if "verification successful" in low or "registration successful" in low or "registration complete" in low:
+        step = "sales"
+
+    if "what is your full name" in low:
+        step = "get_name"
+    if "which city" in low:
+        step = "get_city"
+    return step
+
+
 class GraphExecutor:
-    def invoke(self, input_dict):
+    def prepare(self, input_dict):
         """
+        Build the initial AgentState for one turn (session restore + history scan).
         input_dict keys:
           - input: str (user message)
           - chat_history: list[BaseMessage]
@@ -1014,9 +1302,9 @@ class GraphExecutor:
         step = "greet"
 
         # ---------------- SESSION RESTORE (SAFE NOW) ----------------
-        if session_id and session_id in SESSION_STORE:
-            print("RESTORE SESSION", session_id, SESSION_STORE[session_id])
-            sess = SESSION_STORE[session_id]
+        sess = SESSION_STORE.get(session_id) if session_id else None
+        if sess is not None:
+            log.debug("executor.restore_session", session_id=session_id, **sess)
 
             if not phone:
                 phone = sess.get("customer_phone")
@@ -1047,14 +1335,7 @@ class GraphExecutor:
                 last_ai_prompt = (m.content or "").lower()
 
                 # Infer 'step' based on what the AI last asked
-                if (
-                    ("sanction letter" in last_ai_prompt and "download" in last_ai_prompt)
-                    or ("congratulations" in last_ai_prompt and "approved" in last_ai_prompt)
-                    or "[approval]" in last_ai_prompt
-                    or "application rejected" in last_ai_prompt
-                    or "[rejection]" in last_ai_prompt
-                ):
-                    step = "done"
+                step = infer_step_from_reply(m.content) or step
 
                 name_match = re.search(r"nice to meet you \*?\*?([^*\n😊]+)", last_ai_prompt)
                 if name_match and not name:
@@ -1063,25 +1344,13 @@ class GraphExecutor:
                         name = nm
 
                 # Check for Loan Summary (Confirm Deal Step)
-                summary_match = re.search(r"\[LOAN_SUMMARY\](.*?)\[/LOAN_SUMMARY\]", m.content, re.DOTALL)
-                if summary_match:
-                    step = "confirm_deal"
-                    if amt == 0: # Only overwrite if we don't have amt yet
-                        try:
-                            data = json.loads(summary_match.group(1))
-                            amt = int(data.get("amount", amt))
-                        except Exception:
-                            pass
-                elif "loan summary" in last_ai_prompt or "est. emi" in last_ai_prompt:
-                    step = "confirm_deal"
-
-                if "verification successful" in last_ai_prompt or "registration successful" in last_ai_prompt:
-                    step = "sales"
-
-                if "what is your full name" in last_ai_prompt:
-                    step = "get_name"
-                if "which city" in last_ai_prompt:
-                    step = "get_city"
+                summary_match = _LOAN_SUMMARY_RE.search(m.content)
+                if summary_match and amt == 0: # Only overwrite if we don't have amt yet
+                    try:
+                        data = json.loads(summary_match.group(1))
+                        amt = int(data.get("amount", amt))
+                    except Exception:
+                        pass
 
                 continue
 
@@ -1124,20 +1393,15 @@ class GraphExecutor:
         ui_lc = user_input.lower().strip()
         upload_phrases = {"uploaded", "i uploaded", "file uploaded", "uploaded here", "upload done", "done upload"}
         
-        file_present = False
-        if phone:
-            try:
-                # check_salary_slip_exists must be imported/available
-                file_present = check_salary_slip_exists(phone)
-            except Exception as e:
-                print(f"[WARN] check_salary_slip_exists failed: {e}")
+        file_present = check_salary_slip_exists(phone)   # document registry lookup, no disk access
 
         # If frontend explicitly used upload button/text OR file is found -> force underwriting
         if ui_lc in upload_phrases or file_present:
-            print(f"[DEBUG] Upload detected (ui_lc='{ui_lc}', file_present={file_present}) -> forcing step=underwriting")
+            log.debug("executor.upload_detected", ui_lc=ui_lc, file_present=file_present)
             step = "underwriting"
 
-        print(f"--- EXECUTOR: step={step} | amt={amt} | phone={phone} | name={name} | user_input='{user_input[:60]}'")
+        log.info("executor.turn", session_id=session_id, step=step, amount=amt, phone=phone,
+                 name=name, user_input=user_input[:60])
     
 
         # ---------------- START / RESUME FLOW ----------------
@@ -1149,33 +1413,91 @@ class GraphExecutor:
             "loan_amount": amt,
             "loan_tenure": input_dict.get("tenure", 12),
             "offered_discount": False,
-            "final_decision": {}
+            "final_decision": {},
+            "verification": {}
         }
 
-         
+        return initial_state
 
-        # app_graph must be globally available
-        result = app_graph.invoke(initial_state)
-        
-        if not result.get("messages"):
+    def commit(self, session_id, initial_state, result):
+        """Persist session state after a graph run and build the executor output."""
+        if not result or not result.get("messages"):
             return {"output": "System Error: No response generated."}
-        
+
         if session_id:
-            print("SAVE SESSION", session_id, {
-        "customer_phone": result.get("customer_phone") or initial_state.get("customer_phone"),
-        "loan_amount": result.get("loan_amount") or initial_state.get("loan_amount"),
-        "step": result.get("step", initial_state.get("step", "greet")),
-    })
-            SESSION_STORE[session_id] = {
+            sess = {
                 "customer_phone": result.get("customer_phone") or initial_state.get("customer_phone"),
                 "loan_amount": result.get("loan_amount") or initial_state.get("loan_amount"),
                 # add more if needed
                 "step": result.get("step", initial_state.get("step", "greet")),
             }
+            SESSION_STORE[session_id] = sess
+            log.debug("executor.save_session", session_id=session_id, **sess)
+
+        # summary card on screen: underwrite (and pre-render the letter) while the user reads it
+        phone = result.get("customer_phone") or initial_state.get("customer_phone")
+        if result.get("step") == "confirm_deal":
+            speculator.start(phone, result.get("loan_amount"), result.get("loan_tenure") or initial_state.get("loan_tenure", 12))
+        elif phone:
+            speculator.discard(phone)
 
 
         return {"output": result["messages"][-1].content}
 
+    def invoke(self, input_dict):
+        initial_state = self.prepare(input_dict)
+        # app_graph must be globally available
+        result = app_graph.invoke(initial_state)
+        return self.commit(input_dict.get("session_id"), initial_state, result)
+
+    async def ainvoke(self, input_dict):
+        initial_state = self.prepare(input_dict)
+        result = await async_app_graph.ainvoke(initial_state)
+        return self.commit(input_dict.get("session_id"), initial_state, result)
+
+    async def astream(self, input_dict):
+        """
+        Async generator over one turn, driven by LangGraph's astream_events:
+          {"event": "node",   "data": {"node": "router", "status": "start"|"end"}}
+          {"event": "token",  "data": {"text": "..."}}     (LLM tokens as they arrive)
+          {"event": "token_reset", "data": {}}             (a retried call starts over: drop the tokens so far)
+          {"event": "result", "data": {"output": "..."}}   (always last)
+        """
+        initial_state = self.prepare(input_dict)
+        result = None
+        graph = async_app_graph if ASYNC_GRAPH else app_graph
+        streamed = False
+
+        async for ev in graph.astream_events(initial_state, version="v2"):
+            kind = ev["event"]
+            name = ev.get("name")
+
+            if kind in ("on_chat_model_start", "on_chat_model_stream"):
+                # only replies shown as-is are user-facing (not the tool-selection JSON, not payslip extraction)
+                if USER_REPLY_TAG not in ev.get("tags", ()):
+                    continue
+                if kind == "on_chat_model_start":
+                    if streamed:
+                        streamed = False
+                        yield {"event": "token_reset", "data": {}}
+                    continue
+                chunk = ev["data"].get("chunk")
+                text = getattr(chunk, "content", "")
+                if text:
+                    streamed = True
+                    yield {"event": "token", "data": {"text": text}}
+
+            elif kind in ("on_chain_start", "on_chain_end") and name in GRAPH_NODES:
+                # only the node run itself, not runnables nested inside it
+                if ev.get("metadata", {}).get("langgraph_node") == name:
+                    status = "start" if kind == "on_chain_start" else "end"
+                    yield {"event": "node", "data": {"node": name, "status": status}}
+
+            elif kind == "on_chain_end" and not ev.get("parent_ids"):
+                result = ev["data"].get("output")
+
+        yield {"event": "result", "data": self.commit(input_dict.get("session_id"), initial_state, result)}
+
 agent_executor = GraphExecutor()
 
  
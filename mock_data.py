@@ -7,12 +7,14 @@ import pdfplumber
 import cv2
 import os
 import re
+from credit_bureau import credit_bureau
+from scheduler import resource
+from shared_state import SHARED, process_lock
+from telemetry import get_logger, span
 
-DATA_FILE = "customers.json"
-
-# ----------------------- CONSTANTS -----------------------
-INTEREST_RATE = 12  # Standardized interest rate (12% p.a.)
+log = get_logger("mock_data")
 
+DATA_FILE = "customers.json"
 
 # --- LOAD / SAVE -------------------------------------------------------------
 
@@ -120,15 +122,19 @@ def _load_customers_from_file():
 
 
 def _save_customers_to_file(customers):
+    global _CUSTOMERS_MTIME
     with open(DATA_FILE, "w", encoding="utf-8") as f:
         json.dump(customers, f, indent=2)
+    _CUSTOMERS_MTIME = os.stat(DATA_FILE).st_mtime_ns
 
 
 CUSTOMERS = _load_customers_from_file()
+_CUSTOMERS_MTIME = os.stat(DATA_FILE).st_mtime_ns if os.path.exists(DATA_FILE) else None
 
 
 # --- SALARY SLIP SIMULATION --------------------------------------------------
-# dependencies: pip install pymupdf pillow pytesseract opencv-python
+# dependencies: pip install pymupdf pillow pytesseract opencv-python (+ tesserocr, see ocr_engine.py)
+# OCR itself: payslip_ocr.py (adaptive resolution, table regions first)
 # On Windows: install Tesseract-OCR and set pytesseract.pytesseract.tesseract_cmd accordingly
 
 import os
@@ -164,98 +170,100 @@ def _pil_to_cv2(pil_img):
     bgr = cv2.cvtColor(arr, cv2.COLOR_RGB2BGR)
     return bgr
 
+def _amount(num_s):
+    """'1,45,163' -> 145163; '60.747' (OCR'd comma) -> 60747; '52,000.50' -> 52000."""
+    num_s = num_s.rstrip(".,").replace(",", "")
+    if re.search(r"\.\d{1,2}$", num_s):   # paise
+        num_s = num_s.rsplit(".", 1)[0]
+    return int(re.sub(r"\D", "", num_s))
+
+
+# net pay labels; the amount may be on the next line (table cells)
+NET_PAY_PATTERN = (r"(?:net pay|net salary|net amount payable|take[- ]home|net in hand|in-hand)"
+                   r"[\s:=|-]*(?:inr|rs\.?|₹)?[\s:=|-]*(\d[\d,.]{2,})")
+
+
+def find_net_pay(text: str) -> int:
+    """Amount next to a net pay label, or 0."""
+    m = re.search(NET_PAY_PATTERN, (text or "").lower())
+    if m:
+        try:
+            return _amount(m.group(1))
+        except ValueError:
+            pass
+    return 0
+
+
+def find_salary_in_text(text: str) -> int:
+    """
+    Regex heuristics over payslip text (OCR output or PDF text layer).
+    Returns monthly salary as int, or 0 if nothing salary-like is found.
+    """
+    text_lower = (text or "").lower()
+
+    # net pay first: a payslip's "Basic Salary" row is not what the customer takes home
+    val = find_net_pay(text_lower)
+    if val:
+        log.info("salary.net_pay_match", salary=val)
+        return val
+
+    # regex: look for monthly salary / numbers labelled monthly/per month
+    # Common patterns: "₹ 50,000", "50000 per month", "monthly salary 50,000"
+    patterns = [
+        r"(?:monthly salary|salary per month|salary|net in hand|in-hand)[^\d\n\r]{0,30}([\d,]{3,})",
+        r"([\d,]{3,})\s*(?:/month|per month|pm|monthly)",
+        r"₹\s*([\d,]+)"
+    ]
+    for p in patterns:
+        m = re.search(p, text_lower, flags=re.IGNORECASE)
+        if m:
+            num_s = m.group(1).replace(",", "")
+            try:
+                val = int(re.sub(r"\D", "", num_s))
+                log.info("salary.regex_match", salary=val)
+                return val
+            except:
+                continue
+
+    # fallback: find largest 5+ digit number in the text (heuristic)
+    nums = re.findall(r"[\d,]{5,}", text_lower)
+    if nums:
+        nums_clean = [int(n.replace(",", "")) for n in nums]
+        val = max(nums_clean)
+        log.info("salary.heuristic_guess", salary=val)
+        return val
+
+    return 0
+
 def extract_salary_from_slip(phone: str) -> int:
     """
-    Extract monthly salary (int) from uploaded salary slip PDF or image.
+    Extract monthly salary (int) from the uploaded salary slip (the canonical
+    PDF ingest.py stores, whatever was uploaded).
     Returns integer monthly salary if found, else 0.
     """
     if not phone:
-        print("[ERROR] extract_salary_from_slip called without phone")
+        log.error("ocr.no_phone")
         return 0
 
-    uploads_dir = os.path.join("uploads")
-    pdf_path = os.path.abspath(os.path.join(uploads_dir, f"{phone}_salary_slip.pdf"))
-    img_path_jpg = os.path.abspath(os.path.join(uploads_dir, f"{phone}_salary_slip.jpg"))
-    img_path_png = os.path.abspath(os.path.join(uploads_dir, f"{phone}_salary_slip.png"))
-
-    # choose path: prefer pdf then jpg/png
-    if os.path.exists(pdf_path) and os.path.getsize(pdf_path) > 0:
-        source_type = "pdf"
-        source_path = pdf_path
-    elif os.path.exists(img_path_jpg) and os.path.getsize(img_path_jpg) > 0:
-        source_type = "image"
-        source_path = img_path_jpg
-    elif os.path.exists(img_path_png) and os.path.getsize(img_path_png) > 0:
-        source_type = "image"
-        source_path = img_path_png
-    else:
-        print(f"[ERROR] extract_salary_from_slip: no file found for phone={phone}. "
-              f"Checked: {pdf_path}, {img_path_jpg}, {img_path_png}")
+    from document_registry import slip_path
+    source_path = os.path.abspath(slip_path(phone))
+    if not os.path.exists(source_path) or os.path.getsize(source_path) == 0:
+        log.error("ocr.no_file", phone=phone, checked=[source_path])
         return 0
 
-    print(f"[DEBUG] extract_salary_from_slip: using {source_type} at {source_path}")
-
     try:
-        if source_type == "pdf":
-            pil_img = _pdf_first_page_to_pil(source_path, zoom=2)
-            cv_img = _pil_to_cv2(pil_img)
-        else:
-            # image file: load with OpenCV (safer than imread direct on weird encodings)
-            # but check file size first
-            size = os.path.getsize(source_path)
-            if size == 0:
-                print(f"[ERROR] file {source_path} has zero size.")
-                return 0
-            # use pillow to ensure format support, then convert
-            pil_img = Image.open(source_path)
-            cv_img = _pil_to_cv2(pil_img)
-
-        if cv_img is None or cv_img.size == 0:
-            print("[ERROR] image conversion failed; image empty")
-            return 0
-
-        # optional: preprocess for better OCR
-        gray = cv2.cvtColor(cv_img, cv2.COLOR_BGR2GRAY)
-        # threshold to clean the background - tweak if needed
-        _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-
-        # OCR: use PIL image for pytesseract (convert back)
-        ocr_pil = Image.fromarray(cv2.cvtColor(thresh, cv2.COLOR_GRAY2RGB))
-        text = pytesseract.image_to_string(ocr_pil, lang="eng")
-        text_lower = text.lower()
-        print(f"[DEBUG] OCR text snippet: {text_lower[:200]}")
-
-        # regex: look for monthly salary / numbers labelled monthly/per month
-        # Common patterns: "₹ 50,000", "50000 per month", "monthly salary 50,000"
-        patterns = [
-            r"(?:monthly salary|salary per month|salary|net in hand|in-hand)[^\d\n\r]{0,30}([\d,]{3,})",
-            r"([\d,]{3,})\s*(?:/month|per month|pm|monthly)",
-            r"₹\s*([\d,]+)"
-        ]
-        for p in patterns:
-            m = re.search(p, text_lower, flags=re.IGNORECASE)
-            if m:
-                num_s = m.group(1).replace(",", "")
-                try:
-                    val = int(re.sub(r"\D", "", num_s))
-                    print(f"[INFO] Extracted salary: {val}")
-                    return val
-                except:
-                    continue
-
-        # fallback: find largest 5+ digit number in the text (heuristic)
-        nums = re.findall(r"[\d,]{5,}", text_lower)
-        if nums:
-            nums_clean = [int(n.replace(",", "")) for n in nums]
-            val = max(nums_clean)
-            print(f"[INFO] Heuristic salary guess: {val}")
+        # OCR is CPU heavy: bounded per process (scheduler.RESOURCE_LIMITS)
+        with resource("ocr").slot():
+            # adaptive resolution, table regions first, whole page only if needed
+            from payslip_ocr import salary_from_file   # imports this module
+            with span("ocr.tesseract"):
+                val, _ = salary_from_file(source_path, "pdf")
+            if not val:
+                log.warning("ocr.no_salary_found", phone=phone)
             return val
 
-        print("[WARN] No salary number found in OCR output.")
-        return 0
-
     except Exception as e:
-        print(f"[ERROR] extract_salary_from_slip exception: {e}")
+        log.error("ocr.failed", phone=phone, error=str(e))
         return 0
 
 # --- ADDRESS GENERATION FOR NEW CUSTOMERS ------------------------------------
@@ -276,20 +284,58 @@ def _generate_random_address(city: str) -> str:
 
 # --- API ---------------------------------------------------------------------
 
-def get_customer_by_phone(phone: str):
+def _find_customer(phone):
     for cust in CUSTOMERS:
         if cust["phone"] == phone:
             return cust
     return None
 
 
+_CHANGE_LISTENERS = []
+
+
+def on_customers_changed(fn):
+    """fn(phones) is called with the phones of customers added or changed."""
+    _CHANGE_LISTENERS.append(fn)
+
+
+def _notify_changed(phones):
+    if phones:
+        for fn in _CHANGE_LISTENERS:
+            fn(phones)
+
+
+def _reload_customers():
+    """Pick up customers registered by other worker processes (customers.json changed)."""
+    global _CUSTOMERS_MTIME
+    try:
+        mtime = os.stat(DATA_FILE).st_mtime_ns
+    except OSError:
+        return False
+    if mtime == _CUSTOMERS_MTIME:
+        return False
+    old = {c["phone"]: c for c in CUSTOMERS}
+    CUSTOMERS[:] = _load_customers_from_file()
+    _CUSTOMERS_MTIME = mtime
+    new = {c["phone"]: c for c in CUSTOMERS}
+    _notify_changed([p for p in old.keys() | new.keys() if old.get(p) != new.get(p)])
+    return True
+
+
+def get_customer_by_phone(phone: str):
+    cust = _find_customer(phone)
+    if cust is None and SHARED and _reload_customers():
+        cust = _find_customer(phone)
+    return cust
+
+
 def create_new_customer(phone: str, name: str, city: str, address: str = None):
     """
     Create customer with address for KYC.
     Salary slip will be required during underwriting.
     """
 
-    credit_score = random.randint(700, 850)            # Random fair-good score
+    credit_score = credit_bureau.score(phone) or random.randint(700, 850)   # bureau, else random fair-good score
     pre_limit = random.choice([300000, 400000, 500000]) # Give a base limit
     existing_emi = random.randint(0, 15000)             # Random EMI
     
@@ -307,7 +353,12 @@ def create_new_customer(phone: str, name: str, city: str, address: str = None):
         "existing_emi": existing_emi
     }
 
-    CUSTOMERS.append(new_customer)
-    _save_customers_to_file(CUSTOMERS)
+    # re-read under the lock so a customer another worker just added is not overwritten
+    with process_lock("customers"):
+        if SHARED:
+            _reload_customers()
+        CUSTOMERS.append(new_customer)
+        _save_customers_to_file(CUSTOMERS)
+    _notify_changed([phone])
 
     return new_customer
@@ -0,0 +1,261 @@
+# ocr_engine.py
+# Tesseract OCR for payslip images (mock_data.extract_salary_from_slip).
+#
+# pytesseract runs the `tesseract` binary once per page: a process spawn plus
+# loading eng.traineddata every call. With tesserocr installed (in-process
+# libtesseract binding; its wheels bundle the library) engines stay resident
+# instead: up to OCR_ENGINES of them per process, each with the language model
+# loaded once, handed out to one page at a time. tesserocr releases the GIL
+# while recognising, so pages on different engines run in parallel.
+#
+# OCR_BACKEND:
+#   auto         tesserocr if it imports and an engine loads, else pytesseract
+#   tesserocr    resident engines (still falls back to pytesseract if they cannot load)
+#   pytesseract  one tesseract process per page
+# A page that fails on a resident engine is retried with pytesseract. Per-page
+# latency is recorded for either backend (loanbot_ocr_page_seconds{backend}).
+# The language data is looked up in TESSDATA_PREFIX, as by the tesseract binary.
+#
+#   python ocr_engine.py bench --pages 20
+import argparse
+import os
+import queue
+import threading
+import time
+
+import pytesseract
+
+try:
+    # imported with the module, not on first use: its cysignals dependency
+    # installs signal handlers, which only works on the main thread
+    import tesserocr
+    TESSEROCR_ERROR = None
+except (ImportError, ValueError) as e:   # not installed / first imported off the main thread
+    tesserocr, TESSEROCR_ERROR = None, e
+
+from bench_utils import percentile
+from telemetry import counter, get_logger, histogram
+
+OCR_BACKEND = os.getenv("OCR_BACKEND", "auto")
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+# one engine per concurrent OCR run (scheduler's "ocr" slots) is enough
+OCR_ENGINES = int(os.getenv("OCR_ENGINES", os.getenv("OCR_CONCURRENCY", "2")))
+
+log = get_logger("ocr_engine")
+PAGE_SECONDS = histogram("loanbot_ocr_page_seconds", "OCR latency per page",
+                         buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10))
+FALLBACKS = counter("loanbot_ocr_fallbacks_total", "Pages OCR'd with pytesseract after a resident engine failed")
+
+
+class PytesseractBackend:
+    name = "pytesseract"
+
+    def __init__(self, lang=OCR_LANG):
+        self.lang = lang
+
+    def image_to_string(self, img, psm=None):
+        config = f"--psm {psm}" if psm is not None else ""
+        return pytesseract.image_to_string(img, lang=self.lang, config=config)
+
+    def close(self):
+        pass
+
+
+class TesserocrBackend:
+    """Up to `size` resident libtesseract engines, each used by one page at a time."""
+    name = "tesserocr"
+
+    def __init__(self, lang=OCR_LANG, size=OCR_ENGINES):
+        if tesserocr is None:   # caller falls back
+            raise ImportError(f"tesserocr unavailable: {TESSEROCR_ERROR}")
+        self._tesserocr = tesserocr
+        self.lang = lang
+        self.size = max(1, size)
+        self._idle = queue.LifoQueue()   # most recently used engine first (warm caches)
+        self._created = 0
+        self._lock = threading.Lock()
+        self._release(self._acquire())   # load one now: a missing model fails here, not on a page
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+        if not create:
+            return self._idle.get()   # all engines busy: wait for one
+        try:
+            t0 = time.perf_counter()
+            engine = self._tesserocr.PyTessBaseAPI(lang=self.lang)
+            log.info("ocr.engine_loaded", lang=self.lang, ms=round((time.perf_counter() - t0) * 1000, 1))
+            return engine
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def _release(self, engine):
+        engine.Clear()   # drops the page's image and results; the model stays loaded
+        self._idle.put(engine)
+
+    def image_to_string(self, img, psm=None):
+        engine = self._acquire()
+        try:
+            engine.SetPageSegMode(self._tesserocr.PSM.AUTO if psm is None else psm)
+            engine.SetImage(img)
+            return engine.GetUTF8Text()
+        finally:
+            self._release(engine)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().End()
+            except queue.Empty:
+                break
+        self._created = 0
+
+
+def make_backend(name=OCR_BACKEND, lang=OCR_LANG, size=OCR_ENGINES):
+    if name in ("auto", "tesserocr"):
+        try:
+            return TesserocrBackend(lang, size)
+        except Exception as e:
+            # also in "auto" mode: the fallback starts a tesseract process per page
+            prefix = os.getenv("TESSDATA_PREFIX")
+            hint = {} if prefix or isinstance(e, ImportError) else {
+                "hint": "TESSDATA_PREFIX is unset; point it at the tessdata directory"}
+            log.warning("ocr.resident_unavailable", backend=name, fallback="pytesseract", error=str(e),
+                        tessdata_prefix=prefix or "unset", **hint)
+    elif name != "pytesseract":
+        log.warning("ocr.unknown_backend", backend=name, fallback="pytesseract")
+    return PytesseractBackend(lang)
+
+
+class OcrEngine:
+    """Process-wide OCR entry point; the backend is chosen on first use."""
+
+    def __init__(self, backend=OCR_BACKEND):
+        self.requested = backend
+        self._backend = None
+        self._lock = threading.Lock()
+        self._fallback = PytesseractBackend()
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = make_backend(self.requested)
+        return self._backend
+
+    def image_to_string(self, img, psm=None):
+        """Text of one page image (PIL.Image); psm is Tesseract's page segmentation mode (default: auto)."""
+        backend = self.backend
+        t0 = time.perf_counter()
+        try:
+            text = backend.image_to_string(img, psm)
+        except Exception as e:
+            if backend.name == self._fallback.name:
+                raise
+            log.warning("ocr.page_failed", backend=backend.name, fallback="pytesseract", error=str(e))
+            FALLBACKS.inc()
+            backend = self._fallback
+            t0 = time.perf_counter()
+            text = backend.image_to_string(img, psm)
+        elapsed = time.perf_counter() - t0
+        PAGE_SECONDS.observe(elapsed, backend=backend.name)
+        log.info("ocr.page", backend=backend.name, ms=round(elapsed * 1000, 1), chars=len(text))
+        return text
+
+    def warm(self):
+        return self.backend.name
+
+    def _after_fork(self):
+        # engines are per-process C state: the child loads its own on first use
+        self._backend = None
+        self._lock = threading.Lock()
+
+
+ocr_engine = OcrEngine()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=ocr_engine._after_fork)
+
+
+# ----------------------------------------------------------
+# CLI
+# ----------------------------------------------------------
+def _sample_page(path="/tmp/ocr_bench_payslip.pdf"):
+    """A one-page payslip rendered and binarised the way extract_salary_from_slip does."""
+    import cv2
+    from PIL import Image
+
+    from mock_data import _pdf_first_page_to_pil, _pil_to_cv2
+    from pdf_generator import PDF
+
+    pdf = PDF()
+    pdf.add_page()
+    pdf.set_font("Arial", size=11)
+    rows = [("Employee Name", "Amit Sharma"), ("Employee ID", "EMP-20417"), ("Pay Period", "September 2026"),
+            ("Basic Salary", "52,000"), ("House Rent Allowance", "20,800"), ("Special Allowance", "12,400"),
+            ("Gross Earnings", "85,200"), ("Provident Fund", "6,240"), ("Professional Tax", "200"),
+            ("Income Tax (TDS)", "6,310"), ("Total Deductions", "12,750"), ("Net Pay", "72,450")]
+    for label, value in rows:
+        pdf.cell(90, 8, label, 1, 0)
+        pdf.cell(60, 8, value, 1, 1, "R")
+    pdf.output(path)
+    gray = cv2.cvtColor(_pil_to_cv2(_pdf_first_page_to_pil(path, zoom=2)), cv2.COLOR_BGR2GRAY)
+    _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return Image.fromarray(cv2.cvtColor(thresh, cv2.COLOR_GRAY2RGB))
+
+
+def _run(label, ocr, page, pages):
+    times, text = [], ""
+    for _ in range(pages):
+        t0 = time.perf_counter()
+        text = ocr(page)
+        times.append(time.perf_counter() - t0)
+    print(f"{label:<26} p50 {percentile(times, 50) * 1000:7.1f} ms  p95 {percentile(times, 95) * 1000:7.1f} ms"
+          f"  ({pages} pages, 'net pay' found: {'net pay' in text.lower()})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR backend latency per page")
+    parser.add_argument("command", choices=["bench"])
+    parser.add_argument("--pages", type=int, default=20)
+    args = parser.parse_args()
+
+    page = _sample_page()
+    try:
+        pytesseract.get_tesseract_version()
+    except Exception as e:
+        print(f"{'pytesseract':<26} skipped ({type(e).__name__}: tesseract binary not found)")
+    else:
+        _run("pytesseract (per call)", PytesseractBackend().image_to_string, page, args.pages)
+
+    try:
+        resident = TesserocrBackend(size=1)
+    except Exception as e:
+        print(f"{'tesserocr':<26} skipped ({type(e).__name__}: {e})")
+        return
+
+    def cold(img):
+        # model loaded for every page, as each tesseract process does (minus the spawn)
+        engine = resident._tesserocr.PyTessBaseAPI(lang=resident.lang)
+        try:
+            engine.SetImage(img)
+            return engine.GetUTF8Text()
+        finally:
+            engine.End()
+
+    _run("tesserocr, model per page", cold, page, args.pages)
+    _run("tesserocr, resident", resident.image_to_string, page, args.pages)
+    resident.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+# offer_table.py
+# Materialized pre-approved offers, one record per customer:
+#   name / address / credit score / limit / rate (the offer card, priced at
+#   the full limit over OFFER_TENURE),
+#   rate and EMI ladder across OFFER_TENURES at the full limit,
+#   max affordable amount per tenure once a salary slip is verified.
+#
+# Rates come from the risk-based pricing grid (agents.pricing_grid). The
+# verification card is read from here, and sales / loan_purpose price amounts
+# with quote(), whose emi() uses cached per-(rate, tenure) factors (same value
+# as agents.calculate_emi). Records stay current incrementally:
+#   - mock_data reports added / changed customers -> only those are dropped
+#   - the pricing grid (rule file reload), the verified salary or the credit
+#     bureau's score (credit_bureau.py) differ from the record -> that record
+#     is rebuilt on its next lookup
+#
+# rebuild() materializes every customer at once, across a process pool for
+# large customer bases; warmup.prime_caches() runs it, so under gunicorn the
+# master builds the table before fork and workers share it.
+#
+#   python offer_table.py --demo 200000 --workers 4     # bulk rebuild throughput
+#   python offer_table.py --out offers.jsonl            # export customers.json offers
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import mock_data
+from agents import pricing_grid
+from credit_bureau import credit_bureau
+from document_registry import document_registry
+from rule_engine import interest_rate, underwriting_rules
+from telemetry import counter, get_logger
+
+OFFER_TENURES = (6, 12, 18, 24, 36, 48, 60)
+MAX_TENURE = OFFER_TENURES[-1]
+OFFER_TENURE = 12                                            # tenure the card's headline rate is quoted for
+OFFER_REBUILD_WORKERS = int(os.getenv("OFFER_REBUILD_WORKERS", "0"))   # 0 = one per core
+PARALLEL_MIN = 20000                                         # fewer customers: build in-process
+
+log = get_logger("offer_table")
+REBUILDS = counter("loanbot_offer_rebuilds_total", "Offer records built, by reason")
+
+
+# ----------------------------------------------------------
+# Pricing
+# ----------------------------------------------------------
+_FACTORS = {}   # (rate, tenure) -> (monthly rate, (1 + r) ** tenure)
+
+
+def _factor(rate, tenure):
+    f = _FACTORS.get((rate, tenure))
+    if f is None:
+        r = rate / 1200
+        f = _FACTORS[(rate, tenure)] = (r, (1 + r) ** tenure)
+    return f
+
+
+def emi(amount, tenure, rate):
+    """EMI for amount over tenure months at rate; identical to agents.calculate_emi."""
+    if tenure == 0:
+        return 0
+    r, g = _factor(rate, tenure)
+    if r == 0:
+        return 0   # calculate_emi divides by zero here
+    return round(amount * r * g / (g - 1), 2)
+
+
+def max_affordable(salary, tenure, rate):
+    """Largest amount whose EMI fits in the rules' max_emi_share of salary (underwriting_agent's formula)."""
+    r, g = _factor(rate, tenure)
+    max_emi = salary * underwriting_rules.param("max_emi_share")
+    return int(max_emi * (g - 1) / (r * g)) if r > 0 else int(max_emi * tenure)
+
+
+def build_offer(customer, grid, salary=None):
+    limit, score = customer["pre_approved_limit"], customer["credit_score"]
+    rates = {t: grid.rate(score, limit, t) for t in OFFER_TENURES}
+    return {
+        "phone": customer["phone"],
+        "name": customer["name"],
+        "address": customer.get("address", "Address not on file"),
+        "credit_score": score,
+        "limit": limit,
+        "rate": grid.rate(score, limit, OFFER_TENURE),
+        "max_tenure": MAX_TENURE,
+        "ladder": [{"tenure": t, "rate": rates[t], "emi_at_limit": emi(limit, t, rates[t])} for t in OFFER_TENURES],
+        "salary": salary,
+        "max_affordable": {t: max_affordable(salary, t, rates[t]) for t in OFFER_TENURES} if salary else None,
+        "pricing": grid.generation,
+    }
+
+
+def _build_chunk(customers, grid):
+    return [build_offer(c, grid) for c in customers]
+
+
+def _verified_salary(phone):
+    slip = document_registry.get(phone)
+    return slip.salary if slip is not None and slip.status == "extracted" else None
+
+
+# ----------------------------------------------------------
+# Table
+# ----------------------------------------------------------
+class OfferTable:
+    def __init__(self):
+        self.offers = {}
+        self._lock = threading.Lock()
+
+    def get(self, phone, wait_bureau=True):
+        """
+        Offer record for phone (None for an unknown customer); rebuilt only if
+        its inputs changed. wait_bureau=False uses a bureau score only if one is
+        already cached (the verification stage has already asked for it).
+        """
+        if not phone:
+            return None
+        rec = self.offers.get(phone)
+        customer = None
+        if rec is None:
+            customer = mock_data.get_customer_by_phone(phone)
+            if customer is None:
+                return None   # unknown phone: no bureau pull
+        grid, salary = pricing_grid(), _verified_salary(phone)
+        score = credit_bureau.score(phone, wait=wait_bureau)   # None: no bureau answer, keep the stored score
+        if (rec is not None and rec["pricing"] == grid.generation and rec["salary"] == salary
+                and score in (None, rec["credit_score"])):
+            return rec
+        customer = customer or mock_data.get_customer_by_phone(phone)
+        if customer is None:
+            return None
+        if score is not None and score != customer["credit_score"]:
+            customer = {**customer, "credit_score": score}
+        if rec is None:
+            reason = "new"
+        else:
+            reason = "pricing" if rec["pricing"] != grid.generation else ("salary" if rec["salary"] != salary else "score")
+        rec = build_offer(customer, grid, salary)
+        with self._lock:
+            self.offers[phone] = rec
+        REBUILDS.inc(reason=reason)
+        return rec
+
+    def quote(self, phone, amount, tenure):
+        """(rate, EMI) for this customer borrowing amount over tenure months (base rate if unknown)."""
+        # runs inline on the event loop (sales / loan purpose nodes): a cached bureau
+        # score or the record's own, never a blocking bureau lookup
+        rec = self.get(phone, wait_bureau=False)
+        rate = pricing_grid().rate(rec["credit_score"], amount, tenure) if rec else interest_rate()
+        return rate, emi(amount, tenure, rate)
+
+    def invalidate(self, phones):
+        """Customers added or changed: drop their records (rebuilt on next lookup)."""
+        with self._lock:
+            for phone in phones:
+                self.offers.pop(phone, None)
+
+    def rebuild(self, customers=None, workers=OFFER_REBUILD_WORKERS, chunk_size=5000):
+        """Materialize every customer's offer; large tables are built across a process pool."""
+        customers = list(mock_data.CUSTOMERS if customers is None else customers)
+        grid = pricing_grid()
+        workers = workers or os.cpu_count() or 1
+        t0 = time.perf_counter()
+        if workers > 1 and len(customers) >= PARALLEL_MIN:
+            chunks = [customers[i:i + chunk_size] for i in range(0, len(customers), chunk_size)]
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                records = [rec for part in pool.map(_build_chunk, chunks, [grid] * len(chunks)) for rec in part]
+        else:
+            workers = 1
+            records = _build_chunk(customers, grid)
+        offers = {rec["phone"]: rec for rec in records}
+        with self._lock:
+            self.offers = offers   # salary-bearing records are refreshed on lookup
+        REBUILDS.inc(len(records), reason="bulk")
+        elapsed = time.perf_counter() - t0
+        log.info("offers.rebuilt", customers=len(records), workers=workers, ms=round(elapsed * 1000, 1))
+        return len(records), elapsed
+
+
+offer_table = OfferTable()
+mock_data.on_customers_changed(offer_table.invalidate)
+
+
+# ----------------------------------------------------------
+# CLI
+# ----------------------------------------------------------
+def demo_customers(n):
+    """n synthetic customers cycling through customers.json (unique phones)."""
+    base = mock_data.CUSTOMERS
+    return [{**base[i % len(base)], "phone": f"6{i:09d}"} for i in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the materialized offer table")
+    parser.add_argument("--demo", type=int, help="N synthetic customers instead of customers.json")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes (1 = in-process)")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--out", help="write the records as JSON lines")
+    args = parser.parse_args()
+
+    global PARALLEL_MIN
+    PARALLEL_MIN = 0   # honour --workers even for small tables
+    customers = demo_customers(args.demo) if args.demo else mock_data.CUSTOMERS
+    n, elapsed = offer_table.rebuild(customers, workers=args.workers, chunk_size=args.chunk_size)
+    print(f"{n} offers in {elapsed:.2f}s -> {n / elapsed:,.0f} offers/s ({args.workers} workers)")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            for rec in offer_table.offers.values():
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        print(f"records -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
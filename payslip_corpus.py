@@ -0,0 +1,202 @@
+# payslip_corpus.py
+# Synthetic salary slips with a known net pay, for measuring salary extraction
+# (payslip_ocr.py bench). Layouts vary the way uploads do: page size, font
+# size, ruled or borderless tables, net pay inside the table or on its own
+# line, optional tax-computation pages (with the payslip header printed again,
+# as payroll exports do), and "scanned" slips (the page as a noisy, slightly
+# rotated image inside the PDF).
+#
+#   python payslip_corpus.py --docs 40 --out-dir /tmp/payslips
+#   -> /tmp/payslips/slip_000.pdf ... + manifest.jsonl ({"path", "net_pay", ...} per slip)
+import argparse
+import io
+import json
+import os
+import random
+
+from fpdf import FPDF
+
+COMPANIES = ["Infosys Limited", "Larsen & Toubro Ltd", "Zenith Softech Pvt Ltd", "Apex Pharma Industries",
+             "Bluewave Logistics LLP", "Sunrise Retail India Pvt Ltd", "Orbit Analytics Pvt Ltd"]
+NAMES = ["Amit Sharma", "Priya Singh", "Rahul Verma", "Sneha Iyer", "Vikram Rao", "Ananya Das", "Karan Mehta"]
+MONTHS = ["April", "May", "June", "July", "August", "September", "October"]
+FORMATS = {"A4": (210, 297), "Letter": (215.9, 279.4), "A5": (148, 210)}
+CORPUS_VERSION = 2   # bumped when the layouts change: cached corpora are regenerated
+DISCLAIMER = ("This is a computer generated payslip and does not require a signature. Please verify the details "
+              "and report discrepancies to the payroll team within seven days of receipt. Figures are subject to "
+              "the company's compensation policy and applicable statutory deductions under the Income Tax Act.")
+
+
+def inr(amount):
+    """72450 -> '72,450'; 1234567 -> '12,34,567' (Indian digit grouping)."""
+    s = str(int(amount))
+    if len(s) <= 3:
+        return s
+    head, tail = s[:-3], s[-3:]
+    groups = []
+    while len(head) > 2:
+        groups.insert(0, head[-2:])
+        head = head[:-2]
+    return ",".join([head] + groups + [tail]) if head else ",".join(groups + [tail])
+
+
+def payslip_figures(rng):
+    basic = rng.randrange(15000, 150000, 100)
+    earnings = [("Basic Salary", basic), ("House Rent Allowance", basic * 40 // 100),
+                ("Special Allowance", rng.randrange(2000, 40000, 100)), ("Conveyance Allowance", 1600)]
+    if rng.random() < 0.5:
+        earnings.append(("Performance Bonus", rng.randrange(1000, 20000, 100)))
+    gross = sum(v for _, v in earnings)
+    deductions = [("Provident Fund", basic * 12 // 100), ("Professional Tax", 200),
+                  ("Income Tax (TDS)", gross * rng.randrange(3, 15) // 100)]
+    if rng.random() < 0.3:
+        deductions.append(("Loan Recovery", rng.randrange(1000, 8000, 100)))
+    return earnings, deductions, gross, gross - sum(v for _, v in deductions)
+
+
+def _table(pdf, rows, widths, ruled, size):
+    h = size * 0.62
+    for row in rows:
+        for i, (text, w) in enumerate(zip(row, widths)):
+            pdf.cell(w, h, text, 1 if ruled else 0, 1 if i == len(row) - 1 else 0, "R" if i % 2 else "L")
+
+
+def render_payslip(rng, path):
+    """Write one random payslip PDF to path; returns its ground truth."""
+    fmt = rng.choice(list(FORMATS))
+    page_w = FORMATS[fmt][0]
+    size = rng.choice([8, 9, 10, 11, 12]) if fmt != "A5" else rng.choice([7, 8, 9])
+    ruled = rng.random() < 0.6
+    net_in_table = rng.random() < 0.5
+    tax_pages = rng.choice([0, 0, 1, 2])
+    earnings, deductions, gross, net = payslip_figures(rng)
+    company, name, month = rng.choice(COMPANIES), rng.choice(NAMES), rng.choice(MONTHS)
+
+    pdf = FPDF("P", "mm", fmt)
+    pdf.set_auto_page_break(True, 12)
+    pdf.add_page()
+    usable = page_w - 20
+    address = (f"Plot {rng.randint(1, 300)}, Industrial Area Phase {rng.randint(1, 3)}, "
+               f"{rng.choice(['Pune', 'Mumbai', 'Bengaluru', 'Chennai'])} {rng.randint(400001, 600099)}")
+    details = [("Employee Name", name, "Employee ID", f"EMP{rng.randint(10000, 99999)}"),
+               ("Designation", rng.choice(["Analyst", "Engineer", "Manager", "Associate"]),
+                "PAN", f"ABCDE{rng.randint(1000, 9999)}F"),
+               ("Bank A/c No.", str(rng.randint(10 ** 10, 10 ** 12)), "Days Paid", str(rng.choice([30, 31])))]
+
+    def header():
+        pdf.set_font("Arial", "B", size + 4)
+        pdf.cell(0, size * 0.8, company, 0, 1, "C")
+        pdf.set_font("Arial", "", size - 1)
+        pdf.cell(0, size * 0.5, address, 0, 1, "C")
+        pdf.set_font("Arial", "B", size + 1)
+        pdf.cell(0, size * 0.8, f"Payslip for the month of {month} 2026", 0, 1, "C")
+        pdf.ln(2)
+        pdf.set_font("Arial", "", size)
+        _table(pdf, details, [usable * 0.22, usable * 0.28] * 2, False, size)
+        pdf.ln(3)
+
+    header()
+
+    pdf.set_font("Arial", "B", size)
+    _table(pdf, [("Earnings", "Amount (INR)", "Deductions", "Amount (INR)")], [usable / 4] * 4, ruled, size)
+    pdf.set_font("Arial", "", size)
+    rows = []
+    for i in range(max(len(earnings), len(deductions))):
+        e = earnings[i] if i < len(earnings) else ("", None)
+        d = deductions[i] if i < len(deductions) else ("", None)
+        rows.append((e[0], inr(e[1]) if e[1] is not None else "", d[0], inr(d[1]) if d[1] is not None else ""))
+    rows.append(("Gross Earnings", inr(gross), "Total Deductions", inr(gross - net)))
+    if net_in_table:
+        rows.append(("Net Pay", inr(net), "", ""))
+    _table(pdf, rows, [usable / 4] * 4, ruled, size)
+    pdf.ln(3)
+    if not net_in_table:
+        pdf.set_font("Arial", "B", size + 1)
+        pdf.cell(0, size * 0.7, f"Net Pay: INR {inr(net)}", 0, 1)
+        pdf.set_font("Arial", "", size)
+    pdf.ln(4)
+    pdf.set_font("Arial", "I", size - 1)
+    pdf.multi_cell(0, size * 0.5, DISCLAIMER)
+
+    for p in range(tax_pages):
+        pdf.add_page()
+        header()
+        pdf.set_font("Arial", "B", size + 1)
+        pdf.cell(0, size * 0.8, f"Income Tax Computation FY 2026-27 ({company})", 0, 1, "C")
+        pdf.set_font("Arial", "", size)
+        running = gross * 12
+        for item in ("Gross Salary (annual)", "Standard Deduction", "Section 80C", "Section 80D",
+                     "Taxable Income", "Tax on Total Income", "Cess @ 4%", "Tax Deducted till Date",
+                     "Balance Tax Payable", "Projected Annual Tax"):
+            running = max(0, running - rng.randrange(0, 60000, 100))
+            _table(pdf, [(item, inr(running), "Month-wise", inr(running // 12))], [usable / 4] * 4, ruled, size)
+
+    scanned = rng.random() < 0.3
+    if scanned:
+        _write_scanned(pdf, rng, path, fmt)
+    else:
+        pdf.output(path)
+    return {"path": path, "net_pay": net, "gross": gross, "format": fmt, "font_size": size, "ruled": ruled,
+            "net_in_table": net_in_table, "pages": 1 + tax_pages, "scanned": scanned}
+
+
+def _write_scanned(pdf, rng, path, fmt):
+    """Re-emit the slip as page images (150 dpi, noise, small skew), like a scanned upload."""
+    import fitz
+    import numpy as np
+    from PIL import Image
+
+    src = fitz.open(stream=pdf.output(dest="S").encode("latin-1"), filetype="pdf")
+    out = FPDF("P", "mm", fmt)
+    w, h = FORMATS[fmt]
+    tmp = []
+    for i, page in enumerate(src):
+        pix = page.get_pixmap(matrix=fitz.Matrix(150 / 72, 150 / 72), colorspace=fitz.csGRAY)
+        img = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+        img = img.rotate(rng.uniform(-0.8, 0.8), fillcolor=255, resample=Image.BILINEAR)
+        arr = np.asarray(img, dtype=np.int16) + np.random.default_rng(rng.randint(0, 2 ** 31)).normal(0, 12, (img.height, img.width))
+        img = Image.fromarray(np.clip(arr - 18, 0, 255).astype("uint8"))
+        name = f"{path}.{i}.jpg"
+        img.save(name, quality=70)
+        tmp.append(name)
+        out.add_page()
+        out.image(name, 0, 0, w, h)
+    src.close()
+    out.output(path)
+    for name in tmp:
+        os.remove(name)
+
+
+def build_corpus(out_dir, docs, seed=7):
+    """docs payslips in out_dir (reused if the manifest matches); returns their ground truth."""
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = os.path.join(out_dir, "manifest.jsonl")
+    if os.path.exists(manifest):
+        with open(manifest, encoding="utf-8") as f:
+            slips = [json.loads(line) for line in f]
+        if (len(slips) == docs and slips and slips[0].get("seed") == seed and slips[0].get("version") == CORPUS_VERSION
+                and all(os.path.exists(s["path"]) for s in slips)):
+            return slips
+    rng = random.Random(seed)
+    slips = []
+    for i in range(docs):
+        slip = render_payslip(rng, os.path.join(out_dir, f"slip_{i:03d}.pdf"))
+        slips.append({**slip, "seed": seed, "version": CORPUS_VERSION})
+    with open(manifest, "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(s) + "\n" for s in slips)
+    return slips
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic payslips with known net pay")
+    parser.add_argument("--docs", type=int, default=40)
+    parser.add_argument("--out-dir", default="/tmp/payslips")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    slips = build_corpus(args.out_dir, args.docs, args.seed)
+    print(f"{len(slips)} payslips in {args.out_dir} "
+          f"({sum(s['scanned'] for s in slips)} scanned, {sum(s['pages'] > 1 for s in slips)} multi-page)")
+
+
+if __name__ == "__main__":
+    main()
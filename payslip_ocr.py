@@ -0,0 +1,250 @@
+# payslip_ocr.py
+# Salary from a scanned payslip page: slips without a text layer (photos and
+# scans, stored as image PDFs by ingest.py) in salary_handling, and
+# mock_data.extract_salary_from_slip.
+#
+#   1. resolution: a 1x probe render measures the page's text height; the page
+#      is rendered at the zoom that brings it to ~OCR_TARGET_TEXT_PX (what
+#      Tesseract reads best), between MIN_ZOOM and MAX_ZOOM and within
+#      MAX_PAGE_PIXELS for its size. Small print gets more pixels, large print
+#      and big pages fewer, instead of a fixed 2x. Photos are resized likewise.
+#   2. regions: table ruling is removed (it garbles block OCR), words are grouped into rows, and
+#      runs of label ... amount rows (a wide gap between columns) become table
+#      regions, with the rows right next to them (a "Net Pay" line under the
+#      table).
+#   3. the regions are OCR'd first, in page order, until one has a net pay
+#      amount (mock_data.find_net_pay)
+#   4. only if none has: the whole page, with find_salary_in_text's heuristics
+#
+#   python payslip_ocr.py bench --docs 40     # fixed 2x full page vs adaptive, on payslip_corpus.py slips
+import argparse
+import os
+import time
+
+import cv2
+import fitz  # pymupdf
+import numpy as np
+from PIL import Image
+
+from mock_data import find_net_pay, find_salary_in_text
+from ocr_engine import ocr_engine
+from telemetry import counter, get_logger
+
+OCR_TARGET_TEXT_PX = float(os.getenv("OCR_TARGET_TEXT_PX", "16"))
+OCR_REGIONS = os.getenv("OCR_REGIONS", "1") == "1"   # 0: always OCR the whole page
+PROBE_ZOOM = 1.0
+MIN_ZOOM, MAX_ZOOM, DEFAULT_ZOOM = 1.0, 3.0, 2.0
+MAX_PAGE_PIXELS = 16_000_000
+PSM_BLOCK = 6   # a region is one block of rows: keeps "Net Pay | 72,450" on one line
+
+log = get_logger("payslip_ocr")
+STAGES = counter("loanbot_payslip_ocr_total", "Payslip OCR results by the stage that found the salary")
+
+
+# ----------------------------------------------------------
+# Resolution
+# ----------------------------------------------------------
+def binarize(gray):
+    """Otsu threshold: text black (0) on white (255)."""
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return binary
+
+
+def text_height(binary):
+    """Median height (px) of character-sized blobs, or None if the page has too few."""
+    n, _, stats, _ = cv2.connectedComponentsWithStats(255 - binary, connectivity=8)
+    h, w = stats[1:, cv2.CC_STAT_HEIGHT], stats[1:, cv2.CC_STAT_WIDTH]
+    chars = h[(h >= 3) & (h <= binary.shape[0] // 20) & (w <= 2 * h) & (stats[1:, cv2.CC_STAT_AREA] >= 4)]
+    return float(np.median(chars)) if len(chars) >= 20 else None
+
+
+def _clamp_zoom(zoom, width, height):
+    zoom = min(max(zoom, MIN_ZOOM), MAX_ZOOM)
+    return min(zoom, (MAX_PAGE_PIXELS / max(1.0, width * height)) ** 0.5)
+
+
+def _render_gray(page, zoom):
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+    return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width)
+
+
+def render_pdf_page(path, page_no=0):
+    """(grayscale page at the adaptive zoom, zoom) for page page_no of the PDF (a path or its bytes)."""
+    with (fitz.open(stream=path, filetype="pdf") if isinstance(path, bytes) else fitz.open(path)) as doc:
+        if doc.page_count <= page_no:
+            raise RuntimeError("PDF has no pages")
+        page = doc.load_page(page_no)
+        probe_h = text_height(binarize(_render_gray(page, PROBE_ZOOM)))
+        zoom = OCR_TARGET_TEXT_PX * PROBE_ZOOM / probe_h if probe_h else DEFAULT_ZOOM
+        zoom = _clamp_zoom(zoom, page.rect.width, page.rect.height)
+        return _render_gray(page, zoom), zoom
+
+
+def scale_image(gray):
+    """(photo or image upload resized so its text is ~OCR_TARGET_TEXT_PX high, scale)."""
+    h = text_height(binarize(gray))
+    if not h:
+        return gray, 1.0
+    scale = min(max(OCR_TARGET_TEXT_PX / h, 0.25), MAX_ZOOM)
+    scale = min(scale, (MAX_PAGE_PIXELS / (gray.shape[0] * gray.shape[1])) ** 0.5)
+    if abs(scale - 1.0) < 0.1:
+        return gray, 1.0
+    interp = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+    return cv2.resize(gray, None, fx=scale, fy=scale, interpolation=interp), scale
+
+
+# ----------------------------------------------------------
+# Table regions
+# ----------------------------------------------------------
+def _remove_rules(ink, text_h):
+    """Ink without table ruling (long horizontal / vertical strokes)."""
+    long_h = cv2.morphologyEx(ink, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (int(text_h * 6), 1)))
+    long_v = cv2.morphologyEx(ink, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (1, int(text_h * 2.5))))
+    return cv2.subtract(ink, cv2.bitwise_or(long_h, long_v))
+
+
+def _rows(ink, text_h):
+    """Text rows, top to bottom: [(top, bottom, [(x0, x1), ...] phrases left to right)]."""
+    # letters -> phrases: close gaps narrower than about two letter widths
+    words = cv2.dilate(ink, cv2.getStructuringElement(cv2.MORPH_RECT, (max(3, int(text_h * 0.9)), 1)))
+    n, _, stats, _ = cv2.connectedComponentsWithStats(words, connectivity=8)
+    boxes = [(y, y + h, x, x + w) for x, y, w, h, area in stats[1:]
+             if text_h * 0.5 <= h <= text_h * 3 and area >= text_h]
+    boxes.sort(key=lambda b: (b[0] + b[1]) / 2)
+    rows = []
+    for top, bottom, x0, x1 in boxes:
+        mid = (top + bottom) / 2
+        if rows and mid - rows[-1][3] < text_h * 0.6:
+            row = rows[-1]
+            row[0], row[1] = min(row[0], top), max(row[1], bottom)
+            row[2].append((x0, x1))
+        else:
+            rows.append([top, bottom, [(x0, x1)], mid])
+    return [(top, bottom, sorted(spans)) for top, bottom, spans, _ in rows]
+
+
+def table_regions(ink, text_h):
+    """
+    Likely table regions of a page's ink (white on black, rules removed), top
+    to bottom, as (x0, y0, x1, y1): runs of 2+ rows whose phrases are split by
+    a wide column gap, plus the row directly above and below each run.
+    """
+    rows = _rows(ink, text_h)
+    gap = text_h * 3
+    tabular = [any(b[0] - a[1] >= gap for a, b in zip(spans, spans[1:])) for _, _, spans in rows]
+
+    runs, start = [], None
+    for i, tab in enumerate(tabular + [False]):
+        if tab and start is None:
+            start = i
+        elif not tab and start is not None:
+            if i - start >= 2:
+                runs.append((start, i - 1))
+            start = None
+
+    regions, near = [], text_h * 4
+    for first, last in runs:
+        if first > 0 and rows[first][0] - rows[first - 1][1] <= near:
+            first -= 1
+        if last + 1 < len(rows) and rows[last + 1][0] - rows[last][1] <= near:
+            last += 1
+        part = rows[first:last + 1]
+        pad = int(text_h)
+        x0 = min(spans[0][0] for _, _, spans in part) - pad
+        x1 = max(spans[-1][1] for _, _, spans in part) + pad
+        y0, y1 = part[0][0] - pad, part[-1][1] + pad
+        h, w = ink.shape
+        region = (max(0, int(x0)), max(0, int(y0)), min(w, int(x1)), min(h, int(y1)))
+        if regions and region[1] <= regions[-1][3]:   # overlapping the previous one: merge
+            prev = regions.pop()
+            region = (min(prev[0], region[0]), prev[1], max(prev[2], region[2]), max(prev[3], region[3]))
+        regions.append(region)
+    return regions
+
+
+# ----------------------------------------------------------
+# OCR
+# ----------------------------------------------------------
+def _ocr(binary, psm=None):
+    return ocr_engine.image_to_string(Image.fromarray(binary), psm=psm)
+
+
+def salary_from_page(gray):
+    """
+    (monthly salary or 0, details) from a grayscale page already at OCR
+    resolution: table regions first, the whole page only if they have no salary.
+    """
+    binary = binarize(gray)
+    text_h = text_height(binary)
+    details = {"text_px": text_h, "regions": 0, "stage": "none"}
+    if OCR_REGIONS and text_h:
+        clean = 255 - _remove_rules(255 - binary, text_h)   # cell borders garble block OCR
+        regions = table_regions(255 - clean, text_h)
+        details["regions"] = len(regions)
+        texts = []
+        for x0, y0, x1, y1 in regions:
+            texts.append(_ocr(clean[y0:y1, x0:x1], PSM_BLOCK))
+            val = find_net_pay("\n".join(texts))
+            if val:
+                details.update(stage="regions", region_px=sum((r[2] - r[0]) * (r[3] - r[1]) for r in regions))
+                STAGES.inc(stage="regions")
+                return val, details
+    val = find_salary_in_text(_ocr(binary))
+    details["stage"] = "page" if val else "none"
+    STAGES.inc(stage=details["stage"])
+    return val, details
+
+
+def salary_from_file(path, source_type):
+    """(monthly salary or 0, details) from a payslip PDF (first page; path or bytes) or image file."""
+    if source_type == "pdf":
+        gray, zoom = render_pdf_page(path)
+    else:
+        gray, zoom = scale_image(np.asarray(Image.open(path).convert("L")))
+    val, details = salary_from_page(gray)
+    details.update(zoom=round(zoom, 2), px=gray.shape[0] * gray.shape[1])
+    log.info("payslip_ocr.done", salary=val, **details)
+    return val, details
+
+
+# ----------------------------------------------------------
+# CLI
+# ----------------------------------------------------------
+def _fixed_full_page(path):
+    """The previous pipeline: first page at 2x, whole page OCR'd."""
+    from mock_data import _pdf_first_page_to_pil
+
+    gray = np.asarray(_pdf_first_page_to_pil(path, zoom=2).convert("L"))
+    return find_salary_in_text(_ocr(binarize(gray)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Payslip OCR: fixed 2x full page vs adaptive regions")
+    parser.add_argument("command", choices=["bench"])
+    parser.add_argument("--docs", type=int, default=40)
+    parser.add_argument("--corpus-dir", default="/tmp/payslips")
+    parser.add_argument("--verbose", action="store_true", help="print every miss")
+    args = parser.parse_args()
+
+    from payslip_corpus import build_corpus
+
+    slips = build_corpus(args.corpus_dir, args.docs)
+    ocr_engine.warm()
+    for label, extract in (("fixed 2x, full page", _fixed_full_page),
+                           ("adaptive, regions first", lambda p: salary_from_file(p, "pdf")[0])):
+        correct, times = 0, []
+        for slip in slips:
+            t0 = time.perf_counter()
+            val = extract(slip["path"])
+            times.append(time.perf_counter() - t0)
+            correct += val == slip["net_pay"]
+            if args.verbose and val != slip["net_pay"]:
+                print(f"  miss {slip['path']}: {val} (net pay {slip['net_pay']})")
+        times.sort()
+        print(f"{label:<24} accuracy {correct}/{len(slips)} ({correct / len(slips):.0%})  "
+              f"mean {sum(times) / len(times) * 1000:6.0f} ms  p50 {times[len(times) // 2] * 1000:6.0f} ms  "
+              f"p95 {times[int(len(times) * 0.95)] * 1000:6.0f} ms per document")
+
+
+if __name__ == "__main__":
+    main()
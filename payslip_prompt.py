@@ -0,0 +1,153 @@
+# payslip_prompt.py
+# Payslip text cut down to what the salary prompt needs (salary_handling.py).
+#
+# A slip's text layer is every page: the pay table, but also employee details,
+# disclaimers, income-tax computation pages and the page header printed again
+# on each page. All of it used to go to Gemini. Only these lines are kept:
+#   net pay      "Net Pay", "Net Salary", "Take Home", "Amount Credited" ...
+#   earnings     basic, HRA, allowances, bonus, gross earnings
+#   deductions   PF, professional tax, TDS, ESI, loan recovery, total deductions
+#   context      pay period / "payslip for the month of"
+# A label whose amount is not on its own line (one table cell per line) keeps
+# the WINDOW lines after it (a long line or a sentence without an amount is
+# prose, not a label). Repeated lines (page headers) are kept once.
+# Annual and tax-computation lines (FY, Section 80C, taxable income, YTD) are
+# dropped unless they carry net pay. Over PAYSLIP_PROMPT_TOKENS, deductions and
+# then earnings lines go first; net pay lines are always kept. Text with no
+# label at all is sent whole, only truncated to the cap.
+#
+#   python payslip_prompt.py bench --docs 40   # prompt tokens, latency and accuracy: full text vs reduced (stub model)
+import argparse
+import math
+import os
+import re
+import time
+
+from bench_utils import percentile
+
+PAYSLIP_PROMPT_TOKENS = int(os.getenv("PAYSLIP_PROMPT_TOKENS", "600"))   # 0: send the whole text
+WINDOW = 2
+LABEL_WORDS = 6   # a line without an amount is a label (table cell) only if this short and not a sentence
+
+NET = re.compile(r"net\s*(?:pay|salary|amount|payable)|take[\s-]*home|amount\s+credited", re.IGNORECASE)
+EARNINGS = re.compile(r"earning|basic|\bhra\b|house\s+rent|allowance|bonus|incentive|overtime|gross|dearness|\bda\b",
+                      re.IGNORECASE)
+DEDUCTIONS = re.compile(r"deduction|provident|\be?pf\b|professional\s+tax|\btds\b|income\s+tax|\besic?\b|"
+                        r"loan\s+recovery|insurance|advance", re.IGNORECASE)
+CONTEXT = re.compile(r"pay\s*(?:slip|period)|month\s+of|salary\s+(?:slip|statement)", re.IGNORECASE)
+NOISE = re.compile(r"\bannual|\bfy\b|financial\s+year|section\s*\d|\b80[cd]\b|taxable|projected|till\s+date|\bcess\b|"
+                   r"computation|standard\s+deduction|year\s+to\s+date|\bytd\b|in\s+words|disclaimer|computer\s+generated",
+                   re.IGNORECASE)
+AMOUNT = re.compile(r"\d{1,3}(?:,\d{2,3})+(?:\.\d+)?|\d{3,}(?:\.\d+)?")
+
+# lower = dropped last when over the cap
+NET_PRIORITY, CONTEXT_PRIORITY, EARNINGS_PRIORITY, DEDUCTIONS_PRIORITY = 0, 1, 2, 3
+
+
+def estimate_tokens(text):
+    """Gemini-style token estimate: ~4 characters per token."""
+    return math.ceil(len(text) / 4)
+
+
+def _lines(text):
+    """Non-empty lines, whitespace collapsed, each distinct line once (first occurrence)."""
+    seen, lines = set(), []
+    for raw in text.splitlines():
+        line = " ".join(raw.split())
+        key = line.lower()
+        if line and key not in seen:
+            seen.add(key)
+            lines.append(line)
+    return lines
+
+
+def _priority(line):
+    if not AMOUNT.search(line) and (len(line.split()) > LABEL_WORDS or line.endswith(".")):
+        return None   # prose (a disclaimer mentioning deductions), not a label
+    if NET.search(line):
+        return NET_PRIORITY
+    if NOISE.search(line):
+        return None
+    if CONTEXT.search(line):
+        return CONTEXT_PRIORITY
+    if EARNINGS.search(line):
+        return EARNINGS_PRIORITY
+    if DEDUCTIONS.search(line):
+        return DEDUCTIONS_PRIORITY
+    return None
+
+
+def _truncate(text, max_tokens):
+    return text[:max_tokens * 4] if max_tokens and estimate_tokens(text) > max_tokens else text
+
+
+def reduce_payslip_text(text, max_tokens=PAYSLIP_PROMPT_TOKENS):
+    """The salary-relevant lines of a payslip's text, within max_tokens (0: text unchanged)."""
+    if not max_tokens:
+        return text
+    lines = _lines(text)
+    keep = {}   # line index -> priority
+    for i, line in enumerate(lines):
+        prio = _priority(line)
+        if prio is None:
+            continue
+        keep[i] = min(prio, keep.get(i, prio))
+        if prio != CONTEXT_PRIORITY and not AMOUNT.search(line):
+            # label without its amount: the cells that follow it
+            for j in range(i + 1, min(i + 1 + WINDOW, len(lines))):
+                if AMOUNT.search(lines[j]) and not NOISE.search(lines[j]):
+                    keep[j] = min(prio, keep.get(j, prio))
+    if not any(p != CONTEXT_PRIORITY for p in keep.values()):
+        return _truncate("\n".join(lines), max_tokens)
+
+    kept = sorted(keep)
+    budget = max_tokens * 4 - sum(len(lines[i]) + 1 for i in kept)
+    # over the cap: lowest priority first, bottom of the page first
+    for i in sorted(kept, key=lambda i: (-keep[i], -i)):
+        if budget >= 0 or keep[i] == NET_PRIORITY:
+            break
+        kept.remove(i)
+        budget += len(lines[i]) + 1
+    return _truncate("\n".join(lines[i] for i in kept), max_tokens)
+
+
+# ----------------------------------------------------------
+# CLI
+# ----------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Payslip prompt size: full text vs reduced, through the stub model")
+    parser.add_argument("command", choices=["bench"])
+    parser.add_argument("--docs", type=int, default=40)
+    parser.add_argument("--corpus-dir", default="/tmp/payslips")
+    parser.add_argument("--latency", type=float, default=0.3, help="stub model latency per call (s)")
+    parser.add_argument("--per-1k-tokens", type=float, default=0.25,
+                        help="stub model latency per 1,000 prompt tokens (s)")
+    args = parser.parse_args()
+    os.environ.setdefault("GOOGLE_API_KEY", "stub")
+
+    from payslip_corpus import build_corpus
+    from salary_handling import build_salary_prompt, extract_text_from_payslip, get_monthly_salary_from_payslip
+    from stub_llm import install_stub_llm
+
+    install_stub_llm(latency=args.latency, per_1k_tokens=args.per_1k_tokens)
+    slips = [s for s in build_corpus(args.corpus_dir, args.docs) if not s["scanned"]]   # scans go to OCR
+    print(f"{len(slips)} text-layer payslips "
+          f"({sum(s['pages'] > 1 for s in slips)} with tax-computation pages), stub model "
+          f"{args.latency * 1000:.0f} ms + {args.per_1k_tokens * 1000:.0f} ms per 1k prompt tokens")
+    for label, max_tokens in (("full text", 0), (f"reduced (cap {PAYSLIP_PROMPT_TOKENS})", PAYSLIP_PROMPT_TOKENS)):
+        tokens, times, correct = [], [], 0
+        for slip in slips:
+            with open(slip["path"], "rb") as f:
+                tokens.append(estimate_tokens(build_salary_prompt(extract_text_from_payslip(f), max_tokens)))
+            t0 = time.perf_counter()
+            with open(slip["path"], "rb") as f:
+                salary = get_monthly_salary_from_payslip(f, max_prompt_tokens=max_tokens)
+            times.append(time.perf_counter() - t0)
+            correct += salary == slip["net_pay"]
+        print(f"{label:<20} prompt tokens mean {sum(tokens) / len(tokens):6.0f} max {max(tokens):5d}  "
+              f"latency p50 {percentile(times, 50) * 1000:5.0f} ms p95 {percentile(times, 95) * 1000:5.0f} ms  "
+              f"accuracy {correct}/{len(slips)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,40 @@
 from fpdf import FPDF
+import copy
 import os
 from datetime import datetime
-from mock_data import INTEREST_RATE
+from rule_engine import interest_rate
+from telemetry import timed
+
+LOGO_PATH = "assets/tc_logo.png"
+
+
+def load_logo(path=LOGO_PATH):
+    """
+    Parse the logo PNG once (decoding it is ~half of a letter's render time).
+    Long-lived renderers (document_service.py) pass the result to every PDF.
+    """
+    if not os.path.exists(path):
+        return None
+    return FPDF()._parsepng(path)
+
 
 class PDF(FPDF):
+    def __init__(self, logo=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.text_rgb = (0, -1, -1)   # last set_text_color() args (template field styles)
+        if logo is not None:
+            # seed FPDF's per-document image cache so image() skips decoding
+            self.images[LOGO_PATH] = dict(logo, i=len(self.images) + 1)
+            if logo.get("smask") and self.pdf_version < "1.4":
+                self.pdf_version = "1.4"   # what parsing an alpha PNG would have set
+
+    def set_text_color(self, r, g=-1, b=-1):
+        self.text_rgb = (r, g, b)
+        super().set_text_color(r, g, b)
+
     def header(self):
         # Add Tata Capital logo at the top
-        logo_path = "assets/tc_logo.png"
-        if os.path.exists(logo_path):
+        if LOGO_PATH in self.images or os.path.exists(LOGO_PATH):
             # Logo dimensions: 1011x205 pixels
             # Scale to fit width of 60mm while maintaining aspect ratio
             logo_width = 60
@@ -15,7 +42,7 @@ class PDF(FPDF):
             
             # Center the logo
             x_position = (210 - logo_width) / 2  # A4 width is 210mm
-            self.image(logo_path, x=x_position, y=10, w=logo_width, h=logo_height)
+            self.image(LOGO_PATH, x=x_position, y=10, w=logo_width, h=logo_height)
             self.ln(logo_height + 5)  # Space after logo
         
         # Title
@@ -29,20 +56,42 @@ class PDF(FPDF):
         self.set_text_color(128, 128, 128)
         self.cell(0, 10, f'Page {self.page_no()} | Tata Capital Limited | www.tatacapital.com', 0, 0, 'C')
 
-def create_sanction_letter(customer_name, phone, amount, emi, tenure):
-    pdf = PDF()
+# Bump whenever the static layout / wording changes: it is part of the letter's
+# content hash (letter_store.py), so old letters are not reused for new ones.
+LETTER_LAYOUT_VERSION = "1"
+
+
+def _letter_fields(customer_name, phone, amount, emi, tenure, now=None, rate=None):
+    """Per-letter text; everything else on the page is static (see SanctionLetterTemplate)."""
+    now = now or datetime.now()
+    rate = interest_rate() if rate is None else rate   # the approved (risk-based) rate
+    return {
+        "date": f"Date: {now.strftime('%B %d, %Y')}",
+        "reference": f"Reference No: TC/{phone}/{now.strftime('%Y%m%d')}",
+        "name": customer_name,
+        "mobile": f"Mobile: {phone}",
+        "greeting": f"Dear {customer_name},",
+        "amount": f"INR {amount:,}",
+        "rate": f"{rate}% per annum",
+        "tenure": f"{tenure} Months",
+        "emi": f"INR {emi:,.2f}",
+    }
+
+
+def _layout_sanction_letter(pdf, field):
+    """
+    Lay out the whole letter. Per-letter values go through field(key, w, h, ln),
+    which either writes the text or (template build) only reserves its place.
+    """
     pdf.add_page()
     pdf.set_left_margin(15)  # Set left margin to prevent overflow
     pdf.set_right_margin(15)  # Set right margin for better layout
     
-    # Use current date
-    current_date = datetime.now().strftime("%B %d, %Y")
-    
     # Date and Reference
     pdf.set_font("Arial", size=10)
     pdf.set_text_color(80, 80, 80)
-    pdf.cell(0, 6, f"Date: {current_date}", 0, 1)
-    pdf.cell(0, 6, f"Reference No: TC/{phone}/{datetime.now().strftime('%Y%m%d')}", 0, 1)
+    field("date", 0, 6, 1)
+    field("reference", 0, 6, 1)
     pdf.ln(5)
     
     # Recipient details
@@ -50,8 +99,8 @@ def create_sanction_letter(customer_name, phone, amount, emi, tenure):
     pdf.set_text_color(0, 0, 0)
     pdf.cell(0, 6, "To:", 0, 1)
     pdf.set_font("Arial", size=11)
-    pdf.cell(0, 6, customer_name, 0, 1)
-    pdf.cell(0, 6, f"Mobile: {phone}", 0, 1)
+    field("name", 0, 6, 1)
+    field("mobile", 0, 6, 1)
     pdf.ln(5)
     
     # Subject
@@ -61,7 +110,7 @@ def create_sanction_letter(customer_name, phone, amount, emi, tenure):
     
     # Greeting
     pdf.set_font("Arial", size=11)
-    pdf.cell(0, 6, f"Dear {customer_name},", 0, 1)
+    field("greeting", 0, 6, 1)
     pdf.ln(3)
     
     # Body text with proper wrapping
@@ -80,10 +129,10 @@ def create_sanction_letter(customer_name, phone, amount, emi, tenure):
     pdf.set_text_color(0, 0, 0)
     
     details = [
-        ("Approved Amount:", f"INR {amount:,}"),
-        ("Interest Rate:", f"{INTEREST_RATE}% per annum"),
-        ("Loan Tenure:", f"{tenure} Months"),
-        ("Monthly EMI:", f"INR {emi:,.2f}"),
+        ("Approved Amount:", "amount"),
+        ("Interest Rate:", "rate"),
+        ("Loan Tenure:", "tenure"),
+        ("Monthly EMI:", "emi"),
         ("Processing Fee:", "As per terms"),
         ("Disbursement:", "Within 24-48 hours")
     ]
@@ -92,7 +141,10 @@ def create_sanction_letter(customer_name, phone, amount, emi, tenure):
         pdf.set_font("Arial", 'B', 10)
         pdf.cell(70, 6, label, 0, 0)
         pdf.set_font("Arial", size=10)
-        pdf.cell(0, 6, value, 0, 1)
+        if value in ("amount", "rate", "tenure", "emi"):
+            field(value, 0, 6, 1)
+        else:
+            pdf.cell(0, 6, value, 0, 1)
     
     pdf.ln(5)
     
@@ -136,11 +188,64 @@ def create_sanction_letter(customer_name, phone, amount, emi, tenure):
     pdf.set_font("Arial", 'I', 9)
     pdf.set_text_color(80, 80, 80)
     pdf.cell(0, 6, "Digital Lending Platform", 0, 1)
+
+
+@timed("pdf.sanction_letter")
+def create_sanction_letter(customer_name, phone, amount, emi, tenure, logo=None, filename=None, now=None, rate=None):
+    pdf = PDF(logo=logo)
+    texts = _letter_fields(customer_name, phone, amount, emi, tenure, now, rate)
+    _layout_sanction_letter(pdf, lambda key, w, h, ln: pdf.cell(w, h, texts[key], 0, ln))
     
     # Ensure directory exists
     if not os.path.exists("static_pdfs"):
         os.makedirs("static_pdfs")
         
-    filename = f"static_pdfs/{phone}_sanction.pdf"
+    filename = filename or f"static_pdfs/{phone}_sanction.pdf"
     pdf.output(filename)
-    return filename
\ No newline at end of file
+    return filename
+
+
+class SanctionLetterTemplate:
+    """
+    The letter laid out once with its per-letter fields left blank; render()
+    copies that document and writes only the fields at their recorded spots.
+    Used for bulk rendering (batch_letters.py).
+    """
+
+    def __init__(self, logo=None):
+        self.fields = []
+        pdf = PDF(logo=logo)
+
+        def reserve(key, w, h, ln):
+            self.fields.append((key, pdf.page, pdf.get_x(), pdf.get_y(), w, h,
+                                pdf.font_family, pdf.font_style, pdf.font_size_pt, pdf.text_rgb))
+            pdf.cell(w, h, "", 0, ln)   # move the cursor exactly as the text would
+
+        _layout_sanction_letter(pdf, reserve)
+        self.base = pdf
+
+    def _clone(self):
+        # output() mutates the document's dicts and the per-font / per-image
+        # entries in them (object numbers, image data); two levels of copying
+        # is enough, and skips deep-copying the core-font width tables
+        pdf = copy.copy(self.base)
+        for name, value in vars(self.base).items():
+            if isinstance(value, dict):
+                setattr(pdf, name, {k: dict(v) if isinstance(v, dict) else v for k, v in value.items()})
+            elif isinstance(value, list):
+                setattr(pdf, name, list(value))
+        return pdf
+
+    def render(self, filename, customer_name, phone, amount, emi, tenure, now=None, rate=None):
+        pdf = self._clone()
+        texts = _letter_fields(customer_name, phone, amount, emi, tenure, now, rate)
+        last_page = pdf.page
+        for key, page, x, y, w, h, family, style, size, rgb in self.fields:
+            pdf.page = page
+            pdf.set_font(family, style, size)
+            pdf.set_text_color(*rgb)
+            pdf.set_xy(x, y)
+            pdf.cell(w, h, texts[key], 0, 0)
+        pdf.page = last_page
+        pdf.output(filename)
+        return filename
@@ -0,0 +1,279 @@
+# replay_chats.py
+# Re-drive recorded sessions from chat_history.db through GraphExecutor and
+# diff the new replies / step transitions against the recorded AI messages.
+#
+#   python replay_chats.py                          # all sessions, stub LLM, one process
+#   python replay_chats.py --workers 8 --limit 500  # process pool
+#   python replay_chats.py --live                   # real Gemini (needs GOOGLE_API_KEY)
+#   python replay_chats.py --session abc123 --show-diffs
+#
+# Each turn sees the *recorded* history up to that point (what production saw),
+# so one divergent reply does not cascade through the rest of the session.
+# Replays run in a temporary working directory seeded with customers.json,
+# intent_model.json, static_content.json and assets/; pass --with-uploads to also copy uploads/
+# (an uploaded slip then counts as present from the first turn, not from the
+# moment it was uploaded).
+import argparse
+import difflib
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from bench_utils import REPO_DIR, percentile, prepare_workdir
+
+
+# ----------------------------------------------------------
+# Reading sessions
+# ----------------------------------------------------------
+def iter_sessions(db_path, session=None, limit=None):
+    """
+    Yield (session_id, [(sender_type, content), ...]) one session at a time,
+    straight off a cursor (the table is never loaded whole).
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        sql = "SELECT session_id, sender_type, content FROM messages"
+        params = ()
+        if session:
+            sql += " WHERE session_id = ?"
+            params = (session,)
+        cur = conn.execute(sql + " ORDER BY session_id, id", params)
+
+        current, rows, count = None, [], 0
+        for session_id, sender, content in cur:
+            if session_id != current:
+                if rows:
+                    yield current, rows
+                    count += 1
+                    if limit and count >= limit:
+                        return
+                current, rows = session_id, []
+            rows.append((sender, content or ""))
+        if rows:
+            yield current, rows
+    finally:
+        conn.close()
+
+
+def _turns(rows):
+    """(history, user message, recorded reply) for every human message answered by an AI message."""
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    history, turns = [], []
+    for i, (sender, content) in enumerate(rows):
+        if sender == "human" and i + 1 < len(rows) and rows[i + 1][0] == "ai":
+            turns.append((list(history), content, rows[i + 1][1]))
+        history.append(HumanMessage(content=content) if sender == "human" else AIMessage(content=content))
+    return turns
+
+
+def _normalize(text):
+    return " ".join((text or "").split())
+
+
+# ----------------------------------------------------------
+# Worker
+# ----------------------------------------------------------
+def _init_worker(workdir, live, stub_latency):
+    # master_agent / mock_data resolve customers.json, uploads/, static_pdfs/ relative to CWD
+    os.chdir(workdir)
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    if not live:
+        os.environ.setdefault("GOOGLE_API_KEY", "stub")
+    os.makedirs("uploads", exist_ok=True)
+    os.makedirs("static_pdfs", exist_ok=True)
+
+    import master_agent  # noqa: F401  (build the graphs once per worker)
+    if not live:
+        from stub_llm import install_stub_llm
+        install_stub_llm(latency=stub_latency)
+
+
+def replay_session(item):
+    """Replay one recorded session; returns a list of per-turn records."""
+    import master_agent
+
+    session_id, rows = item
+    replay_id = f"replay-{session_id}"
+    master_agent.SESSION_STORE.pop(replay_id, None)
+
+    records = []
+    for idx, (history, user_input, recorded) in enumerate(_turns(rows)):
+        llm_calls = master_agent.llm.counts["calls"]
+        t0 = time.perf_counter()
+        error = None
+        try:
+            reply = master_agent.agent_executor.invoke({
+                "input": user_input,
+                "chat_history": history,
+                "session_id": replay_id,
+                "tenure": 12,
+            })["output"]
+        except Exception as e:
+            reply, error = "", repr(e)
+        elapsed = time.perf_counter() - t0
+
+        recorded_step = master_agent.infer_step_from_reply(recorded)
+        replayed_step = master_agent.infer_step_from_reply(reply)
+        records.append({
+            "session_id": session_id,
+            "turn": idx,
+            "input": user_input,
+            "recorded": recorded,
+            "replayed": reply,
+            "reply_match": _normalize(recorded) == _normalize(reply),
+            "similarity": round(difflib.SequenceMatcher(None, recorded, reply).ratio(), 3),
+            "recorded_step": recorded_step,
+            "replayed_step": replayed_step,
+            "step_match": recorded_step == replayed_step,
+            "graph_step": (master_agent.SESSION_STORE.get(replay_id) or {}).get("step"),
+            # LLM-written replies are not expected to match under the stub
+            "used_llm": master_agent.llm.counts["calls"] > llm_calls,
+            "latency_ms": round(elapsed * 1000, 2),
+            "error": error,
+        })
+    master_agent.SESSION_STORE.pop(replay_id, None)
+    return records
+
+
+def _run(sessions, workers, init_args):
+    """Yield per-session records, keeping at most 2*workers sessions in flight."""
+    if workers <= 0:
+        _init_worker(*init_args)
+        for item in sessions:
+            yield replay_session(item)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init_args) as pool:
+        pending = set()
+        for item in sessions:
+            pending.add(pool.submit(replay_session, item))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for f in done:
+                    yield f.result()
+        for f in pending:
+            yield f.result()
+
+
+# ----------------------------------------------------------
+# Report
+# ----------------------------------------------------------
+def _latency(values):
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50), 1),
+        "p95_ms": round(percentile(values, 95), 1),
+        "p99_ms": round(percentile(values, 99), 1),
+        "mean_ms": round(statistics.mean(values), 1) if values else 0.0,
+    }
+
+
+def summarize(records, wall):
+    deterministic = [r for r in records if not r["used_llm"]]
+    by_step = {}
+    for r in records:
+        by_step.setdefault(r["graph_step"] or "?", []).append(r["latency_ms"])
+
+    transitions = {}
+    for r in records:
+        if not r["step_match"]:
+            key = f"{r['recorded_step']} -> {r['replayed_step']}"
+            transitions[key] = transitions.get(key, 0) + 1
+
+    def rate(rows, field):
+        return round(sum(1 for r in rows if r[field]) / len(rows), 4) if rows else None
+
+    return {
+        "sessions": len({r["session_id"] for r in records}),
+        "turns": len(records),
+        "wall_s": round(wall, 2),
+        "turns_per_s": round(len(records) / wall, 1) if wall else 0.0,
+        "errors": sum(1 for r in records if r["error"]),
+        "llm_turns": len(records) - len(deterministic),
+        "reply_match_rate": rate(records, "reply_match"),
+        "reply_match_rate_deterministic": rate(deterministic, "reply_match"),
+        "step_match_rate": rate(records, "step_match"),
+        "step_match_rate_deterministic": rate(deterministic, "step_match"),
+        "step_mismatches": dict(sorted(transitions.items(), key=lambda kv: -kv[1])),
+        "latency": _latency([r["latency_ms"] for r in records]),
+        "latency_by_step": {k: _latency(v) for k, v in sorted(by_step.items())},
+    }
+
+
+def _print_summary(s):
+    print(f"replayed {s['sessions']} sessions / {s['turns']} turns in {s['wall_s']}s "
+          f"({s['turns_per_s']} turns/s), {s['errors']} errors, {s['llm_turns']} LLM turns")
+    print(f"reply match: {s['reply_match_rate']} (deterministic turns {s['reply_match_rate_deterministic']})")
+    print(f"step match:  {s['step_match_rate']} (deterministic turns {s['step_match_rate_deterministic']})")
+    for k, n in list(s["step_mismatches"].items())[:10]:
+        print(f"  step {k}: {n}")
+    lat = s["latency"]
+    print(f"turn latency: p50 {lat['p50_ms']}ms p95 {lat['p95_ms']}ms p99 {lat['p99_ms']}ms")
+    for step, l in s["latency_by_step"].items():
+        print(f"  {step:<18} n={l['count']:<6} p50 {l['p50_ms']}ms p95 {l['p95_ms']}ms p99 {l['p99_ms']}ms")
+
+
+def _print_diff(r):
+    print(f"--- {r['session_id']} turn {r['turn']}: {r['input']!r} "
+          f"(step {r['recorded_step']} -> {r['replayed_step']}, {'llm' if r['used_llm'] else 'rules'})")
+    for line in difflib.unified_diff(r["recorded"].splitlines(), r["replayed"].splitlines(),
+                                     "recorded", "replayed", lineterm="", n=1):
+        print("   ", line)
+    if r["error"]:
+        print("    error:", r["error"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay chat_history.db sessions through GraphExecutor")
+    parser.add_argument("--db", default="chat_history.db")
+    parser.add_argument("--session", help="replay a single session_id")
+    parser.add_argument("--limit", type=int, help="max sessions")
+    parser.add_argument("--workers", type=int, default=0, help="process pool size (0 = in-process)")
+    parser.add_argument("--live", action="store_true", help="call the real Gemini API instead of the stub")
+    parser.add_argument("--stub-latency", type=float, default=0.0)
+    parser.add_argument("--with-uploads", action="store_true", help="copy uploads/ into the replay sandbox")
+    parser.add_argument("--show-diffs", action="store_true", help="print diffs of mismatching rule-based turns")
+    parser.add_argument("--out", help="write summary + per-turn records (JSON)")
+    args = parser.parse_args()
+
+    db_path = os.path.abspath(args.db)
+    out = os.path.abspath(args.out) if args.out else None
+    workdir = prepare_workdir("loanbot-replay-", ["uploads"] if args.with_uploads else [])
+
+    records = []
+    t0 = time.perf_counter()
+    try:
+        sessions = iter_sessions(db_path, session=args.session, limit=args.limit)
+        for session_records in _run(sessions, args.workers, (workdir, args.live, args.stub_latency)):
+            records.extend(session_records)
+            if args.show_diffs:
+                for r in session_records:
+                    if not r["used_llm"] and (not r["reply_match"] or r["error"]):
+                        _print_diff(r)
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+    wall = time.perf_counter() - t0
+
+    if not records:
+        print("no replayable turns found")
+        return
+    summary = summarize(records, wall)
+    _print_summary(summary)
+
+    if out:
+        os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "config": vars(args), "turns": records}, f, indent=2, ensure_ascii=False)
+        print(f"results -> {out}")
+
+
+if __name__ == "__main__":
+    main()
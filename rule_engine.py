@@ -0,0 +1,426 @@
+# rule_engine.py
+# Underwriting rules as data (underwriting_rules.json), compiled to Python.
+#
+#   params  named constants (interest_rate, min_credit_score, ...);
+#           interest_rate is the base rate (interest_rate()) the pricing grid
+#           builds on
+#   derive  named expressions over the application and params (emi, ...),
+#           computed only on the paths that need them
+#   rules   checked in order; the first whose "when" holds decides. "output"
+#           values are text templates ("{name}" / "{name:.0%}") or, with a
+#           leading "=", expressions
+#   pricing risk-based rate grid; not read here - the builder agents.py
+#           installs (set_pricing) turns it into the object behind rate_for()
+#
+# Application fields: credit_score, limit, amount, salary (None = no slip),
+# tenure. Expressions allow comparisons, arithmetic, and / or / not, "is None",
+# and the functions rate_for(credit_score, amount, tenure), emi(amount, tenure,
+# rate), max_affordable(max_emi, tenure, rate), min, max, int, round - nothing
+# else gets past compile.
+#
+# The file is re-read when its mtime changes (checked at most every
+# RULES_RELOAD_INTERVAL seconds); a file whose rules or pricing fail to build
+# is logged and the previous rules and pricing stay in force.
+#
+#   python rule_engine.py verify     # compiled rules vs the reference branches
+#   python rule_engine.py bench      # per-application and batch latency
+#   python rule_engine.py show       # generated evaluator source
+import argparse
+import ast
+import itertools
+import json
+import os
+import string
+import sys
+import threading
+import time
+
+from telemetry import counter, get_logger, histogram
+
+RULES_FILE = os.getenv("UNDERWRITING_RULES", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                          "underwriting_rules.json"))
+RULES_RELOAD_INTERVAL = float(os.getenv("RULES_RELOAD_INTERVAL", "2"))
+
+APPLICATION_FIELDS = ("credit_score", "limit", "amount", "salary", "tenure")
+FUNCTIONS = ("rate_for", "emi", "max_affordable", "min", "max", "int", "round")
+
+log = get_logger("rule_engine")
+EVAL_SECONDS = histogram("loanbot_rule_eval_seconds", "Underwriting rule evaluation time (per call)",
+                         buckets=(0.00001, 0.00002, 0.00005, 0.0001, 0.0002, 0.0005, 0.001, 0.005, 0.01, 0.1, 1.0))
+RULE_HITS = counter("loanbot_rule_decisions_total", "Underwriting decisions by deciding rule")
+
+
+class RuleError(ValueError):
+    """Rule file that does not compile."""
+
+
+# ----------------------------------------------------------
+# Math (same formulas as agents.calculate_emi / underwriting_agent)
+# ----------------------------------------------------------
+def _emi(principal, rate, tenure):
+    if tenure == 0:
+        return 0
+    r = rate / 1200
+    try:
+        return round(principal * r * (1 + r) ** tenure / ((1 + r) ** tenure - 1), 2)
+    except ZeroDivisionError:
+        return 0
+
+
+def _max_affordable(max_emi, rate, tenure):
+    r = rate / 1200
+    if r > 0:
+        return int(max_emi * ((1 + r) ** tenure - 1) / (r * (1 + r) ** tenure))
+    return int(max_emi * tenure)
+
+
+# ----------------------------------------------------------
+# Compiler
+# ----------------------------------------------------------
+_ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.BinOp, ast.UnaryOp, ast.Compare, ast.IfExp, ast.Call, ast.Name,
+    ast.Load, ast.Constant, ast.And, ast.Or, ast.Not, ast.USub, ast.UAdd,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+    ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq, ast.Is, ast.IsNot,
+)
+
+
+def _names(expr, where, known):
+    """Validate expr; return the names it reads."""
+    try:
+        tree = ast.parse(expr, mode="eval")
+    except SyntaxError as e:
+        raise RuleError(f"{where}: {e.msg} in {expr!r}") from None
+    names = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise RuleError(f"{where}: {type(node).__name__} not allowed in {expr!r}")
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or node.keywords:
+                raise RuleError(f"{where}: only {', '.join(FUNCTIONS)} can be called ({expr!r})")
+        elif isinstance(node, ast.Name) and node.id not in FUNCTIONS:
+            if node.id not in known:
+                raise RuleError(f"{where}: unknown name {node.id!r}")
+            names.add(node.id)
+    return names
+
+
+def _template(text, where, known):
+    """Template -> (f-string source, names it reads)."""
+    names = set()
+    try:
+        parts = list(string.Formatter().parse(text))
+    except ValueError as e:
+        raise RuleError(f"{where}: {e}") from None
+    for _, field, spec, conv in parts:
+        if field is None:
+            continue
+        if not field.isidentifier() or field not in known or conv or "{" in (spec or ""):
+            raise RuleError(f"{where}: bad placeholder {{{field}}}")
+        names.add(field)
+    return "f" + repr(text), names
+
+
+def compile_rules(spec, pricer=None):
+    """
+    Rule file dict -> (evaluate(app) -> (rule name, decision), params, generated
+    source). pricer(credit_score, amount, tenure) -> rate backs rate_for();
+    without one every application gets params.interest_rate.
+    """
+    params = dict(spec.get("params") or {})
+    if not isinstance(params.get("interest_rate"), (int, float)):
+        raise RuleError("params.interest_rate must be a number")
+    derive = dict(spec.get("derive") or {})
+    rules = spec.get("rules") or []
+    if not rules:
+        raise RuleError("no rules")
+    for name in itertools.chain(params, derive):
+        if not name.isidentifier() or name in FUNCTIONS or name in APPLICATION_FIELDS:
+            raise RuleError(f"bad name {name!r}")
+
+    known = set(APPLICATION_FIELDS) | set(params)
+    derive_deps = {}
+    for name, expr in derive.items():   # in order: a derived value may use earlier ones
+        derive_deps[name] = _names(expr, f"derive.{name}", known)
+        known.add(name)
+
+    def closure(names, have):
+        """Derived values to assign (in definition order) so names are all bound."""
+        need, todo = set(), [n for n in names if n in derive]
+        while todo:
+            n = todo.pop()
+            if n not in need and n not in have:
+                need.add(n)
+                todo.extend(d for d in derive_deps[n] if d in derive)
+        return [n for n in derive if n in need]
+
+    lines = ["def evaluate(a):"]
+    lines += [f"    {f} = a[{f!r}]" for f in APPLICATION_FIELDS]
+    have = set()
+    seen = set()
+    for i, rule in enumerate(rules):
+        name = rule.get("name") or f"rule_{i}"
+        if name in seen:
+            raise RuleError(f"duplicate rule name {name!r}")
+        seen.add(name)
+        status = rule.get("status")
+        if not isinstance(status, str) or not status:
+            raise RuleError(f"rules.{name}: status required")
+        cond = str(rule.get("when", "True"))
+        for d in closure(_names(cond, f"rules.{name}.when", known), have):
+            lines.append(f"    {d} = {derive[d]}")
+            have.add(d)
+        out_src, out_names = [f"'status': {status!r}"], set()
+        for key, value in (rule.get("output") or {}).items():
+            where = f"rules.{name}.output.{key}"
+            if isinstance(value, str) and value.startswith("="):
+                src, used = value[1:].strip(), _names(value[1:].strip(), where, known)
+            elif isinstance(value, str):
+                src, used = _template(value, where, known)
+            else:
+                src, used = repr(value), set()
+            out_src.append(f"{key!r}: {src}")
+            out_names |= used
+        lines.append(f"    if {cond}:")
+        lines += [f"        {d} = {derive[d]}" for d in closure(out_names, have)]
+        lines.append(f"        return {name!r}, {{{', '.join(out_src)}}}")
+    lines.append("    return None, {'status': 'ERROR', 'reason': 'No underwriting rule matched'}")
+    source = "\n".join(lines) + "\n"
+
+    base_rate = params["interest_rate"]
+    namespace = {
+        "__builtins__": {},
+        **params,
+        "rate_for": pricer or (lambda credit_score, amount, tenure: base_rate),
+        "emi": lambda amount, tenure, rate: _emi(amount, rate, tenure),
+        "max_affordable": lambda max_emi, tenure, rate: _max_affordable(max_emi, rate, tenure),
+        "min": min, "max": max, "int": int, "round": round,
+    }
+    try:
+        exec(compile(source, "<underwriting_rules>", "exec"), namespace)
+    except SyntaxError as e:
+        raise RuleError(f"generated evaluator does not compile: {e}") from None
+    return namespace["evaluate"], params, source
+
+
+# ----------------------------------------------------------
+# Hot-reloaded rule set
+# ----------------------------------------------------------
+class RuleEngine:
+    def __init__(self, path=RULES_FILE, reload_interval=RULES_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.version = None
+        self.spec = {}
+        self.params = {}
+        self.pricing = None
+        self._build_pricing = None
+        self.source = ""
+        self._evaluate = None
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if self._evaluate is not None and now - self._checked < self.reload_interval:
+            return
+        with self._lock:
+            if self._evaluate is not None and now - self._checked < self.reload_interval:
+                return
+            self._checked = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                if self._evaluate is None:
+                    raise
+                return   # file gone: keep the rules we have
+            if mtime == self._mtime:
+                return
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    spec = json.load(f)
+                pricing = self._build_pricing(spec) if self._build_pricing else None
+                evaluate, params, source = compile_rules(spec, pricing.rate if pricing else None)
+            except (OSError, ValueError, KeyError, TypeError) as e:   # RuleError / JSONDecodeError are ValueErrors
+                self._mtime = mtime   # don't re-parse a broken file on every check
+                if self._evaluate is None:
+                    raise
+                log.error("rules.reload_failed", path=self.path, error=str(e), version=self.version)
+                return
+            self._evaluate, self.spec, self.params, self.source = evaluate, spec, params, source
+            self.pricing = pricing
+            self.version = spec.get("version")
+            self._mtime = mtime
+            log.info("rules.loaded", path=self.path, version=self.version, rules=len(spec["rules"]))
+
+    def param(self, name):
+        self._maybe_reload()
+        return self.params[name]
+
+    def current_pricing(self):
+        """The object set_pricing's builder made from the rule file in force."""
+        self._maybe_reload()
+        return self.pricing
+
+    def set_pricing(self, build):
+        """
+        build(rule file dict) -> object whose rate(credit_score, amount, tenure)
+        backs rate_for(); run on every load, before the rules are swapped in.
+        """
+        self._build_pricing = build
+        with self._lock:
+            self._mtime = None   # recompile with it on the next call
+            self._checked = 0.0
+
+    def evaluate(self, application):
+        """Decision dict for one application (see APPLICATION_FIELDS)."""
+        self._maybe_reload()
+        t0 = time.perf_counter()
+        rule, decision = self._evaluate(application)
+        EVAL_SECONDS.observe(time.perf_counter() - t0, mode="single")
+        RULE_HITS.inc(rule=rule or "none")
+        return decision
+
+    def evaluate_batch(self, applications):
+        """Decisions for many applications with one rule-set lookup; one latency sample per batch."""
+        self._maybe_reload()
+        evaluate = self._evaluate
+        t0 = time.perf_counter()
+        results = [evaluate(a) for a in applications]
+        EVAL_SECONDS.observe(time.perf_counter() - t0, mode="batch")
+        for rule, n in _count(r for r, _ in results).items():
+            RULE_HITS.inc(n, rule=rule or "none")
+        return [d for _, d in results]
+
+
+def _count(items):
+    counts = {}
+    for item in items:
+        counts[item] = counts.get(item, 0) + 1
+    return counts
+
+
+underwriting_rules = RuleEngine()
+
+
+def interest_rate():
+    """Annual interest rate (% p.a.) for every quote, letter and decision."""
+    return underwriting_rules.param("interest_rate")
+
+
+# ----------------------------------------------------------
+# CLI
+# ----------------------------------------------------------
+def _reference_decision(a, rate=12):
+    """The hardcoded branches underwriting_agent used before the rule table."""
+    from agents import calculate_emi
+
+    score, limit, loan_amount, monthly_salary, tenure_months = (a[f] for f in APPLICATION_FIELDS)
+    if score < 700:
+        return {"status": "HARD_REJECT",
+                "reason": f"Low credit score ({score}). We need a minimum score of 700 for loan approval."}
+    if loan_amount > 2 * limit:
+        return {"status": "SOFT_REJECT", "fallback_offer": limit,
+                "reason": "Requested amount exceeds 2x your eligibility limit",
+                "persuasion": f"I understand you need ₹{loan_amount}, but based on your profile, I can offer you ₹{limit} instantly. This can still help with your immediate needs, and we can increase your limit after 6 months of good repayment!"}
+    if loan_amount <= limit:
+        return {"status": "APPROVED", "new_emi": calculate_emi(loan_amount, rate, tenure_months),
+                "interest_rate": rate, "details": "Approved within pre-approved limit"}
+    if monthly_salary == None:   # noqa: E711 - as written in the original
+        return {"status": "NEEDS_DOCS", "reason": "Upload salary slip for income verification",
+                "message": "Since you're requesting above your instant limit, I'll need to verify your income. Please upload your latest salary slip."}
+    emi = calculate_emi(loan_amount, rate, tenure_months)
+    max_allowed_emi = monthly_salary * 0.5
+    if emi <= max_allowed_emi:
+        return {"status": "APPROVED", "new_emi": emi, "interest_rate": rate, "salary_verified": monthly_salary,
+                "details": f"Approved after income verification. Your salary of ₹{monthly_salary} supports this EMI."}
+    r = rate / 1200
+    if r > 0:
+        max_affordable_amount = int(max_allowed_emi * ((1 + r) ** tenure_months - 1) / (r * (1 + r) ** tenure_months))
+    else:
+        max_affordable_amount = int(max_allowed_emi * tenure_months)
+    max_affordable_amount = min(max_affordable_amount, 2 * limit)
+    return {"status": "SOFT_REJECT", "fallback_offer": max_affordable_amount,
+            "reason": f"EMI (₹{emi}) exceeds 50% of your verified salary (₹{monthly_salary})",
+            "salary_verified": monthly_salary, "max_emi_allowed": max_allowed_emi,
+            "persuasion": f"Based on your salary of ₹{monthly_salary}, I can approve up to ₹{max_affordable_amount} to keep your EMI manageable at ₹{calculate_emi(max_affordable_amount, rate, tenure_months)}. This ensures comfortable repayment!"}
+
+
+def sample_applications():
+    """Grid over every branch and its boundaries."""
+    for score, limit, mult, salary, tenure in itertools.product(
+        (300, 650, 699, 700, 701, 780, 850),
+        (100000, 300000, 500000, 800000),
+        (0.1, 0.5, 0.99, 1.0, 1.01, 1.5, 1.99, 2.0, 2.01, 3.0),
+        (None, 0, 15000, 30000, 60000, 150000, 400000),
+        (1, 6, 12, 24, 36, 60),
+    ):
+        yield {"credit_score": score, "limit": limit, "amount": int(limit * mult), "salary": salary, "tenure": tenure}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Underwriting rule table tools")
+    parser.add_argument("command", choices=["verify", "bench", "show"])
+    parser.add_argument("--rules", default=RULES_FILE)
+    parser.add_argument("--n", type=int, default=200000, help="bench: applications")
+    args = parser.parse_args()
+
+    with open(args.rules, encoding="utf-8") as f:
+        spec = json.load(f)
+    evaluate, params, source = compile_rules(spec)
+    if args.command == "show":
+        print(source)
+        return
+
+    apps = list(sample_applications())
+    if args.command == "verify":   # flat pricing: the reference has a single rate
+        mismatches = 0
+        for a in apps:
+            got, want = evaluate(a)[1], _reference_decision(a, params["interest_rate"])
+            if got != want or list(got) != list(want):
+                mismatches += 1
+                if mismatches <= 5:
+                    print("MISMATCH", a, "\n  rules:    ", got, "\n  reference:", want)
+        print(f"{len(apps)} applications, {mismatches} mismatches ({args.rules}, version {spec.get('version')})")
+        sys.exit(1 if mismatches else 0)
+
+    batch = list(itertools.islice(itertools.cycle(apps), args.n))
+    for name, fn in (("rules", lambda a: evaluate(a)[1]),
+                     ("reference", lambda a: _reference_decision(a, params["interest_rate"]))):
+        t0 = time.perf_counter()
+        for a in batch:
+            fn(a)
+        dt = time.perf_counter() - t0
+        print(f"{name:<10} {dt / len(batch) * 1e6:7.2f} us/application  ({len(batch) / dt:,.0f}/s)")
+    engine = RuleEngine(args.rules)
+    engine.param("interest_rate")   # load outside the timed region
+    t0 = time.perf_counter()
+    engine.evaluate_batch(batch)
+    dt = time.perf_counter() - t0
+    print(f"{'batch':<10} {dt / len(batch) * 1e6:7.2f} us/application  ({len(batch) / dt:,.0f}/s)")
+
+    # risk-based pricing (agents.py): a quote against a flat-rate function call,
+    # then the rules priced through the grid
+    from agents import PricingGrid, quote_rate
+
+    grid = PricingGrid(spec.get("pricing"), params["interest_rate"])
+    base_rate = params["interest_rate"]
+    quotes = [(a["credit_score"], a["amount"], a["tenure"]) for a in batch]
+    print(f"pricing grid: {grid.size} cells")
+    for name, fn in (("flat", lambda score, amount, tenure: base_rate), ("grid", grid.rate), ("quote_rate", quote_rate)):
+        t0 = time.perf_counter()
+        for q in quotes:
+            fn(*q)
+        dt = time.perf_counter() - t0
+        print(f"{name:<10} {dt / len(quotes) * 1e9:7.0f} ns/quote")
+    priced, _, _ = compile_rules(spec, grid.rate)
+    t0 = time.perf_counter()
+    for a in batch:
+        priced(a)
+    dt = time.perf_counter() - t0
+    print(f"{'priced':<10} {dt / len(batch) * 1e6:7.2f} us/application  ({len(batch) / dt:,.0f}/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,25 @@
+import io
 import os
-from langchain_google_genai import ChatGoogleGenerativeAI
 from pypdf import PdfReader  # pip install pypdf
 from typing import BinaryIO
 from dotenv import load_dotenv
 
 load_dotenv()
 
+from llm_gateway import LLMGateway, LLMUnavailable, make_chat_model
+from mock_data import find_salary_in_text
+from payslip_ocr import salary_from_file
+from payslip_prompt import PAYSLIP_PROMPT_TOKENS, estimate_tokens, reduce_payslip_text
+from scheduler import resource
+from telemetry import get_logger, histogram, span
+
+log = get_logger("salary_handling")
+PROMPT_TOKENS = histogram("loanbot_payslip_prompt_tokens", "Estimated tokens of payslip text sent to the LLM",
+                          buckets=(100, 250, 500, 1000, 2000, 4000, 8000, 16000))
+
 # 1. Configure Gemini
 # Make sure GEMINI_API_KEY is set in your environment.
-llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0)
+llm = LLMGateway(make_chat_model(), name="payslip")
 
 def extract_text_from_payslip(file_obj: BinaryIO) -> str:
     """
@@ -24,30 +35,51 @@ def extract_text_from_payslip(file_obj: BinaryIO) -> str:
     return "\n".join(text_chunks)
 
 
-def get_monthly_salary_from_payslip(file_obj: BinaryIO) -> float:
+def build_salary_prompt(payslip_text: str, max_tokens: int = PAYSLIP_PROMPT_TOKENS) -> str:
+    """Salary prompt for a payslip's text, reduced to its pay lines (payslip_prompt.py; max_tokens=0: full text)."""
+    return f"""
+You are given the full text of an employee salary slip.
+From this text, identify the employee's monthly take-home salary (net pay).
+Return ONLY the number, without any currency symbol or extra text.
+If there are multiple months or values, choose the main monthly net salary.
+
+Payslip text:
+\"\"\"{reduce_payslip_text(payslip_text, max_tokens)}\"\"\"
+"""
+
+
+def get_monthly_salary_from_payslip(file_obj: BinaryIO, max_prompt_tokens: int = PAYSLIP_PROMPT_TOKENS) -> float:
     """
     End-point style function:
     - takes uploaded salary slip (file-like object, e.g. from FastAPI UploadFile.file)
     - extracts text
-    - sends text to Gemini 2.5 Flash
+    - sends text to Gemini 2.5 Flash (regex fallback if the LLM gateway is unavailable)
+    - no text layer (photo or scan, see ingest.py): OCR instead of the LLM
     - returns numeric monthly salary (float)
     """
     # Step 1: Extract text
-    payslip_text = extract_text_from_payslip(file_obj)
+    with resource("ocr").slot(), span("payslip.text_extract"):
+        data = file_obj.read()
+        payslip_text = extract_text_from_payslip(io.BytesIO(data))
+        if not payslip_text.strip():
+            with span("ocr.tesseract"):
+                salary, details = salary_from_file(data, "pdf")
+            log.info("payslip.ocr", salary=salary, stage=details["stage"])
+            return float(salary)
 
-    # Step 2: Ask Gemini to return ONLY the numeric salary
-    prompt = f"""
-You are given the full text of an employee salary slip.
-From this text, identify the employee's monthly take-home salary (net pay).
-Return ONLY the number, without any currency symbol or extra text.
-If there are multiple months or values, choose the main monthly net salary.
-
-Payslip text:
-\"\"\"{payslip_text}\"\"\"
-"""
+    # Step 2: Ask Gemini to return ONLY the numeric salary (pay lines only, token-capped)
+    prompt = build_salary_prompt(payslip_text, max_prompt_tokens)
+    tokens = estimate_tokens(prompt)
+    PROMPT_TOKENS.observe(tokens)
+    log.info("payslip.prompt", tokens=tokens, text_tokens=estimate_tokens(payslip_text))
 
     # model = genai.GenerativeModel("gemini-2.5-flash")
-    response = llm.invoke(prompt)
+    try:
+        response = llm.invoke(prompt)
+    except LLMUnavailable as e:
+        # Gemini down / too slow -> deterministic regex heuristics (0.0 => caller asks to re-upload)
+        log.warning("payslip.llm_unavailable", fallback="regex", error=str(e))
+        return float(find_salary_in_text(payslip_text))
 
     # Response text should be something like "53421.50" or "45000"
     raw = (response.text or "").strip()
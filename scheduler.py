@@ -0,0 +1,249 @@
+# scheduler.py
+# Chat turn scheduling and resource limits.
+#
+# TurnScheduler: one turn at a time per session (history / SESSION_STORE are
+# read and written by the turn), at most TURN_CONCURRENCY turns running, and
+# fair across sessions: a session's later messages wait on its own lock, so
+# only one turn per session ever waits for a slot, and slots are handed out
+# FIFO. Too many waiting turns (or waiting too long) -> Overloaded -> HTTP 429.
+#
+# Resource classes (llm, ocr, pdf) cap how many calls of each kind run at once,
+# so a session doing OCR cannot take every worker thread from the others.
+#
+# Limiter is usable from worker threads (acquire) and from the event loop
+# (aacquire) alike; both queue in one FIFO.
+#
+# Limits are per process. With several workers (STATE_BACKEND=sqlite) a turn
+# also holds shared_state.session_lock, so one session's turns stay serial
+# whichever worker they reach.
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+from shared_state import session_lock
+from telemetry import counter, gauge, get_logger, histogram
+
+TURN_CONCURRENCY = int(os.getenv("TURN_CONCURRENCY", "64"))        # turns running at once
+TURN_QUEUE_MAX = int(os.getenv("TURN_QUEUE_MAX", "256"))           # turns waiting, all sessions
+SESSION_QUEUE_MAX = int(os.getenv("SESSION_QUEUE_MAX", "4"))       # running + waiting, per session
+TURN_QUEUE_TIMEOUT = float(os.getenv("TURN_QUEUE_TIMEOUT", "30"))  # max wait for a slot (s)
+
+RESOURCE_LIMITS = {
+    "llm": int(os.getenv("LLM_CONCURRENCY", "16")),
+    "ocr": int(os.getenv("OCR_CONCURRENCY", "2")),    # payslip text extraction / tesseract
+    "pdf": int(os.getenv("PDF_CONCURRENCY", "2")),    # inline letter rendering (DOC_WORKERS=0)
+}
+
+log = get_logger("scheduler")
+IN_USE = gauge("loanbot_resource_in_use", "Slots held per resource class")
+WAITING = gauge("loanbot_resource_waiting", "Callers queued per resource class")
+WAIT_SECONDS = histogram("loanbot_resource_wait_seconds", "Time spent waiting for a resource slot")
+TURNS_QUEUED = gauge("loanbot_turns_queued", "Chat turns waiting for their session or a turn slot")
+TURNS_SHED = counter("loanbot_turns_shed_total", "Chat turns rejected with 429")
+
+
+class Overloaded(Exception):
+    """Turn rejected by load shedding; the API answers 429 with Retry-After."""
+
+    def __init__(self, reason, retry_after=1):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class SlotTimeout(TimeoutError):
+    """No slot of a resource class came free within the caller's timeout (load, not a slow call)."""
+
+
+# ----------------------------------------------------------
+# FIFO limiter (threads + asyncio)
+# ----------------------------------------------------------
+class Limiter:
+    def __init__(self, limit, name=None):
+        self.limit = limit
+        self.name = name
+        self.in_use = 0
+        self._waiters = deque()   # threading.Event | (loop, asyncio.Future)
+        self._lock = threading.Lock()
+
+    def _report(self):
+        if self.name:
+            IN_USE.set(self.in_use, resource=self.name)
+            WAITING.set(len(self._waiters), resource=self.name)
+
+    def _try_acquire(self, waiter):
+        # caller holds the lock; True = slot taken, else waiter is queued
+        if self.in_use < self.limit and not self._waiters:
+            self.in_use += 1
+            self._report()
+            return True
+        self._waiters.append(waiter)
+        self._report()
+        return False
+
+    def _withdraw(self, waiter):
+        """True if waiter was still queued (no slot); False if a slot was already handed to it."""
+        with self._lock:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                return False
+            self._report()
+            return True
+
+    def acquire(self, timeout=None):
+        t0 = time.perf_counter()
+        event = threading.Event()
+        with self._lock:
+            if self._try_acquire(event):
+                return True
+        if not event.wait(timeout) and self._withdraw(event):
+            return False
+        if self.name:
+            WAIT_SECONDS.observe(time.perf_counter() - t0, resource=self.name)
+        return True
+
+    async def aacquire(self, timeout=None):
+        t0 = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        waiter = (loop, loop.create_future())
+        with self._lock:
+            if self._try_acquire(waiter):
+                return True
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter[1]), timeout)
+        except asyncio.TimeoutError:
+            if not self._withdraw(waiter):
+                self.release()   # the slot arrived as we gave up: pass it on
+            return False
+        except asyncio.CancelledError:
+            if not self._withdraw(waiter):
+                self.release()
+            raise
+        if self.name:
+            WAIT_SECONDS.observe(time.perf_counter() - t0, resource=self.name)
+        return True
+
+    def release(self):
+        with self._lock:
+            if self._waiters:
+                # hand the slot straight to the oldest waiter (in_use unchanged)
+                waiter = self._waiters.popleft()
+                self._report()
+            else:
+                self.in_use -= 1
+                self._report()
+                return
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+        else:
+            loop, fut = waiter
+            loop.call_soon_threadsafe(lambda: fut.done() or fut.set_result(True))
+
+    @contextmanager
+    def slot(self, timeout=None):
+        if not self.acquire(timeout):
+            raise SlotTimeout(f"no {self.name or 'limiter'} slot within {timeout}s")
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self, timeout=None):
+        if not await self.aacquire(timeout):
+            raise SlotTimeout(f"no {self.name or 'limiter'} slot within {timeout}s")
+        try:
+            yield
+        finally:
+            self.release()
+
+
+LIMITERS = {name: Limiter(limit, name) for name, limit in RESOURCE_LIMITS.items()}
+
+
+def resource(name):
+    """Limiter for a resource class: `with resource("ocr").slot(): ...`"""
+    return LIMITERS[name]
+
+
+# ----------------------------------------------------------
+# Turn scheduler
+# ----------------------------------------------------------
+class TurnScheduler:
+    def __init__(self, concurrency=TURN_CONCURRENCY, queue_max=TURN_QUEUE_MAX,
+                 session_queue_max=SESSION_QUEUE_MAX, queue_timeout=TURN_QUEUE_TIMEOUT):
+        self.slots = Limiter(concurrency, "turns")
+        self.queue_max = queue_max
+        self.session_queue_max = session_queue_max
+        self.queue_timeout = queue_timeout
+        self.queued = 0
+        self._sessions = {}   # session_id -> [Limiter(1), turns running + waiting]
+        self._lock = threading.Lock()
+
+    def _shed(self, reason, session_id):
+        TURNS_SHED.inc(reason=reason)
+        log.warning("turn.shed", reason=reason, session_id=session_id, queued=self.queued)
+        raise Overloaded(reason)
+
+    def _admit(self, session_id):
+        # caller holds the lock
+        entry = self._sessions.get(session_id)
+        if entry and entry[1] >= self.session_queue_max:
+            self._shed("session_busy", session_id)
+        if self.queued >= self.queue_max:
+            self._shed("queue_full", session_id)
+        return entry
+
+    def check_admission(self, session_id):
+        """Raise Overloaded if a turn for session_id would be shed right now."""
+        with self._lock:
+            self._admit(session_id)
+
+    @asynccontextmanager
+    async def turn(self, session_id):
+        """Hold the session and a turn slot for the body; raises Overloaded instead of queueing past the limits."""
+        with self._lock:
+            entry = self._admit(session_id)
+            if entry is None:
+                entry = self._sessions[session_id] = [Limiter(1), 0]
+            entry[1] += 1
+            self.queued += 1
+            TURNS_QUEUED.set(self.queued)
+
+        waiting, held_session, held_slot = True, False, False
+        shared_lock, held_shared = session_lock(session_id), False
+        deadline = time.monotonic() + self.queue_timeout
+        try:
+            held_session = await entry[0].aacquire(self.queue_timeout)
+            if held_session and shared_lock is not None:
+                held_shared = await shared_lock.acquire(max(0.0, deadline - time.monotonic()))
+            if held_session and (shared_lock is None or held_shared):
+                held_slot = await self.slots.aacquire(max(0.0, deadline - time.monotonic()))
+            if not held_slot:
+                self._shed("queue_timeout", session_id)
+            with self._lock:
+                waiting = False
+                self.queued -= 1
+                TURNS_QUEUED.set(self.queued)
+            yield
+        finally:
+            if held_slot:
+                self.slots.release()
+            if held_shared:
+                shared_lock.release()
+            if held_session:
+                entry[0].release()
+            with self._lock:
+                if waiting:
+                    self.queued -= 1
+                    TURNS_QUEUED.set(self.queued)
+                entry[1] -= 1
+                if entry[1] == 0 and self._sessions.get(session_id) is entry:
+                    del self._sessions[session_id]
+
+
+turn_scheduler = TurnScheduler()
@@ -0,0 +1,274 @@
+# shared_state.py
+# State that every worker process must see, behind one small interface.
+#
+#   STATE_BACKEND=memory  (default) one process: plain dicts, nothing shared
+#   STATE_BACKEND=sqlite  several workers on one host (gunicorn_conf.py): a
+#                         WAL-mode SQLite file (STATE_DB) + flock() locks
+#
+# kv(namespace) is a dict-like store of JSON values with optional per-key TTL;
+# it holds SESSION_STORE, letter jobs, slip status and dedup replies.
+# process_lock(name) / session_lock(session_id) serialize work across workers
+# (a threading.Lock / nothing in memory mode).
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from telemetry import get_logger
+
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_DB = os.getenv("STATE_DB", "shared_state.db")
+LOCK_DIR = os.getenv("STATE_LOCK_DIR", "locks")
+LOCK_STRIPES = 4096   # session locks are striped over this many lock files
+
+SHARED = STATE_BACKEND == "sqlite"
+
+log = get_logger("shared_state")
+
+if STATE_BACKEND not in ("memory", "sqlite"):
+    raise ValueError(f"STATE_BACKEND must be 'memory' or 'sqlite', not {STATE_BACKEND!r}")
+
+
+# ----------------------------------------------------------
+# Key-value stores
+# ----------------------------------------------------------
+_MISSING = object()
+
+
+class _KVBase:
+    """dict-style helpers on top of get / set / delete."""
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        if self.pop(key, _MISSING) is _MISSING:
+            raise KeyError(key)
+
+
+class MemoryKV(_KVBase):
+    def __init__(self, namespace, ttl=None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self._data = {}   # key -> (value, expires_at | None)
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        if entry[1] is not None and entry[1] < time.time():
+            self._data.pop(key, None)
+            return default
+        return entry[0]
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl or self.ttl
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl if ttl else None)
+            self._writes += 1
+            if ttl and self._writes % 1000 == 0:
+                now = time.time()
+                for k in [k for k, (_, exp) in self._data.items() if exp is not None and exp < now]:
+                    del self._data[k]
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        if entry is None or (entry[1] is not None and entry[1] < time.time()):
+            return default
+        return entry[0]
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SqliteKV(_KVBase):
+    _local = threading.local()   # one connection per thread, shared by namespaces
+
+    def __init__(self, namespace, ttl=None, path=STATE_DB):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.path = path
+        self._writes = 0
+
+    def _conn(self):
+        conns = getattr(self._local, "conns", None)
+        if conns is None:
+            conns = self._local.conns = {}
+        conn = conns.get(self.path)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")      # readers never block the writer
+            conn.execute("PRAGMA synchronous=NORMAL")    # state is rebuildable; skip fsync per write
+            conns[self.path] = conn
+        return conn
+
+    def get(self, key, default=None):
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM kv WHERE ns = ? AND key = ?", (self.namespace, key)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return default
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl or self.ttl
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO kv (ns, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (self.namespace, key, json.dumps(value, ensure_ascii=False), time.time() + ttl if ttl else None),
+        )
+        self._writes += 1
+        if ttl and self._writes % 1000 == 0:
+            conn.execute("DELETE FROM kv WHERE ns = ? AND expires_at < ?", (self.namespace, time.time()))
+
+    def pop(self, key, default=None):
+        conn = self._conn()
+        row = conn.execute(
+            "DELETE FROM kv WHERE ns = ? AND key = ? RETURNING value, expires_at", (self.namespace, key)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return default
+        return json.loads(row[0])
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM kv WHERE ns = ? AND key = ?", (self.namespace, key))
+
+    def clear(self):
+        self._conn().execute("DELETE FROM kv WHERE ns = ?", (self.namespace,))
+
+
+def _reset_connections():
+    SqliteKV._local = threading.local()   # a forked worker must not reuse the parent's connections
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_connections)
+
+
+def init_state():
+    """Create the shared tables (sqlite backend); run once before workers start."""
+    if not SHARED:
+        return
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    conn = sqlite3.connect(STATE_DB, timeout=10)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS kv (
+                ns TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL,
+                PRIMARY KEY (ns, key)
+            ) WITHOUT ROWID
+        """)
+        conn.commit()
+    finally:
+        conn.close()
+    log.info("state.ready", backend=STATE_BACKEND, db=STATE_DB)
+
+
+_STORES = {}
+
+
+def kv(namespace, ttl=None):
+    """The process's store for namespace (created on first use)."""
+    store = _STORES.get(namespace)
+    if store is None:
+        store = _STORES.setdefault(namespace, (SqliteKV if SHARED else MemoryKV)(namespace, ttl))
+    return store
+
+
+# ----------------------------------------------------------
+# Cross-process locks
+# ----------------------------------------------------------
+_THREAD_LOCKS = {}
+
+
+def _lock_file(name):
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    return os.open(os.path.join(LOCK_DIR, f"{name}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+
+
+@contextmanager
+def process_lock(name):
+    """Blocking lock on name across threads and (sqlite backend) worker processes."""
+    tlock = _THREAD_LOCKS.setdefault(name, threading.Lock())
+    with tlock:   # flock is per open file, so threads of one process queue here first
+        if not SHARED:
+            yield
+            return
+        import fcntl
+
+        fd = _lock_file(name)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)   # closing drops the flock
+
+
+class SessionLock:
+    """Per-session lock shared by worker processes; awaited by polling a non-blocking flock."""
+
+    POLL = 0.005
+
+    def __init__(self, session_id):
+        stripe = int(hashlib.sha1(session_id.encode("utf-8")).hexdigest(), 16) % LOCK_STRIPES
+        self.name = f"session-{stripe:04d}"
+        self._fd = None
+
+    async def acquire(self, timeout):
+        import fcntl
+
+        deadline = time.monotonic() + timeout
+        fd = _lock_file(self.name)
+        delay = self.POLL
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self._fd = fd
+                return True
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    os.close(fd)
+                    return False
+            except BaseException:
+                os.close(fd)
+                raise
+            try:
+                await asyncio.sleep(delay)
+            except BaseException:
+                os.close(fd)
+                raise
+            delay = min(delay * 2, 0.05)
+
+    def release(self):
+        fd, self._fd = self._fd, None
+        if fd is not None:
+            os.close(fd)
+
+
+def session_lock(session_id):
+    """Cross-process lock for one session, or None when state is not shared."""
+    return SessionLock(session_id) if SHARED else None
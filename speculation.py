@@ -0,0 +1,132 @@
+# speculation.py
+# Speculative underwriting at the confirm_deal step.
+#
+# Once the loan summary card is shown, phone, amount and tenure are known and
+# the only thing left is the user's "yes". GraphExecutor.commit() starts the
+# underwriting decision here in the background and, for an approval,
+# pre-renders the sanction letter into the letter store. The "yes" turn's
+# underwriting_node then takes the decision instead of computing it, and the
+# letter job completes at once.
+#
+# A speculation never waits: it starts only when there is no salary slip or the
+# slip's extraction has finished, and "yes" waits (up to SPECULATE_WAIT) only
+# for a run already in progress; one still queued is cancelled instead.
+#
+# A speculation is used only if it was computed from exactly the inputs the
+# "yes" turn has (phone, amount, tenure, verified salary); anything else - a
+# new amount, "no", a fresh upload - discards it and the turn underwrites as
+# before. Per process: a "yes" that reaches another worker simply misses (the
+# pre-rendered letter is still found on disk).
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from agents import underwriting_agent
+from document_registry import document_registry
+from document_service import document_service
+from mock_data import get_customer_by_phone
+from telemetry import counter, get_logger
+
+SPECULATE = os.getenv("SPECULATE", "1") == "1"
+SPECULATE_WORKERS = int(os.getenv("SPECULATE_WORKERS", "2"))
+SPECULATE_TTL = float(os.getenv("SPECULATE_TTL", "900"))   # seconds a speculation stays usable
+SPECULATE_WAIT = float(os.getenv("SPECULATE_WAIT", "10"))  # max seconds "yes" waits for a running speculation
+
+log = get_logger("speculation")
+SPECULATIONS = counter("loanbot_speculation_total", "Speculative underwriting runs by outcome")
+
+
+class Speculation:
+    def __init__(self, phone, amount, tenure):
+        self.phone = phone
+        self.amount = amount
+        self.tenure = tenure
+        self.created_at = time.monotonic()
+        self.future = None
+
+    def expired(self, ttl):
+        return time.monotonic() - self.created_at > ttl
+
+
+class Speculator:
+    def __init__(self, workers=SPECULATE_WORKERS, ttl=SPECULATE_TTL, enabled=SPECULATE):
+        self.enabled = enabled and workers > 0
+        self.ttl = ttl
+        self._pending = {}   # phone -> Speculation (latest terms shown to that customer)
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="speculate")
+
+    def start(self, phone, amount, tenure):
+        """Begin underwriting phone / amount / tenure in the background (replaces older terms)."""
+        if not self.enabled or not phone or not amount:
+            return None
+        slip = document_registry.get(phone)
+        if slip is not None and slip.status not in ("extracted", "failed"):
+            self.discard(phone)   # extraction still running: "yes" waits for it anyway
+            return None
+        with self._lock:
+            old = self._pending.get(phone)
+            if old and (old.amount, old.tenure) == (amount, tenure) and not old.expired(self.ttl):
+                return old   # same card shown again
+            spec = self._pending[phone] = Speculation(phone, amount, tenure)
+            spec.future = self._pool.submit(self._run, spec)
+        if old:
+            old.future.cancel()
+            SPECULATIONS.inc(outcome="discarded")
+        SPECULATIONS.inc(outcome="started")
+        return spec
+
+    def discard(self, phone):
+        with self._lock:
+            spec = self._pending.pop(phone, None)
+        if spec:
+            spec.future.cancel()
+            SPECULATIONS.inc(outcome="discarded")
+
+    def _run(self, spec):
+        # the inputs underwriting_node will use on the "yes" turn
+        salary = None
+        slip = document_registry.get(spec.phone)
+        if slip is not None:
+            if slip.status != "extracted":
+                return None   # failed (that turn reports it) or re-uploaded since start(): nothing to precompute
+            salary = slip.salary
+        decision = underwriting_agent(spec.phone, spec.amount, monthly_salary=salary, tenure_months=spec.tenure)
+        if decision.get("status") == "APPROVED":
+            # same name _decision_reply puts on the letter (the "yes" turn has no customer_name in state)
+            name = (get_customer_by_phone(spec.phone) or {}).get("name", "Customer")
+            document_service.prerender_sanction_letter(name, spec.phone, spec.amount, decision["new_emi"], spec.tenure,
+                                                       rate=decision.get("interest_rate"))
+        log.info("speculation.ready", phone=spec.phone, amount=spec.amount, tenure=spec.tenure,
+                 status=decision.get("status"))
+        return salary, decision
+
+    def take(self, phone, amount, tenure, salary=None):
+        """
+        The speculative decision for exactly these inputs (waiting for it if it
+        is already running), or None - the caller then underwrites itself.
+        The speculation is consumed either way.
+        """
+        with self._lock:
+            spec = self._pending.pop(phone, None)
+        if spec is None:
+            return None
+        # cancel() only succeeds while it is still queued: underwriting here is quicker than waiting
+        if (spec.amount, spec.tenure) != (amount, tenure) or spec.expired(self.ttl) or spec.future.cancel():
+            spec.future.cancel()
+            SPECULATIONS.inc(outcome="discarded")
+            return None
+        try:
+            result = spec.future.result(timeout=SPECULATE_WAIT)
+        except Exception as e:   # cancelled, timed out or failed: underwrite normally
+            log.warning("speculation.failed", phone=phone, error=repr(e))
+            result = None
+        if result is None or result[0] != salary:
+            SPECULATIONS.inc(outcome="miss")
+            return None
+        SPECULATIONS.inc(outcome="hit")
+        return result[1]
+
+
+speculator = Speculator()
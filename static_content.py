@@ -0,0 +1,106 @@
+# static_content.py
+# Help / offers / health payloads encoded once, served as bytes.
+# Each payload keeps its JSON body, a gzip copy and an ETag; clients that send
+# If-None-Match get a 304 without a body. Help and offers come from
+# static_content.json, re-read when its mtime changes (checked at most every
+# STATIC_RELOAD_INTERVAL seconds, on access) - edit the file, no restart.
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+from fastapi import Request, Response
+
+from telemetry import counter, get_logger
+
+STATIC_CONTENT_FILE = os.getenv("STATIC_CONTENT_FILE", "static_content.json")
+STATIC_RELOAD_INTERVAL = float(os.getenv("STATIC_RELOAD_INTERVAL", "2"))
+
+log = get_logger("static_content")
+SERVED = counter("loanbot_static_responses_total", "Static payload responses by status / encoding")
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match handling (weak comparison, as RFC 9110 asks for GET)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+
+
+class Payload:
+    def __init__(self, data):
+        self.data = data
+        self.body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.gzipped = gzip.compress(self.body, compresslevel=6, mtime=0)
+        digest = hashlib.sha256(self.body).hexdigest()[:32]
+        self.etag = f'"{digest}"'
+        self.gzip_etag = f'"{digest}-gz"'   # different bytes -> different strong ETag
+
+
+class StaticContent:
+    def __init__(self, path=STATIC_CONTENT_FILE, reload_interval=STATIC_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.payloads = {}
+        self._builtin = {}
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def register(self, name, data):
+        """Payload that does not come from the content file (e.g. health)."""
+        self._builtin[name] = Payload(data)
+        self.payloads = {**self.payloads, name: self._builtin[name]}
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked < self.reload_interval:
+            return
+        with self._lock:
+            if now - self._checked < self.reload_interval:
+                return
+            self._checked = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                return   # file gone: keep serving what we have
+            if mtime == self._mtime:
+                return
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    content = json.load(f)
+            except (OSError, ValueError) as e:
+                log.error("static.reload_failed", path=self.path, error=str(e))
+                self._mtime = mtime   # don't re-parse a broken file on every check
+                return
+            self.payloads = {**{k: Payload(v) for k, v in content.items()}, **self._builtin}
+            self._mtime = mtime
+            log.info("static.loaded", path=self.path, payloads=sorted(self.payloads))
+
+    def get(self, name):
+        self._maybe_reload()
+        return self.payloads[name]
+
+    def data(self, name):
+        return self.get(name).data
+
+    def response(self, name, request: Request):
+        p = self.get(name)
+        use_gzip = "gzip" in request.headers.get("accept-encoding", "") and len(p.gzipped) < len(p.body)
+        etag = p.gzip_etag if use_gzip else p.etag
+        # no-cache: clients may keep it but revalidate (cheap 304) since the file can change
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            SERVED.inc(payload=name, status="304")
+            return Response(status_code=304, headers=headers)
+        if use_gzip:
+            headers["Content-Encoding"] = "gzip"
+        SERVED.inc(payload=name, status="200", encoding="gzip" if use_gzip else "identity")
+        return Response(p.gzipped if use_gzip else p.body, media_type="application/json", headers=headers)
+
+
+static_content = StaticContent()
@@ -0,0 +1,42 @@
+# streaming.py
+import json
+import re
+
+# Card tags emitted by master_agent.create_*_card helpers
+_TAG_RE = re.compile(r"\[(LOAN_OFFER|LOAN_SUMMARY|APPROVAL|REJECTION)\](.*?)\[/\1\]", re.DOTALL)
+
+
+# ----------------------------------------------------------
+# Server-Sent Events formatting
+# ----------------------------------------------------------
+def format_sse(event: str, data) -> str:
+    """Encode one SSE frame. `data` is JSON-encoded (one line, so no escaping needed)."""
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+# ----------------------------------------------------------
+# Split a bot reply into text segments and discrete card events
+# ----------------------------------------------------------
+def split_structured_tags(text: str):
+    """
+    "[LOAN_OFFER]{...}[/LOAN_OFFER]\nHello" ->
+        [("loan_offer", {...}), ("message", {"text": "Hello"})]
+    Tags whose payload is not valid JSON are passed through as plain text.
+    """
+    segments = []
+    pos = 0
+    for m in _TAG_RE.finditer(text or ""):
+        before = text[pos:m.start()].strip()
+        if before:
+            segments.append(("message", {"text": before}))
+        try:
+            segments.append((m.group(1).lower(), json.loads(m.group(2))))
+        except ValueError:
+            segments.append(("message", {"text": m.group(0)}))
+        pos = m.end()
+
+    rest = (text or "")[pos:].strip()
+    if rest:
+        segments.append(("message", {"text": rest}))
+    return segments
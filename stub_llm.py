@@ -0,0 +1,76 @@
+# stub_llm.py
+# Deterministic stand-in for the Gemini chat clients, used by benchmarks and
+# offline tooling. No network, configurable latency.
+import asyncio
+import json
+import random
+import re
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from payslip_prompt import estimate_tokens
+
+
+def stub_reply(prompt: str) -> str:
+    """Deterministic reply for the prompts this app sends."""
+    # master_node fallback controller expects JSON
+    if "Return ONLY valid JSON" in prompt:
+        return json.dumps({
+            "assistant_reply": "Is there anything else I can help you with?",
+            "tool": None,
+            "tool_args": None,
+            "next_step": "greet",
+        })
+
+    # payslip extraction expects a bare number
+    if "take-home salary" in prompt:
+        m = re.search(r"net\s*(?:pay|salary)[^\d]{0,30}([\d,]{4,})", prompt, re.IGNORECASE)
+        return m.group(1).replace(",", "") if m else "50000"
+
+    return "Happy to help! Would you like to check our current personal loan offers or apply now?"
+
+
+class StubChatModel(BaseChatModel):
+    latency: float = 0.0   # seconds per call
+    jitter: float = 0.0    # +/- uniform jitter (seconds)
+    per_1k_tokens: float = 0.0   # extra seconds per 1,000 prompt tokens (prefill)
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _delay(self, messages) -> float:
+        delay = self.latency
+        if self.per_1k_tokens:
+            delay += self.per_1k_tokens * estimate_tokens("".join(str(m.content) for m in messages)) / 1000
+        if not self.jitter:
+            return delay
+        return max(0.0, delay + random.uniform(-self.jitter, self.jitter))
+
+    def _reply(self, messages) -> str:
+        return stub_reply(messages[-1].content if messages else "")
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self._delay(messages))
+        message = AIMessage(content=self._reply(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self._delay(messages))
+        message = AIMessage(content=self._reply(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def install_stub_llm(latency: float = 0.0, jitter: float = 0.0, per_1k_tokens: float = 0.0):
+    """Swap the Gemini clients behind the module-level LLM gateways for a StubChatModel."""
+    import master_agent
+    import salary_handling
+
+    stub = StubChatModel(latency=latency, jitter=jitter, per_1k_tokens=per_1k_tokens)
+    # keep the gateways (timeouts / breaker) in the path, swap only the client
+    master_agent.llm.model = stub
+    salary_handling.llm.model = stub
+    return stub
@@ -0,0 +1,298 @@
+# telemetry.py
+# Timing spans, counters and histograms (Prometheus text format on /metrics),
+# a sampling profiler toggle and structured (JSON) logging.
+import asyncio
+import collections
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")   # json | text
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+# ----------------------------------------------------------
+# Structured logging
+# ----------------------------------------------------------
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _TextFormatter(logging.Formatter):
+    def format(self, record):
+        fields = " ".join(f"{k}={v}" for k, v in getattr(record, "fields", {}).items())
+        return f"[{record.levelname}] {record.name}: {record.getMessage()} {fields}".rstrip()
+
+
+_handler = logging.StreamHandler(sys.stdout)
+_handler.setFormatter(_JsonFormatter() if LOG_FORMAT == "json" else _TextFormatter())
+_root = logging.getLogger("loanbot")
+_root.addHandler(_handler)
+_root.setLevel(LOG_LEVEL)
+_root.propagate = False
+
+
+class StructLogger:
+    """log.info("master.step", step="greet", user_said="hi") -> one JSON line."""
+
+    def __init__(self, name):
+        self._log = logging.getLogger(f"loanbot.{name}")
+
+    def _emit(self, level, event, fields, exc_info=False):
+        if self._log.isEnabledFor(level):
+            self._log.log(level, event, extra={"fields": fields}, exc_info=exc_info)
+
+    def debug(self, event, **fields):
+        self._emit(logging.DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        self._emit(logging.INFO, event, fields)
+
+    def warning(self, event, **fields):
+        self._emit(logging.WARNING, event, fields)
+
+    def error(self, event, exc_info=False, **fields):
+        self._emit(logging.ERROR, event, fields, exc_info=exc_info)
+
+
+def get_logger(name):
+    return StructLogger(name)
+
+
+# ----------------------------------------------------------
+# Metrics
+# ----------------------------------------------------------
+def _label_str(labels):
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{str(v)}"' for k, v in sorted(labels.items()))
+    return "{" + inner + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name, self.help = name, help_text
+        self.values = collections.defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.values[key] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, v in sorted(self.values.items()):
+                lines.append(f"{self.name}{_label_str(dict(key))} {v}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.values[key] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name, self.help = name, help_text
+        self.buckets = tuple(buckets)
+        self.series = {}   # label key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            s = self.series.get(key)
+            if s is None:
+                s = self.series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, s in sorted(self.series.items()):
+                labels = dict(key)
+                for i, b in enumerate(self.buckets):
+                    lines.append(f"{self.name}_bucket{_label_str({**labels, 'le': b})} {s[i]}")
+                lines.append(f"{self.name}_bucket{_label_str({**labels, 'le': '+Inf'})} {s[-1]}")
+                lines.append(f"{self.name}_sum{_label_str(labels)} {round(s[-2], 6)}")
+                lines.append(f"{self.name}_count{_label_str(labels)} {s[-1]}")
+        return lines
+
+
+REGISTRY = {}
+
+def counter(name, help_text=""):
+    return REGISTRY.setdefault(name, Counter(name, help_text))
+
+def gauge(name, help_text=""):
+    return REGISTRY.setdefault(name, Gauge(name, help_text))
+
+def histogram(name, help_text="", buckets=DEFAULT_BUCKETS):
+    return REGISTRY.setdefault(name, Histogram(name, help_text, buckets))
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY.values():
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ----------------------------------------------------------
+# Spans
+# ----------------------------------------------------------
+SPAN_SECONDS = histogram("loanbot_span_seconds", "Duration of instrumented operations")
+SPAN_ERRORS = counter("loanbot_span_errors_total", "Instrumented operations that raised")
+NODE_SECONDS = histogram("loanbot_graph_node_seconds", "LangGraph node latency")
+NODE_RUNS = counter("loanbot_graph_node_runs_total", "LangGraph node executions")
+
+_span_log = get_logger("span")
+
+
+@contextmanager
+def span(name, **labels):
+    """Time a block: loanbot_span_seconds{span=name}; errors counted, never swallowed."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        SPAN_ERRORS.inc(span=name, **labels)
+        raise
+    finally:
+        elapsed = time.perf_counter() - t0
+        SPAN_SECONDS.observe(elapsed, span=name, **labels)
+        _span_log.debug("span", span=name, ms=round(elapsed * 1000, 2), **labels)
+
+
+def timed(name):
+    """Decorator form of span() for sync and async functions."""
+    def deco(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def awrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return awrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def instrument_node(name, node):
+    """Wrap a LangGraph node (sync or async) with latency / run-count metrics."""
+    if asyncio.iscoroutinefunction(node):
+        @functools.wraps(node)
+        async def anode(state):
+            t0 = time.perf_counter()
+            try:
+                return await node(state)
+            finally:
+                NODE_SECONDS.observe(time.perf_counter() - t0, node=name)
+                NODE_RUNS.inc(node=name)
+        return anode
+
+    @functools.wraps(node)
+    def snode(state):
+        t0 = time.perf_counter()
+        try:
+            return node(state)
+        finally:
+            NODE_SECONDS.observe(time.perf_counter() - t0, node=name)
+            NODE_RUNS.inc(node=name)
+    return snode
+
+
+# ----------------------------------------------------------
+# Sampling profiler
+# ----------------------------------------------------------
+class SamplingProfiler:
+    """
+    Samples every thread's stack each `interval` seconds and aggregates
+    collapsed stacks ("a;b;c count", flamegraph.pl / speedscope format).
+    """
+
+    def __init__(self, interval=0.01, max_depth=40):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+        self._thread = None
+
+    def reset(self):
+        self.stacks.clear()
+        self.samples = 0
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                parts = []
+                while frame is not None and len(parts) < self.max_depth:
+                    code = frame.f_code
+                    parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(parts))] += 1
+            self.samples += 1
+
+    def collapsed(self, top=None):
+        items = self.stacks.most_common(top)
+        return "\n".join(f"{stack} {count}" for stack, count in items) + "\n"
+
+
+profiler = SamplingProfiler(interval=float(os.getenv("PROFILER_INTERVAL", "0.01")))
+if os.getenv("PROFILER") == "1":
+    profiler.start()
@@ -0,0 +1,27 @@
+# Regression tests for campaign-row pricing in batch_letters (same grid as the chat path).
+#   python -m pytest -q test_batch_letters.py
+from datetime import datetime
+
+import pytest
+
+from agents import calculate_emi, quote_rate
+from batch_letters import _normalize, render_chunk
+
+ROW = {"name": "Amit Sharma", "phone": "9999999991", "amount": "300000", "tenure": "36"}
+
+
+def test_row_without_rate_is_priced_on_the_grid():
+    a = _normalize({**ROW, "credit_score": "720"}, "v1")
+    assert a["rate"] == quote_rate(720, 300000, 36)
+    assert a["emi"] == calculate_emi(300000, a["rate"], 36)
+
+
+def test_explicit_rate_wins():
+    assert _normalize({**ROW, "rate": "11.5", "credit_score": "720"}, "v1")["rate"] == 11.5
+
+
+def test_row_without_rate_or_score_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        _normalize(ROW, "v1")
+    result, = render_chunk([ROW], str(tmp_path), datetime.now())
+    assert result["file"] is None and "credit_score" in result["error"]
@@ -0,0 +1,74 @@
+# Regression tests for the slip registry's record lifecycle (re-uploads, shared store).
+#   python -m pytest -q test_document_registry.py
+import threading
+import time
+
+import pytest
+
+import salary_handling
+from document_registry import DocumentRegistry
+from shared_state import MemoryKV
+
+PHONE = "9876500001"
+
+
+class RecordingKV(MemoryKV):
+    """Shared-store stand-in that keeps every value written."""
+
+    def __init__(self):
+        super().__init__("slip")
+        self.writes = []
+
+    def set(self, key, value, ttl=None):
+        self.writes.append(value)
+        super().set(key, value, ttl)
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    gate = threading.Event()
+
+    def fake_extract(f):
+        salary = int(f.read())
+        if salary == 10000:   # the first upload's extraction is slow
+            gate.wait(5)
+        return salary
+
+    monkeypatch.setattr(salary_handling, "get_monthly_salary_from_payslip", fake_extract)
+    reg = DocumentRegistry(upload_dir=str(tmp_path), workers=1)
+    reg.shared = RecordingKV()
+    reg.gate = gate
+    yield reg
+    gate.set()
+    reg._pool.shutdown(wait=True)
+
+
+def _slip(tmp_path, name, salary):
+    path = tmp_path / name
+    path.write_bytes(str(salary).encode())
+    return str(path)
+
+
+def test_superseded_extraction_publishes_nothing(registry, tmp_path):
+    first = registry.record_upload(PHONE, _slip(tmp_path, "first.pdf", 10000))
+    while first.status != "extracting":
+        time.sleep(0.01)
+    second = registry.record_upload(PHONE, _slip(tmp_path, "second.pdf", 50000))
+    writes_before = len(registry.shared.writes)
+
+    registry.gate.set()
+    first.future.result(timeout=5)
+    assert first.salary == 10000   # it ran, but nobody is told
+    assert registry.salary(PHONE) == 50000
+    assert all(w["uploaded_at"] == second.uploaded_at for w in registry.shared.writes[writes_before:])
+    assert registry.get(PHONE) is second
+
+
+def test_get_ignores_shared_entry_for_older_upload(registry, tmp_path):
+    registry.gate.set()
+    rec = registry.record_upload(PHONE, _slip(tmp_path, "slip.pdf", 50000))
+    rec.future.result(timeout=5)
+    registry.shared.set(PHONE, {"phone": PHONE, "status": "extracted", "salary": 10000, "error": None,
+                                "uploaded_at": rec.uploaded_at - 60, "updated_at": time.time() + 1})
+    assert registry.get(PHONE) is rec
+    assert registry.salary(PHONE) == 50000
@@ -0,0 +1,26 @@
+# Regression tests for the sanction letter written on the fallback "underwrite" -> final_outcome path.
+#   python -m pytest -q test_final_outcome.py
+import master_agent
+
+DECISION = {"status": "APPROVED", "new_emi": 9986.02, "interest_rate": 13.25}
+
+
+def test_underwrite_tool_letter_uses_decision_rate_and_tenure(monkeypatch):
+    letters = []
+    monkeypatch.setattr(master_agent, "underwriting_agent",
+                        lambda phone, amount, monthly_salary=None, tenure_months=12: dict(DECISION))
+    monkeypatch.setattr(master_agent.document_service, "submit_sanction_letter",
+                        lambda *args, **kwargs: letters.append((args, kwargs)) or None)
+    monkeypatch.setattr(master_agent, "document_link", lambda job: "/documents/test")
+
+    state = {"messages": [], "customer_phone": "9999999991", "customer_name": "Test Customer",
+             "loan_amount": 300000, "loan_tenure": 12, "step": "greet"}
+    decision = {"assistant_reply": "Let me check.", "tool": "underwrite",
+                "tool_args": {"phone": "9999999991", "amount": 300000, "tenure": 36}, "next_step": "underwriting"}
+    update = master_agent._apply_fallback_decision(state, decision)
+    assert update["step"] == "final_outcome" and update["loan_tenure"] == 36
+
+    master_agent._final_outcome_reply({**state, **update})
+    (args, kwargs), = letters
+    assert args[2:] == (300000, DECISION["new_emi"], 36)
+    assert kwargs["rate"] == DECISION["interest_rate"]
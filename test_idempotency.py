@@ -0,0 +1,49 @@
+# Regression tests for chat dedup: text-hash retries vs. a message repeated on purpose.
+#   python -m pytest -q test_idempotency.py
+import time
+
+from idempotency import IdempotencyCache
+
+SESSION = "s1"
+BEFORE_UPLOAD = ["salary_slip", 500000, None, None]
+AFTER_UPLOAD = ["salary_slip", 500000, 1792390000.0, "uploaded"]
+
+
+def test_repeated_text_after_upload_runs_again():
+    cache = IdempotencyCache()
+    key = cache.key(SESSION, "uploaded")
+    cache.complete(key, SESSION, "I can't find your salary slip yet.", BEFORE_UPLOAD)
+    assert cache.get(key, BEFORE_UPLOAD) == "I can't find your salary slip yet."   # a retry
+    assert cache.get(key, AFTER_UPLOAD) is None                                       # slip arrived
+    assert cache.get(key, BEFORE_UPLOAD) is None                                      # and the key is gone
+
+
+def test_text_hash_only_covers_the_retry_window():
+    cache = IdempotencyCache(ttl=300, text_ttl=0.05)
+    hashed = cache.key(SESSION, "yes")
+    by_id = cache.key(SESSION, "yes", message_id="m-1")
+    cache.complete(hashed, SESSION, "Done.", BEFORE_UPLOAD)
+    cache.complete(by_id, SESSION, "Done.")
+    time.sleep(0.1)
+    assert cache.get(hashed, BEFORE_UPLOAD) is None
+    assert cache.get(by_id) == "Done."
+
+
+def test_message_id_replies_ignore_session_state():
+    cache = IdempotencyCache()
+    key = cache.key(SESSION, "uploaded", message_id="m-2")
+    cache.complete(key, SESSION, "I can't find your salary slip yet.")
+    assert cache.get(key, AFTER_UPLOAD) == "I can't find your salary slip yet."
+
+
+def test_session_ids_with_colons_stay_apart():
+    cache = IdempotencyCache(max_entries=2)
+    assert cache.key("a:id:b", "hi", message_id="c") != cache.key("a", "hi", message_id="b:id:c")
+
+    first = cache.key("a:b", "yes")
+    cache.complete(first, "a:b", "Reply for a:b", BEFORE_UPLOAD)
+    second = cache.key("a", "yes")
+    cache.complete(second, "a", "Reply for a", BEFORE_UPLOAD)
+    cache.complete(cache.key("x", "yes"), "x", "Reply for x", BEFORE_UPLOAD)   # evicts a:b's entry
+    assert "a:b" not in cache._latest
+    assert cache._latest["a"] == second and cache.get(second, BEFORE_UPLOAD) == "Reply for a"
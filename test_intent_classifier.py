@@ -0,0 +1,37 @@
+# Regression tests for the local intent classifier's rules (registration false positives).
+#   python -m pytest -q test_intent_classifier.py
+import pytest
+
+import master_agent
+from intent_classifier import classify_intent
+
+
+@pytest.mark.parametrize("text", [
+    "i am interested in personal loans",
+    "i am looking for a loan in mumbai",
+    "i'm a teacher from pune",
+    "my name is amit and i need a loan in pune",
+    "my name is 5 lakh from pune",
+])
+def test_ordinary_sentences_are_not_registrations(text):
+    decision = classify_intent(text)
+    assert not (decision["source"] == "rule" and decision["intent"] == "register")
+    assert decision["tool"] != "register"
+
+
+def test_my_name_is_from_city_registers():
+    decision = classify_intent("My name is Amit Sharma from Pune")
+    assert decision["intent"] == "register" and decision["source"] == "rule"
+    assert decision["tool_args"] == {"name": "Amit Sharma", "city": "Pune"}
+
+
+def test_register_tool_skips_known_customer(monkeypatch):
+    def no_register(*args, **kwargs):
+        raise AssertionError("register_agent called for a phone already on file")
+
+    monkeypatch.setattr(master_agent, "register_agent", no_register)
+    state = {"messages": [], "customer_phone": "9999999991", "step": "greet"}
+    decision = {"assistant_reply": "Thanks! Let me register you.", "tool": "register",
+                "tool_args": {"name": "Interested", "city": "Personal Loans"}, "next_step": "sales"}
+    out = master_agent._apply_fallback_decision(state, decision)
+    assert "already registered" in out["messages"][-1].content
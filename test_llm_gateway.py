@@ -0,0 +1,119 @@
+# Regression tests for the LLM gateway's circuit breaker and call path.
+#   python -m pytest -q test_llm_gateway.py
+import asyncio
+import contextvars
+import threading
+import time
+
+import pytest
+
+import llm_gateway
+from llm_gateway import CircuitBreaker, LLMGateway, LLMOverloaded, LLMUnavailable
+from scheduler import Limiter
+
+REQUEST_ID = contextvars.ContextVar("request_id", default=None)
+
+
+class FakeModel:
+    def __init__(self, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.seen_request_ids = []
+
+    def invoke(self, prompt, config=None):
+        self.seen_request_ids.append(REQUEST_ID.get())
+        if self.fail:
+            raise RuntimeError("upstream 500")
+        return "ok"
+
+    async def ainvoke(self, prompt, config=None):
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("upstream 500")
+        return "ok"
+
+
+class BlockingModel:
+    """invoke() runs until released, like an upstream call that outlives its timeout."""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def invoke(self, prompt, config=None):
+        self.release.wait(5)
+        return "late"
+
+
+def _half_open_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_after=0)
+    breaker.record_failure()
+    assert breaker.state == "open"
+    return breaker
+
+
+def test_cancelled_half_open_probe_is_released():
+    breaker = _half_open_breaker()
+    gateway = LLMGateway(FakeModel(delay=10), "test-cancel", timeout=30, deadline=30, retries=0, breaker=breaker)
+
+    async def run():
+        task = asyncio.create_task(gateway.ainvoke("hi"))
+        await asyncio.sleep(0.05)   # probe taken, call in flight
+        assert breaker.state == "half_open" and not breaker.allow()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert breaker.allow()   # the next call may probe again
+
+
+def test_half_open_probe_success_closes_and_failure_reopens():
+    breaker = _half_open_breaker()
+    LLMGateway(FakeModel(), "test-close", retries=0, breaker=breaker).invoke("hi")
+    assert breaker.state == "closed"
+
+    breaker = _half_open_breaker()
+    with pytest.raises(LLMUnavailable):
+        LLMGateway(FakeModel(fail=True), "test-reopen", retries=0, breaker=breaker).invoke("hi")
+    assert breaker.state == "open"
+
+
+def test_sync_call_runs_in_callers_context():
+    model = FakeModel()
+    token = REQUEST_ID.set("req-42")
+    try:
+        LLMGateway(model, "test-context", retries=0).invoke("hi")
+    finally:
+        REQUEST_ID.reset(token)
+    assert model.seen_request_ids == ["req-42"]
+
+
+def test_slot_wait_timeout_is_shed_not_a_failure(monkeypatch):
+    limiter = Limiter(1, "llm-test")
+    assert limiter.acquire()   # every slot taken
+    monkeypatch.setattr(llm_gateway, "resource", lambda name: limiter)
+    breaker = CircuitBreaker(failure_threshold=1)
+    gateway = LLMGateway(FakeModel(), "test-shed", timeout=0.05, retries=2, breaker=breaker)
+
+    with pytest.raises(LLMOverloaded):
+        gateway.invoke("hi")
+    with pytest.raises(LLMOverloaded):
+        asyncio.run(gateway.ainvoke("hi"))
+    assert breaker.state == "closed" and breaker.failures == 0
+    assert gateway.counts["shed"] == 2 and gateway.counts["retries"] == 0
+
+
+def test_timed_out_sync_call_keeps_its_slot_until_it_ends(monkeypatch):
+    limiter = Limiter(1, "llm-test")
+    monkeypatch.setattr(llm_gateway, "resource", lambda name: limiter)
+    model = BlockingModel()
+    gateway = LLMGateway(model, "test-slot", timeout=0.05, retries=0)
+
+    with pytest.raises(LLMUnavailable):
+        gateway.invoke("hi")
+    assert limiter.in_use == 1   # invoke is still running in the pool
+    model.release.set()
+    deadline = time.monotonic() + 5
+    while limiter.in_use and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert limiter.in_use == 0
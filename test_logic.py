@@ -2,21 +2,25 @@
 from agents import underwriting_agent, verification_agent
 
 print("--- Test 1: High Credit Score, Low Amount (Should Approve) ---")
-# Amit (Score 750, Limit 5L). Asking for 1L.
-result = underwriting_agent("9999999991", 100000)
+# Amit (Score 780, Limit 5L). Asking for 1L.
+result = underwriting_agent("9999999991", 100000, monthly_salary=None)
 print(result)
 
 print("\n--- Test 2: Low Credit Score (Should Reject) ---")
-# Priya (Score 650). Asking for anything.
-result = underwriting_agent("9999999992", 50000)
+# Rajesh (Score 650). Asking for anything.
+result = underwriting_agent("9999999994", 50000, monthly_salary=None)
 print(result)
 
 print("\n--- Test 3: High Amount (Needs Salary Slip) ---")
 # Amit (Limit 5L). Asking for 8L (Between 1x and 2x).
 # First try: No slip uploaded
-result = underwriting_agent("9999999991", 800000, salary_slip_uploaded=False)
+result = underwriting_agent("9999999991", 800000, monthly_salary=None)
 print("No Slip:", result)
 
-# Second try: Slip uploaded
-result = underwriting_agent("9999999991", 800000, salary_slip_uploaded=True)
-print("With Slip:", result)
\ No newline at end of file
+# Second try: Slip uploaded (salary read from the slip)
+result = underwriting_agent("9999999991", 800000, monthly_salary=150000)
+print("With Slip:", result)
+
+# Third try: Slip uploaded, EMI above 50% of salary -> counter-offer
+result = underwriting_agent("9999999991", 800000, monthly_salary=60000, tenure_months=12)
+print("Low Salary:", result)
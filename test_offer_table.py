@@ -0,0 +1,14 @@
+# Regression tests for offer_table quotes on the chat path.
+#   python -m pytest -q test_offer_table.py
+import offer_table as offer_table_module
+from offer_table import offer_table
+
+
+def test_quote_never_waits_for_the_bureau(monkeypatch):
+    def score(phone, default=None, wait=True):
+        assert not wait, "quote blocked on a bureau lookup"
+        return None   # cache miss: the record's score is used
+
+    monkeypatch.setattr(offer_table_module.credit_bureau, "score", score)
+    rate, emi = offer_table.quote("9999999991", 300000, 24)
+    assert rate > 0 and emi > 0
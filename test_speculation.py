@@ -0,0 +1,64 @@
+# Regression tests for speculative underwriting: it must never park a worker on a slip or a queue.
+#   python -m pytest -q test_speculation.py
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import speculation
+from speculation import Speculator
+
+DECISION = {"status": "SOFT_REJECT", "fallback_offer": 100000}
+
+
+@pytest.fixture
+def spec_env(monkeypatch):
+    slips = {}
+    gate = threading.Event()
+    gate.set()
+
+    def fake_underwrite(phone, amount, monthly_salary=None, tenure_months=12):
+        gate.wait(5)
+        return dict(DECISION, salary=monthly_salary)
+
+    def no_wait(*args, **kwargs):
+        raise AssertionError("speculation waited for a slip extraction")
+
+    monkeypatch.setattr(speculation, "underwriting_agent", fake_underwrite)
+    monkeypatch.setattr(speculation.document_registry, "get", slips.get)
+    monkeypatch.setattr(speculation.document_registry, "salary", no_wait)
+    speculator = Speculator(workers=1, enabled=True)
+    yield speculator, slips, gate
+    gate.set()
+    speculator._pool.shutdown(wait=True)
+
+
+def test_not_started_while_slip_is_extracting(spec_env):
+    speculator, slips, _ = spec_env
+    slips["9000000001"] = SimpleNamespace(status="extracting", salary=None)
+    assert speculator.start("9000000001", 300000, 12) is None
+    assert speculator.take("9000000001", 300000, 12) is None
+
+
+def test_uses_extracted_salary_without_waiting(spec_env):
+    speculator, slips, _ = spec_env
+    slips["9000000002"] = SimpleNamespace(status="extracted", salary=80000)
+    speculator.start("9000000002", 300000, 12)
+    assert speculator.take("9000000002", 300000, 12, salary=80000)["salary"] == 80000
+
+
+def test_take_does_not_wait_for_a_queued_speculation(spec_env):
+    speculator, _, gate = spec_env
+    gate.clear()
+    running = speculator.start("9000000003", 300000, 12)   # holds the only worker
+    queued = speculator.start("9000000004", 300000, 12)
+    while not running.future.running():
+        time.sleep(0.01)
+
+    t0 = time.monotonic()
+    assert speculator.take("9000000004", 300000, 12) is None
+    assert time.monotonic() - t0 < 1 and queued.future.cancelled()
+
+    gate.set()
+    assert speculator.take("9000000003", 300000, 12)["status"] == "SOFT_REJECT"
@@ -0,0 +1,83 @@
+# Regression tests for /chat/stream token events (GraphExecutor.astream).
+#   python -m pytest -q test_streaming.py
+import asyncio
+from itertools import cycle
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+import master_agent
+
+TOOL_JSON = '{"assistant_reply": "Happy to help with that.", "tool": null, "next_step": "greet"}'
+SMALL_TALK = "Personal loans start at 10.5% for most customers."
+
+
+class FlakyStreamingModel(GenericFakeChatModel):
+    """Streams word by word; the first call drops the connection after a few tokens."""
+
+    calls: int = 0
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        for i, chunk in enumerate(super()._stream(messages, stop, run_manager, **kwargs)):
+            if self.calls == 1 and i == 4:
+                raise ConnectionError("stream reset")
+            yield chunk
+
+
+@pytest.fixture(params=[True, False], ids=["async_graph", "sync_graph"])
+def streaming_llm(request, monkeypatch):
+    monkeypatch.setattr(master_agent, "ASYNC_GRAPH", request.param)
+    monkeypatch.setattr(master_agent.llm, "backoff", 0)
+
+    def use(model):
+        monkeypatch.setattr(master_agent.llm, "model", model)
+        return model
+    return use
+
+
+def _turn(message, session_id, step=None):
+    if step:
+        master_agent.SESSION_STORE[session_id] = {"customer_phone": None, "loan_amount": None, "step": step}
+
+    async def run():
+        return [ev async for ev in master_agent.agent_executor.astream(
+            {"input": message, "chat_history": [], "session_id": session_id})]
+    try:
+        return asyncio.run(run())
+    finally:
+        master_agent.SESSION_STORE.pop(session_id, None)
+
+
+def _preview(events):
+    """The text a client shows before the final reply: tokens since the last token_reset."""
+    text = ""
+    for ev in events:
+        if ev["event"] == "token_reset":
+            text = ""
+        elif ev["event"] == "token":
+            text += ev["data"]["text"]
+    return text
+
+
+def test_small_talk_reply_is_streamed(streaming_llm):
+    streaming_llm(GenericFakeChatModel(messages=cycle([AIMessage(content=SMALL_TALK)])))
+    events = _turn("tell me a joke", "stream-small-talk")
+    assert _preview(events) == SMALL_TALK == events[-1]["data"]["output"]
+
+
+def test_tool_selection_json_is_not_streamed(streaming_llm, monkeypatch):
+    streaming_llm(GenericFakeChatModel(messages=cycle([AIMessage(content=TOOL_JSON)])))
+    monkeypatch.setattr(master_agent, "_local_intent_decision", lambda state, history: None)
+    events = _turn("hmm okay whatever", "stream-fallback", step="done")
+    assert not [ev for ev in events if ev["event"] == "token"]
+    assert events[-1]["data"]["output"] == "Happy to help with that."
+
+
+def test_retried_call_resets_the_preview(streaming_llm):
+    model = streaming_llm(FlakyStreamingModel(messages=cycle([AIMessage(content=SMALL_TALK)])))
+    events = _turn("tell me a joke", "stream-retry")
+    assert model.calls == 2
+    assert any(ev["event"] == "token_reset" for ev in events)
+    assert _preview(events) == SMALL_TALK
@@ -0,0 +1,185 @@
+# verification_checks.py
+# Independent checks run in parallel by the graph's verification stage:
+#
+#   verify_start --+-- check_bureau --+-- verifier (offer card)
+#   (phone number) +-- check_kyc    --+
+#
+# Each branch writes {name: result} into AgentState["verification"]; the join
+# (master_agent.verification_node) runs once all of them are done, so the
+# stage takes as long as the slowest check, not the sum. Whether the phone is
+# a known customer is not a check: the join's offer_table lookup answers it,
+# with the score the bureau branch fetched. A result is
+#   {"status": "pass" | "review" | "fail" | "skipped" | "timeout" | "error", "ms": ..., ...}
+# A check that runs past its timeout (VERIFY_CHECK_TIMEOUT unless registered
+# with its own) reports "timeout" and the turn goes on without it; only a
+# "fail" from a check registered with blocking=True stops verification.
+#
+# Add a check (fraud screening, a KYC provider, ...) with register_check()
+# before master_agent is imported; the graph gets one branch per check.
+#
+#   python verification_checks.py bench --delays 0.2,0.3,0.15
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from credit_bureau import credit_bureau
+from mock_data import get_customer_by_phone
+from telemetry import counter, get_logger, histogram
+
+VERIFY_CHECK_TIMEOUT = float(os.getenv("VERIFY_CHECK_TIMEOUT", "3"))
+VERIFY_CHECK_WORKERS = int(os.getenv("VERIFY_CHECK_WORKERS", "16"))
+
+log = get_logger("verification_checks")
+CHECK_SECONDS = histogram("loanbot_verify_check_seconds", "Verification check latency")
+CHECK_RESULTS = counter("loanbot_verify_checks_total", "Verification check results by status")
+
+# sync checks run here, so a branch can give up on one that hangs
+_POOL = ThreadPoolExecutor(max_workers=VERIFY_CHECK_WORKERS, thread_name_prefix="verify")
+
+
+class Check:
+    def __init__(self, name, fn, afn=None, timeout=None, blocking=False):
+        self.name = name
+        self.fn = fn            # fn(phone) -> result dict (blocking)
+        self.afn = afn          # optional coroutine version for the async graph
+        self.timeout = timeout or VERIFY_CHECK_TIMEOUT
+        self.blocking = blocking
+
+
+CHECKS = {}   # name -> Check, in registration order (= branch order)
+
+
+def register_check(name, fn, afn=None, timeout=None, blocking=False):
+    CHECKS[name] = Check(name, fn, afn, timeout, blocking)
+
+
+def _finish(check, result, t0):
+    elapsed = time.perf_counter() - t0
+    result = {**result, "ms": round(elapsed * 1000, 1)}
+    CHECK_SECONDS.observe(elapsed, check=check.name)
+    CHECK_RESULTS.inc(check=check.name, status=result["status"])
+    if result["status"] in ("timeout", "error"):
+        log.warning("verify.check_incomplete", check=check.name, **result)
+    return result
+
+
+def run_check(name, phone):
+    check = CHECKS[name]
+    t0 = time.perf_counter()
+    try:
+        result = _POOL.submit(check.fn, phone).result(timeout=check.timeout)
+    except TimeoutError:
+        result = {"status": "timeout"}
+    except Exception as e:
+        result = {"status": "error", "error": repr(e)}
+    return _finish(check, result, t0)
+
+
+async def arun_check(name, phone):
+    check = CHECKS[name]
+    t0 = time.perf_counter()
+    try:
+        work = check.afn(phone) if check.afn else asyncio.wrap_future(_POOL.submit(check.fn, phone))
+        result = await asyncio.wait_for(work, check.timeout)
+    except TimeoutError:
+        result = {"status": "timeout"}
+    except Exception as e:
+        result = {"status": "error", "error": repr(e)}
+    return _finish(check, result, t0)
+
+
+def blocking_failures(results):
+    """(name, result) for each failed check that must stop verification."""
+    return [(name, r) for name, r in results.items()
+            if r.get("status") == "fail" and name in CHECKS and CHECKS[name].blocking]
+
+
+# ----------------------------------------------------------
+# Built-in checks
+# ----------------------------------------------------------
+def _bureau_result(report):
+    if report is None:
+        return {"status": "error", "error": "no bureau report"}   # the stored score is used
+    return {"status": "pass", "credit_score": int(report["credit_score"])}
+
+
+def _bureau(phone):
+    if not credit_bureau.enabled:
+        return {"status": "skipped"}
+    return _bureau_result(credit_bureau.report(phone))
+
+
+async def _abureau(phone):
+    if not credit_bureau.enabled:
+        return {"status": "skipped"}
+    await credit_bureau.prefetch(phone)   # pooled async client; the report is cached for later turns
+    return _bureau_result(credit_bureau.report(phone, wait=False))
+
+
+def _kyc(phone):
+    user = get_customer_by_phone(phone)
+    if user is None:
+        return {"status": "skipped"}   # registration collects the details
+    if not (user.get("address") or "").strip():
+        return {"status": "review", "reason": "no address on file"}
+    return {"status": "pass"}
+
+
+register_check("bureau", _bureau, afn=_abureau)
+register_check("kyc", _kyc)
+
+
+# ----------------------------------------------------------
+# CLI
+# ----------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Verification stage latency with synthetic slow checks")
+    parser.add_argument("command", choices=["bench"])
+    parser.add_argument("--delays", default="0.2,0.3,0.15", help="seconds, one synthetic check each")
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--phone", default="9999999991")
+    args = parser.parse_args()
+
+    # register in the module master_agent imports, not in this __main__ copy
+    import verification_checks as checks
+
+    delays = [float(d) for d in args.delays.split(",")]
+    for i, delay in enumerate(delays):
+        async def slow(phone, delay=delay):
+            await asyncio.sleep(delay)
+            return {"status": "pass"}
+        checks.register_check(f"synthetic_{i}", lambda phone, delay=delay: time.sleep(delay) or {"status": "pass"}, afn=slow)
+
+    # the graph is built from CHECKS at import, so import it after registering
+    from langchain_core.messages import HumanMessage
+    from stub_llm import install_stub_llm
+    install_stub_llm(latency=0)
+    from master_agent import async_app_graph
+
+    async def turns():
+        sequential, stage = [], []
+        for _ in range(args.turns):
+            t0 = time.perf_counter()
+            for name in checks.CHECKS:
+                await checks.arun_check(name, args.phone)
+            sequential.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            await async_app_graph.ainvoke({
+                "messages": [HumanMessage(content=args.phone)], "step": "verifying", "customer_phone": None, "customer_name": None,
+                "loan_amount": 0, "loan_tenure": 12, "offered_discount": False, "final_decision": {},
+                "verification": {},
+            })
+            stage.append(time.perf_counter() - t0)
+        return sequential, stage
+
+    sequential, stage = asyncio.run(turns())
+    ms = lambda xs: round(sorted(xs)[len(xs) // 2] * 1000, 1)
+    print(f"checks: {', '.join(checks.CHECKS)} (synthetic delays {delays})")
+    print(f"one after another  p50 {ms(sequential)} ms   (sum of delays {round(sum(delays) * 1000)} ms)")
+    print(f"graph fan-out      p50 {ms(stage)} ms   (slowest delay {round(max(delays) * 1000)} ms)")
+
+
+if __name__ == "__main__":
+    main()
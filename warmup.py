@@ -0,0 +1,84 @@
+# warmup.py
+# Pay first-request costs before a worker takes traffic.
+#
+# prime_caches()  pure data, no threads: intent model, payload encoding,
+#                 customer list, underwriting rules, offer table, regex paths. Safe in the
+#                 gunicorn master before fork (gunicorn_conf.py), so workers
+#                 inherit it (a large offer rebuild uses a process pool that
+#                 is shut down before returning).
+# warmup()        prime_caches() + per-process state: one deterministic graph
+#                 turn (no LLM call), the upload directory scan, the
+#                 shared-state connection and a resident OCR engine (language
+#                 model loaded). Run by each worker at startup.
+import time
+
+import ocr_engine   # noqa: F401  tesserocr must be imported on the main thread; warmup() runs on the startup thread
+from telemetry import get_logger
+
+WARMUP_SESSION = "__warmup__"
+WARMUP_PHONE = "9000000000"   # unregistered: the turn only asks for a name
+
+log = get_logger("warmup")
+
+
+def _timed(steps, name, fn):
+    t0 = time.perf_counter()
+    try:
+        fn()
+    except Exception as e:   # a cold cache is not worth failing startup over
+        log.warning("warmup.step_failed", step=name, error=str(e))
+    steps[name] = round((time.perf_counter() - t0) * 1000, 2)
+
+
+def _parsers():
+    from agents import parse_loan_amount
+    from master_agent import infer_step_from_reply
+
+    parse_loan_amount("I need 5 lakh")
+    infer_step_from_reply("Congratulations! Your loan is approved. Download your sanction letter.")
+
+
+def _static():
+    from static_content import static_content
+
+    for name in ("help", "offers", "health"):
+        static_content.get(name)
+
+
+def prime_caches():
+    from intent_classifier import classify_intent
+    from mock_data import get_customer_by_phone
+    from offer_table import offer_table
+    from rule_engine import interest_rate
+
+    steps = {}
+    _timed(steps, "intent", lambda: classify_intent("I want a personal loan"))
+    _timed(steps, "parsers", _parsers)
+    _timed(steps, "static", _static)
+    _timed(steps, "customers", lambda: get_customer_by_phone(WARMUP_PHONE))
+    _timed(steps, "rules", interest_rate)
+    _timed(steps, "offers", offer_table.rebuild)
+    return steps
+
+
+def _graph_turn():
+    from master_agent import SESSION_STORE, agent_executor
+
+    try:
+        agent_executor.invoke({"input": WARMUP_PHONE, "chat_history": [], "session_id": WARMUP_SESSION})
+    finally:
+        SESSION_STORE.pop(WARMUP_SESSION, None)
+
+
+def warmup():
+    from document_registry import document_registry
+    from shared_state import kv
+
+    t0 = time.perf_counter()
+    steps = prime_caches()
+    _timed(steps, "state", lambda: kv("session").get(WARMUP_SESSION))
+    _timed(steps, "uploads", lambda: document_registry.get(WARMUP_PHONE))
+    _timed(steps, "graph", _graph_turn)
+    _timed(steps, "ocr", ocr_engine.ocr_engine.warm)
+    log.info("warmup.done", ms=round((time.perf_counter() - t0) * 1000, 1), steps=steps)
+    return steps